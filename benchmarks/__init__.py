@@ -0,0 +1,3 @@
+"""
+Benchmarks offline contra un Postgres local con pgvector (ver docs/benchmarks.md).
+"""
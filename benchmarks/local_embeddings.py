@@ -0,0 +1,73 @@
+"""
+Embeddings locales y deterministas para los benchmarks: feature hashing de palabras y trigramas de caracteres.
+
+No se parecen en calidad a los de OpenAI, pero son reproducibles entre máquinas y ejecuciones, no cuestan nada
+y textos que comparten palabras (o partes de palabras, como placas y fechas) quedan cerca por coseno.
+`LocalEmbeddingClient` expone `embeddings.create` con la misma forma que el cliente de OpenAI, así el código de
+la app (compute_text_embedding, PostgresSearcher) se usa sin cambios.
+"""
+
+import hashlib
+import re
+from typing import Optional, Union
+
+import numpy as np
+from openai.types import CreateEmbeddingResponse, Embedding
+from openai.types.create_embedding_response import Usage
+
+LOCAL_EMBED_MODEL = "local-hashing"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Peso de cada trigrama frente al de la palabra completa
+TRIGRAM_WEIGHT = 0.5
+
+
+def features(text: str) -> list[tuple[str, float]]:
+    weighted = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        weighted.append((token, 1.0))
+        padded = f"#{token}#"
+        weighted.extend((padded[start : start + 3], TRIGRAM_WEIGHT) for start in range(len(padded) - 2))
+    return weighted
+
+
+def local_embedding(text: str, dimensions: int) -> list[float]:
+    """Vector normalizado de `dimensions` componentes; el mismo texto da siempre el mismo vector."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in features(text):
+        # blake2b y no hash(): hash() cambia entre procesos (PYTHONHASHSEED)
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        vector[digest % dimensions] += weight if (digest >> 32) & 1 else -weight
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        # pgvector no calcula el coseno de un vector nulo
+        vector[0] = 1.0
+        return vector.tolist()
+    return (vector / norm).tolist()
+
+
+class LocalEmbeddings:
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    async def create(
+        self, *, model: str, input: Union[str, list[str]], dimensions: Optional[int] = None, **kwargs
+    ) -> CreateEmbeddingResponse:
+        texts = [input] if isinstance(input, str) else input
+        return CreateEmbeddingResponse(
+            object="list",
+            model=model,
+            data=[
+                Embedding(
+                    object="embedding", index=index, embedding=local_embedding(text, dimensions or self.dimensions)
+                )
+                for index, text in enumerate(texts)
+            ],
+            usage=Usage(prompt_tokens=0, total_tokens=0),
+        )
+
+
+class LocalEmbeddingClient:
+    """Sustituto de AsyncOpenAI para las llamadas de embeddings."""
+
+    def __init__(self, dimensions: int):
+        self.embeddings = LocalEmbeddings(dimensions)
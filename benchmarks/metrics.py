@@ -0,0 +1,53 @@
+"""
+Métricas comunes de los benchmarks.
+"""
+
+from collections.abc import Sequence
+
+import numpy as np
+
+
+def recall_at_k(retrieved: Sequence, relevant: Sequence, k: int) -> float:
+    """
+    Fracción de los relevantes que aparecen entre los k primeros recuperados. Si hay más de k relevantes
+    se divide por k, para que 1.0 siga siendo alcanzable.
+    """
+    expected = set(relevant)
+    if not expected or k <= 0:
+        return 0.0
+    return len(expected.intersection(list(retrieved)[:k])) / min(len(expected), k)
+
+
+def reciprocal_rank(retrieved: Sequence, relevant: Sequence, k: int) -> float:
+    """1 / posición del primer relevante entre los k primeros (0 si no hay ninguno). Su media es el MRR."""
+    expected = set(relevant)
+    for position, item in enumerate(list(retrieved)[:k], start=1):
+        if item in expected:
+            return 1 / position
+    return 0.0
+
+
+def ndcg_at_k(retrieved: Sequence, relevant: Sequence, k: int) -> float:
+    """nDCG@k con relevancia binaria: cuánto se acerca el orden recuperado a tener todos los relevantes primero."""
+    expected = set(relevant)
+    dcg = sum(
+        1 / np.log2(position + 1) for position, item in enumerate(list(retrieved)[:k], start=1) if item in expected
+    )
+    ideal = sum(1 / np.log2(position + 1) for position in range(1, min(len(expected), k) + 1))
+    return float(dcg / ideal) if ideal else 0.0
+
+
+def latency_summary(latencies_ms: Sequence[float]) -> dict[str, float]:
+    """p50/p95/p99, media y máximo de una lista de latencias en milisegundos."""
+    if not latencies_ms:
+        return {"count": 0}
+    values = np.asarray(latencies_ms, dtype=float)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(values.max()), 2),
+    }
@@ -0,0 +1,212 @@
+"""
+Servidor local compatible con la API de OpenAI, para medir la app sin depender de la latencia (ni del costo)
+del servicio real.
+
+Responde chat completions (con tool calls cuando la petición trae `tools`, y en streaming con `stream=True`)
+y embeddings (los de `local_embeddings`, así las búsquedas contra el dataset de benchmark tienen sentido).
+La latencia de cada llamada es la configurada multiplicada por un factor lognormal de mediana 1 (`--jitter` es
+su sigma), y el streaming emite los tokens a `--tokens-per-second`. Acepta tanto las rutas de OpenAI (`/v1/...`)
+como las de Azure OpenAI (`/openai/deployments/<deployment>/...`).
+
+    python -m benchmarks.openai_stub --port 8081 --chat-latency 400 --embed-latency 60 --jitter 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+import uuid
+from collections.abc import AsyncGenerator
+from typing import Any, Optional
+
+import fastapi
+from fastapi.responses import StreamingResponse
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pydantic import BaseModel
+
+from benchmarks.local_embeddings import LocalEmbeddings
+
+PLATE_PATTERN = re.compile(r"\b[A-Z]{3}\d[A-Z0-9]\d{2}\b")
+ANSWER_WORDS = (
+    "Según los registros de abastecimiento [doc1], el vehículo cargó diesel con una eficiencia dentro de lo "
+    "esperado para su tipo, y el costo total [doc2] se mantuvo cerca del promedio de la flota en el período."
+).split()
+
+
+class StubSettings(BaseModel):
+    # Latencia mediana (ms) hasta la respuesta completa, o hasta el primer token en streaming
+    chat_latency_ms: float = 400.0
+    embed_latency_ms: float = 60.0
+    # Sigma del factor lognormal aplicado a cada latencia (0 = sin variación)
+    jitter: float = 0.3
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 120
+    embed_dimensions: int = 1024
+    seed: Optional[int] = None
+
+
+def answer_tokens(count: int) -> list[str]:
+    return [f"{ANSWER_WORDS[index % len(ANSWER_WORDS)]} " for index in range(count)]
+
+
+def search_arguments(messages: list[dict[str, Any]]) -> dict[str, Any]:
+    """Reescritura determinista: la última pregunta como consulta y, si nombra una placa, el filtro por placa."""
+    question = next((message["content"] for message in reversed(messages) if message.get("role") == "user"), "")
+    arguments: dict[str, Any] = {"search_query": question}
+    if plate := PLATE_PATTERN.search(question):
+        arguments["placa_filter"] = plate.group()
+    return arguments
+
+
+class OpenAIStub:
+    def __init__(self, settings: StubSettings):
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.embeddings = LocalEmbeddings(settings.embed_dimensions)
+
+    async def delay(self, median_ms: float) -> None:
+        if median_ms > 0:
+            await asyncio.sleep(median_ms * math.exp(self.random.gauss(0, self.settings.jitter)) / 1000)
+
+    def completion(self, model: str, message: dict[str, Any], finish_reason: str) -> ChatCompletion:
+        return ChatCompletion.model_validate(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        )
+
+    async def chat(self, body: dict[str, Any]) -> ChatCompletion:
+        await self.delay(self.settings.chat_latency_ms)
+        model = body.get("model", "stub")
+        if body.get("tools") and body.get("tool_choice") != "none":
+            tool_call = {
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {
+                    "name": body["tools"][0]["function"]["name"],
+                    "arguments": json.dumps(search_arguments(body["messages"]), ensure_ascii=False),
+                },
+            }
+            return self.completion(model, {"role": "assistant", "tool_calls": [tool_call]}, "tool_calls")
+        content = "".join(answer_tokens(self.settings.answer_tokens)).strip()
+        return self.completion(model, {"role": "assistant", "content": content}, "stop")
+
+    async def chat_stream(self, body: dict[str, Any]) -> AsyncGenerator[str, None]:
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(delta: dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            event = ChatCompletionChunk.model_validate(
+                {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+            )
+            return f"data: {event.model_dump_json(exclude_unset=True)}\n\n"
+
+        await self.delay(self.settings.chat_latency_ms)
+        yield chunk({"role": "assistant", "content": ""})
+        interval = 1 / self.settings.tokens_per_second if self.settings.tokens_per_second > 0 else 0
+        # Cada token sale en su momento (no tras el anterior), así la tasa no se degrada por la sobrecarga del loop
+        started_at = time.perf_counter()
+        for index, token in enumerate(answer_tokens(self.settings.answer_tokens)):
+            await asyncio.sleep(max(0.0, started_at + index * interval - time.perf_counter()))
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+
+def create_stub_app(settings: StubSettings) -> fastapi.FastAPI:
+    stub = OpenAIStub(settings)
+    app = fastapi.FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    async def chat_completions(request: fastapi.Request):
+        body = await request.json()
+        if body.get("stream"):
+            return StreamingResponse(stub.chat_stream(body), media_type="text/event-stream")
+        return await stub.chat(body)
+
+    async def embeddings(request: fastapi.Request):
+        body = await request.json()
+        await stub.delay(settings.embed_latency_ms)
+        return await stub.embeddings.create(
+            model=body.get("model", "stub"), input=body["input"], dimensions=body.get("dimensions")
+        )
+
+    for prefix in ("/v1", "/openai/deployments/{deployment}"):
+        app.add_api_route(f"{prefix}/chat/completions", chat_completions, methods=["POST"])
+        app.add_api_route(f"{prefix}/embeddings", embeddings, methods=["POST"])
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--chat-latency", type=float, default=400.0, help="Median ms until the answer or first token")
+    parser.add_argument("--embed-latency", type=float, default=60.0, help="Median ms of an embeddings call")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Sigma of the lognormal latency factor")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Streaming rate of the answer")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Tokens in each answer")
+    parser.add_argument("--embed-dimensions", type=int, default=1024, help="Dimensions when the call sets none")
+    parser.add_argument("--seed", type=int, help="Seed of the latency jitter")
+
+
+def stub_settings_from_args(args: argparse.Namespace) -> StubSettings:
+    return StubSettings(
+        chat_latency_ms=args.chat_latency,
+        embed_latency_ms=args.embed_latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        embed_dimensions=args.embed_dimensions,
+        seed=args.seed,
+    )
+
+
+def stub_command(settings: StubSettings, port: int) -> list[str]:
+    """Línea de comandos para levantar el stub con `settings` en otro proceso."""
+    return [
+        sys.executable,
+        "-m",
+        "benchmarks.openai_stub",
+        "--port",
+        str(port),
+        "--chat-latency",
+        str(settings.chat_latency_ms),
+        "--embed-latency",
+        str(settings.embed_latency_ms),
+        "--jitter",
+        str(settings.jitter),
+        "--tokens-per-second",
+        str(settings.tokens_per_second),
+        "--answer-tokens",
+        str(settings.answer_tokens),
+        "--embed-dimensions",
+        str(settings.embed_dimensions),
+        *(["--seed", str(settings.seed)] if settings.seed is not None else []),
+    ]
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible server with configurable latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(stub_settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,331 @@
+"""
+Benchmark de recuperación: calidad y latencia de PostgresSearcher.search_and_embed en cada modo, sin LLM.
+
+Carga el dataset fijo de `fixtures/retrieval` (veiculos y abastecimento en formato de semilla) en una base de
+benchmark, con vectores de `local_embeddings` (deterministas, sin API), y pasa cada consulta etiquetada de
+`queries.jsonl` por los modos text, vectors y hybrid. Informa recall@k, MRR y nDCG@k (global y por categoría
+de consulta) y la distribución de latencias, y guarda todo en JSON para comparar entre commits:
+
+    python -m benchmarks.retrieval_bench
+    python -m benchmarks.retrieval_bench --compare benchmarks/results/retrieval_4356603.json
+
+Las filas relevantes se identifican como `<placa>@<fecha>` (única en el dataset).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from benchmarks.local_embeddings import LOCAL_EMBED_MODEL, LocalEmbeddingClient, local_embedding
+from benchmarks.metrics import latency_summary, ndcg_at_k, recall_at_k, reciprocal_rank
+from fastapi_app.api_models import RetrievalMode
+from fastapi_app.dependencies import create_async_sessionmaker
+from fastapi_app.embeddings import embedding_model_tag, text_hash
+from fastapi_app.postgres_engine import create_postgres_engine
+from fastapi_app.postgres_models import Abastecimento, Veiculo
+from fastapi_app.postgres_searcher import PostgresSearcher
+from fastapi_app.setup_postgres_database import create_db_schema
+from fastapi_app.setup_postgres_seeddata import (
+    SEED_TABLES,
+    SeedFileWriter,
+    read_seed_chunks,
+    rows_path,
+    seed_columns,
+    seed_table,
+)
+
+logger = logging.getLogger("ragapp")
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures" / "retrieval"
+RESULTS_DIR = Path(__file__).parent / "results"
+BENCH_DATABASE = "rag_benchmark"
+# TIMESERIES no ordena filas (agrega la serie), no tiene sentido medirlo con métricas de ranking
+SEARCH_MODES = (RetrievalMode.TEXT, RetrievalMode.VECTORS, RetrievalMode.HYBRID)
+QUALITY_METRICS = ("recall", "mrr", "ndcg")
+MODELS = {Veiculo.__tablename__: Veiculo, Abastecimento.__tablename__: Abastecimento}
+
+
+class LabeledQuery(BaseModel):
+    id: str
+    category: str
+    query: str
+    # Claves `<placa>@<fecha>` de las filas de abastecimento que deberían recuperarse
+    relevant: list[str]
+    filters: Optional[list[dict]] = None
+
+
+def load_queries(path: Path) -> list[LabeledQuery]:
+    with open(path, encoding="utf-8") as f:
+        return [LabeledQuery.model_validate_json(line) for line in f if line.strip()]
+
+
+def record_key(row: Abastecimento) -> str:
+    return f"{row.placa}@{row.data.isoformat()}"
+
+
+def fixture_digest(directory: Path) -> str:
+    """Hash del dataset y las consultas: dos informes solo son comparables si coincide."""
+    digest = hashlib.sha256()
+    for path in sorted(directory.glob("*.jsonl")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def embed_fixture(fixture_dir: Path, seed_dir: Path) -> None:
+    """Escribe en `seed_dir` la semilla del dataset con los `.npy` de embeddings locales de cada columna."""
+    for table in SEED_TABLES:
+        model = MODELS[table.name]
+        _, vector_columns = seed_columns(table)
+        with open(rows_path(fixture_dir, table), encoding="utf-8") as f:
+            row_count = sum(1 for line in f if line.strip())
+        writer = SeedFileWriter(seed_dir, table, row_count, dtype="float32")
+        try:
+            for names, rows in read_seed_chunks(fixture_dir, table):
+                records = []
+                for row in rows:
+                    record = dict(zip(names, row))
+                    embedding_text = model(**record).to_str_for_embedding()
+                    vectors = []
+                    for column in vector_columns:
+                        record[f"{column.name}_text_hash"] = text_hash(embedding_text)
+                        record[f"{column.name}_model"] = embedding_model_tag(LOCAL_EMBED_MODEL, column.type.dim)
+                        vectors.append(local_embedding(embedding_text, column.type.dim))
+                    records.append((*(record[name] for name in names), *vectors))
+                writer.write(records)
+        finally:
+            writer.close()
+
+
+async def create_bench_engine(database: str) -> AsyncEngine:
+    """Engine a la base de benchmark en el servidor de POSTGRES_HOST; la crea si no existe."""
+    if database == os.environ["POSTGRES_DATABASE"]:
+        raise ValueError(f"Refusing to load the fixture into the app database {database}, use another --database")
+    connection_args: dict[str, Any] = {
+        "host": os.environ["POSTGRES_HOST"],
+        "username": os.environ["POSTGRES_USERNAME"],
+        "password": os.environ.get("POSTGRES_PASSWORD"),
+        "sslmode": os.environ.get("POSTGRES_SSL"),
+        "azure_credential": None,
+    }
+    admin_engine = await create_postgres_engine(database=os.environ["POSTGRES_DATABASE"], **connection_args)
+    try:
+        async with admin_engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            result = await conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": database})
+            if result.scalar() is None:
+                logger.info("Creating the benchmark database %s", database)
+                await conn.execute(text(f'CREATE DATABASE "{database}"'))
+    finally:
+        await admin_engine.dispose()
+    return await create_postgres_engine(database=database, **connection_args)
+
+
+async def load_fixture(engine: AsyncEngine, fixture_dir: Path) -> None:
+    await create_db_schema(engine)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {', '.join(table.name for table in SEED_TABLES)}"))
+    with tempfile.TemporaryDirectory() as seed_dir:
+        embed_fixture(fixture_dir, Path(seed_dir))
+        for table in SEED_TABLES:
+            inserted = await seed_table(engine, Path(seed_dir), table)
+            logger.info("Loaded %d fixture rows into %s", inserted, table.name)
+
+
+async def run_mode(
+    sessionmaker: async_sessionmaker[AsyncSession],
+    queries: list[LabeledQuery],
+    mode: RetrievalMode,
+    embedding_column: str,
+    k: int,
+    repeat: int,
+) -> dict[str, Any]:
+    """Corre todas las consultas en un modo: una pasada de calentamiento y `repeat` pasadas medidas."""
+    dimensions = Abastecimento.__table__.c[embedding_column].type.dim
+    embed_client: Any = LocalEmbeddingClient(dimensions)
+    retrieved: dict[str, list[str]] = {}
+    latencies: dict[str, list[float]] = {query.id: [] for query in queries}
+    for run in range(repeat + 1):
+        for query in queries:
+            async with sessionmaker() as session:
+                searcher = PostgresSearcher(
+                    db_session=session,
+                    openai_embed_client=embed_client,
+                    embed_deployment=None,
+                    embed_model=LOCAL_EMBED_MODEL,
+                    embed_dimensions=dimensions,
+                    embedding_column=embedding_column,
+                )
+                started_at = time.perf_counter()
+                rows = await searcher.search_and_embed(
+                    query.query,
+                    top=k,
+                    enable_vector_search=mode in (RetrievalMode.VECTORS, RetrievalMode.HYBRID),
+                    enable_text_search=mode in (RetrievalMode.TEXT, RetrievalMode.HYBRID),
+                    filters=query.filters,
+                )
+                elapsed_ms = (time.perf_counter() - started_at) * 1000
+            if run > 0:
+                latencies[query.id].append(elapsed_ms)
+            retrieved[query.id] = [record_key(row) for row in rows]
+
+    per_query = []
+    for query in queries:
+        per_query.append(
+            {
+                "id": query.id,
+                "category": query.category,
+                "recall": round(recall_at_k(retrieved[query.id], query.relevant, k), 4),
+                "mrr": round(reciprocal_rank(retrieved[query.id], query.relevant, k), 4),
+                "ndcg": round(ndcg_at_k(retrieved[query.id], query.relevant, k), 4),
+                "p50_ms": latency_summary(latencies[query.id]).get("p50"),
+                "retrieved": retrieved[query.id],
+            }
+        )
+    categories = sorted({query.category for query in queries})
+    return {
+        **mean_metrics(per_query),
+        "by_category": {
+            category: mean_metrics([result for result in per_query if result["category"] == category])
+            for category in categories
+        },
+        "latency_ms": latency_summary([value for values in latencies.values() for value in values]),
+        "queries": per_query,
+    }
+
+
+def mean_metrics(results: list[dict[str, Any]]) -> dict[str, float]:
+    return {metric: round(float(np.mean([result[metric] for result in results])), 4) for metric in QUALITY_METRICS}
+
+
+def compare_reports(baseline: dict[str, Any], current: dict[str, Any], tolerance: float) -> list[str]:
+    """Imprime las diferencias por modo y devuelve las métricas de calidad que bajaron más que `tolerance`."""
+    for field in ("fixture", "k", "embedding_column"):
+        if baseline["metadata"].get(field) != current["metadata"].get(field):
+            logger.warning(
+                "Reports differ in %s (%s vs %s), the comparison may not be meaningful",
+                field,
+                baseline["metadata"].get(field),
+                current["metadata"].get(field),
+            )
+    regressions = []
+    print(f"{'mode':<10} {'metric':<10} {'baseline':>10} {'current':>10} {'delta':>10}")
+    for mode, result in current["modes"].items():
+        before = baseline["modes"].get(mode)
+        if before is None:
+            continue
+        for metric in QUALITY_METRICS:
+            delta = result[metric] - before[metric]
+            print(f"{mode:<10} {metric:<10} {before[metric]:>10.4f} {result[metric]:>10.4f} {delta:>+10.4f}")
+            if delta < -tolerance:
+                regressions.append(f"{mode} {metric} dropped from {before[metric]:.4f} to {result[metric]:.4f}")
+        for percentile in ("p50", "p95"):
+            old, new = before["latency_ms"][percentile], result["latency_ms"][percentile]
+            print(f"{mode:<10} {percentile + '_ms':<10} {old:>10.2f} {new:>10.2f} {new - old:>+10.2f}")
+    return regressions
+
+
+def print_report(report: dict[str, Any]) -> None:
+    k = report["metadata"]["k"]
+    print(f"{'mode':<10} {'recall@' + str(k):>10} {'mrr':>10} {'ndcg@' + str(k):>10} {'p50_ms':>10} {'p95_ms':>10}")
+    for mode, result in report["modes"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{mode:<10} {result['recall']:>10.4f} {result['mrr']:>10.4f} {result['ndcg']:>10.4f} "
+            f"{latency['p50']:>10.2f} {latency['p95']:>10.2f}"
+        )
+
+
+async def main(args: argparse.Namespace) -> list[str]:
+    queries = load_queries(args.fixtures / "queries.jsonl")
+    engine = await create_bench_engine(args.database)
+    try:
+        if not args.skip_load:
+            await load_fixture(engine, args.fixtures)
+        async with engine.connect() as conn:
+            postgres_version = (await conn.execute(text("SHOW server_version"))).scalar_one()
+        sessionmaker = await create_async_sessionmaker(engine)
+        modes = {}
+        for mode in args.modes:
+            logger.info("Running %d queries in %s mode", len(queries), mode.value)
+            modes[mode.value] = await run_mode(sessionmaker, queries, mode, args.embedding_column, args.k, args.repeat)
+    finally:
+        await engine.dispose()
+
+    commit = git_commit()
+    report = {
+        "metadata": {
+            "commit": commit,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "fixture": fixture_digest(args.fixtures),
+            "queries": len(queries),
+            "k": args.k,
+            "repeat": args.repeat,
+            "embedding_column": args.embedding_column,
+            "postgres": postgres_version,
+        },
+        "modes": modes,
+    }
+    print_report(report)
+    output = args.output or RESULTS_DIR / f"retrieval_{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    logger.info("Report written to %s", output)
+
+    if args.compare is None:
+        return []
+    regressions = compare_reports(json.loads(args.compare.read_text()), report, args.tolerance)
+    for regression in regressions:
+        logger.error("Regression: %s", regression)
+    return regressions
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Measure retrieval quality and latency for each retrieval mode")
+    parser.add_argument("--database", default=BENCH_DATABASE, help="Database for the fixture (created if missing)")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_DIR, help="Dataset and labeled queries")
+    parser.add_argument("--skip-load", action="store_true", help="Reuse the fixture already loaded in the database")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    parser.add_argument("--repeat", type=int, default=5, help="Measured passes over the queries")
+    parser.add_argument("--embedding-column", choices=["embedding_main", "embedding_alt"], default="embedding_main")
+    parser.add_argument(
+        "--modes",
+        type=RetrievalMode,
+        nargs="+",
+        default=list(SEARCH_MODES),
+        choices=list(SEARCH_MODES),
+        metavar="MODE",
+        help=f"Retrieval modes to run ({', '.join(mode.value for mode in SEARCH_MODES)})",
+    )
+    parser.add_argument("--output", type=Path, help="JSON report (default: benchmarks/results/retrieval_<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="Baseline report; exits with 1 if a quality metric drops")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="Allowed drop of a quality metric")
+    sys.exit(1 if asyncio.run(main(parser.parse_args())) else 0)
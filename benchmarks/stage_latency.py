@@ -0,0 +1,319 @@
+"""
+Latencia de /chat/stream por etapa y en función de la concurrencia, contra un OpenAI local.
+
+Levanta `openai_stub` (latencia y tasa de tokens configurables) y la app apuntada a él y a la base de benchmark
+(con el dataset de `retrieval_bench`), y para cada nivel de concurrencia envía `--requests` preguntas con
+otros tantos clientes en paralelo. Por etapa informa p50/p95/p99:
+
+* rewrite, embed y search: duraciones medidas en el servidor (props de los ThoughtStep del stream);
+* first_token y last_token: desde que el cliente envía la pregunta hasta el primer y el último token.
+
+Y por nivel, el throughput (respuestas y tokens por segundo), que con el TTFT da las curvas contra concurrencia.
+
+    python -m benchmarks.stage_latency --concurrency 1,4,16,32 --requests 100
+    python -m benchmarks.stage_latency --app-url http://localhost:8000 --concurrency 1,8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from benchmarks.metrics import latency_summary
+from benchmarks.openai_stub import StubSettings, add_stub_arguments, stub_command, stub_settings_from_args
+from benchmarks.retrieval_bench import (
+    BENCH_DATABASE,
+    FIXTURE_DIR,
+    RESULTS_DIR,
+    create_bench_engine,
+    git_commit,
+    load_fixture,
+    load_queries,
+)
+from benchmarks.vector_index_sweep import int_list
+
+logger = logging.getLogger("ragapp")
+
+BACKEND_DIR = Path(__file__).parents[1] / "src" / "backend"
+STAGES = ("rewrite", "embed", "search", "first_token", "last_token")
+STARTUP_TIMEOUT = 120.0
+
+
+class RequestTiming(BaseModel):
+    rewrite: Optional[float] = None
+    embed: Optional[float] = None
+    search: Optional[float] = None
+    first_token: Optional[float] = None
+    last_token: Optional[float] = None
+    tokens: int = 0
+    error: Optional[str] = None
+
+
+def chat_request_body(question: str, advanced: bool, retrieval_mode: str) -> dict[str, Any]:
+    return {
+        "messages": [{"content": question, "role": "user"}],
+        "context": {
+            "overrides": {"use_advanced_flow": advanced, "top": 3, "retrieval_mode": retrieval_mode, "temperature": 0.3}
+        },
+    }
+
+
+def record_event(timing: RequestTiming, event: dict[str, Any], elapsed_ms: float) -> None:
+    """Actualiza los tiempos de una petición con un evento del stream NDJSON, recibido `elapsed_ms` tras enviarla."""
+    if "error" in event:
+        timing.error = str(event["error"])
+        return
+    for thought in (event.get("context") or {}).get("thoughts") or []:
+        props = thought.get("props") or {}
+        if "duration_ms" not in props:
+            continue
+        if thought["title"] == "Search query generated":
+            timing.rewrite = props["duration_ms"]
+        elif thought["title"] in ("Search results", "Time series"):
+            timing.embed = props.get("embed_ms")
+            timing.search = round(props["duration_ms"] - (timing.embed or 0.0), 1)
+    if (event.get("delta") or {}).get("content"):
+        timing.tokens += 1
+        if timing.first_token is None:
+            timing.first_token = round(elapsed_ms, 1)
+        timing.last_token = round(elapsed_ms, 1)
+
+
+async def timed_chat(client: httpx.AsyncClient, app_url: str, body: dict[str, Any]) -> RequestTiming:
+    timing = RequestTiming()
+    started_at = time.perf_counter()
+    try:
+        async with client.stream("POST", f"{app_url}/chat/stream", json=body) as response:
+            if response.status_code != 200:
+                timing.error = f"HTTP {response.status_code}"
+                return timing
+            async for line in response.aiter_lines():
+                if line.strip():
+                    record_event(timing, json.loads(line), (time.perf_counter() - started_at) * 1000)
+    except httpx.HTTPError as error:
+        timing.error = f"{type(error).__name__}: {error}"
+    if timing.error is None and timing.first_token is None:
+        timing.error = "Stream ended without answer tokens"
+    return timing
+
+
+def summarize_level(concurrency: int, timings: list[RequestTiming], wall_seconds: float) -> dict[str, Any]:
+    completed = [timing for timing in timings if timing.error is None]
+    errors: dict[str, int] = {}
+    for timing in timings:
+        if timing.error is not None:
+            errors[timing.error] = errors.get(timing.error, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(timings),
+        "errors": errors,
+        "throughput_rps": round(len(completed) / wall_seconds, 2),
+        "tokens_per_s": round(sum(timing.tokens for timing in completed) / wall_seconds, 1),
+        "stages": {
+            stage: latency_summary(
+                [getattr(timing, stage) for timing in completed if getattr(timing, stage) is not None]
+            )
+            for stage in STAGES
+        },
+    }
+
+
+async def run_level(
+    client: httpx.AsyncClient, app_url: str, bodies: list[dict[str, Any]], concurrency: int, requests: int
+) -> dict[str, Any]:
+    """`concurrency` clientes que envían preguntas una tras otra hasta completar `requests`."""
+    pending = iter(range(requests))
+    timings: list[RequestTiming] = []
+
+    async def user() -> None:
+        for index in pending:
+            timings.append(await timed_chat(client, app_url, bodies[index % len(bodies)]))
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return summarize_level(concurrency, timings, time.perf_counter() - started_at)
+
+
+def start_process(command: list[str], env: dict[str, str], log_path: Path) -> subprocess.Popen:
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "w") as log_file:
+        return subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = STARTUP_TIMEOUT) -> None:
+    """Espera a que `url` responda 200 (para la app, /ready: hasta que termina el warm-up)."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} was not ready after {timeout:.0f}s")
+
+
+def stop_process(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def app_environment(database: str, stub_url: str) -> dict[str, str]:
+    return {
+        **os.environ,
+        "POSTGRES_DATABASE": database,
+        # Con el host "ollama" los dos clientes usan OLLAMA_ENDPOINT sin autenticación
+        "OPENAI_CHAT_HOST": "ollama",
+        "OPENAI_EMBED_HOST": "ollama",
+        "OLLAMA_ENDPOINT": f"{stub_url}/v1",
+        "EMBEDDING_WORKER_ENABLED": "false",
+        # Evita que create_app vuelva a cargar .env encima de estas variables
+        "RUNNING_IN_PRODUCTION": "true",
+    }
+
+
+def print_levels(levels: list[dict[str, Any]]) -> None:
+    print(f"{'users':>6} {'rps':>8} {'tok/s':>8} {'errors':>7}  " + " ".join(f"{stage:>23}" for stage in STAGES))
+    print(f"{'':>6} {'':>8} {'':>8} {'':>7}  " + " ".join(f"{'p50/p95/p99 ms':>23}" for _ in STAGES))
+    for level in levels:
+        cells = []
+        for stage in STAGES:
+            summary = level["stages"][stage]
+            cells.append(f"{summary['p50']:.0f}/{summary['p95']:.0f}/{summary['p99']:.0f}" if summary["count"] else "-")
+        print(
+            f"{level['concurrency']:>6} {level['throughput_rps']:>8.2f} {level['tokens_per_s']:>8.1f} "
+            f"{sum(level['errors'].values()):>7}  " + " ".join(f"{cell:>23}" for cell in cells)
+        )
+
+
+async def start_local_stack(
+    settings: StubSettings,
+    database: str = BENCH_DATABASE,
+    fixtures: Path = FIXTURE_DIR,
+    skip_load: bool = False,
+    stub_port: int = 8081,
+    app_port: int = 8001,
+) -> tuple[str, list[subprocess.Popen]]:
+    """
+    Carga el dataset en la base de benchmark y levanta el stub y la app apuntada a ambos.
+    Devuelve la URL de la app y los procesos, para detenerlos con stop_process.
+    """
+    if not skip_load:
+        engine = await create_bench_engine(database)
+        try:
+            await load_fixture(engine, fixtures)
+        finally:
+            await engine.dispose()
+    processes: list[subprocess.Popen] = []
+    try:
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        processes.append(
+            start_process(stub_command(settings, stub_port), dict(os.environ), RESULTS_DIR / "stage_latency_stub.log")
+        )
+        await wait_until_ready(f"{stub_url}/health", processes[-1])
+        app_url = f"http://127.0.0.1:{app_port}"
+        app_command = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "fastapi_app:create_app",
+            "--factory",
+            "--app-dir",
+            str(BACKEND_DIR),
+            "--port",
+            str(app_port),
+        ]
+        processes.append(
+            start_process(app_command, app_environment(database, stub_url), RESULTS_DIR / "stage_latency_app.log")
+        )
+        await wait_until_ready(f"{app_url}/ready", processes[-1])
+    except BaseException:
+        for process in reversed(processes):
+            stop_process(process)
+        raise
+    logger.info("App running at %s against the stub at %s", app_url, stub_url)
+    return app_url, processes
+
+
+async def main(args: argparse.Namespace) -> None:
+    settings = stub_settings_from_args(args)
+    questions = [query.query for query in load_queries(args.fixtures / "queries.jsonl")]
+    bodies = [chat_request_body(question, not args.simple, args.retrieval_mode) for question in questions]
+    processes: list[subprocess.Popen] = []
+    app_url = args.app_url
+    try:
+        if app_url is None:
+            app_url, processes = await start_local_stack(
+                settings, args.database, args.fixtures, args.skip_load, args.stub_port, args.app_port
+            )
+
+        limits = httpx.Limits(max_connections=max(args.concurrency) + 10)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(args.timeout), limits=limits) as client:
+            # Calentamiento: conexiones de los pools y planes de consulta en caché
+            await run_level(client, app_url, bodies, 1, args.warmup)
+            levels = []
+            for concurrency in args.concurrency:
+                logger.info("Sending %d requests with %d concurrent users", args.requests, concurrency)
+                levels.append(await run_level(client, app_url, bodies, concurrency, args.requests))
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+
+    print_levels(levels)
+    commit = git_commit()
+    report = {
+        "metadata": {
+            "commit": commit,
+            "app_url": args.app_url,
+            "stub": None if args.app_url else settings.model_dump(),
+            "flow": "simple" if args.simple else "advanced",
+            "retrieval_mode": args.retrieval_mode,
+            "requests_per_level": args.requests,
+        },
+        "levels": levels,
+    }
+    output = args.output or RESULTS_DIR / f"stage_latency_{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    logger.info("Report written to %s", output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Measure /chat/stream latency per stage against a local OpenAI stub")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 2, 4, 8, 16], help="Concurrent users per level")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before the first level")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before a request is counted as failed")
+    parser.add_argument("--simple", action="store_true", help="Use the simple flow (no query rewrite)")
+    parser.add_argument("--retrieval-mode", choices=["text", "vectors", "hybrid"], default="hybrid")
+    parser.add_argument("--app-url", help="Measure an app that is already running instead of starting one")
+    parser.add_argument("--app-port", type=int, default=8001)
+    parser.add_argument("--stub-port", type=int, default=8081)
+    parser.add_argument("--database", default=BENCH_DATABASE, help="Database the app runs against")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_DIR, help="Dataset and questions")
+    parser.add_argument("--skip-load", action="store_true", help="Reuse the fixture already loaded in the database")
+    add_stub_arguments(parser)
+    parser.add_argument(
+        "--output", type=Path, help="JSON report (default: benchmarks/results/stage_latency_<commit>.json)"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,239 @@
+"""
+Barrido de parámetros de índices vectoriales: recall@k contra latencia.
+
+Copia los vectores de una columna real (o genera vectores sintéticos agrupados) a una tabla de trabajo,
+calcula el top-k exacto de cada consulta con un recorrido secuencial y luego, para cada combinación de
+HNSW (m, ef_construction) e IVFFlat (lists), construye el índice y mide recall@k y latencia p50/p95 para
+cada ef_search / probes, junto con el tiempo de construcción y el tamaño del índice.
+
+    python -m benchmarks.vector_index_sweep --source abastecimento.embedding_main --rows 50000
+    python -m benchmarks.vector_index_sweep --dims 1024 --rows 20000 --m 8,16,32 --ef-search 20,40,80,160
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from benchmarks.metrics import latency_summary, recall_at_k
+from fastapi_app.manage_indexes import IndexBuildSettings, apply_build_settings
+from fastapi_app.postgres_engine import create_postgres_engine_from_env
+
+logger = logging.getLogger("ragapp")
+
+BENCH_TABLE = "vector_index_bench"
+BENCH_INDEX = "vector_index_bench_idx"
+RESULTS_DIR = Path(__file__).parent / "results"
+COPY_CHUNK = 5000
+SEARCH_QUERY = f"SELECT id FROM {BENCH_TABLE} ORDER BY embedding <=> $1 LIMIT $2"
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def synthetic_vectors(rows: int, dims: int, clusters: int, seed: int) -> np.ndarray:
+    """Vectores normalizados alrededor de `clusters` centros, parecido a embeddings de textos similares."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dims), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.35 * rng.standard_normal((rows, dims), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def perturbed_queries(vectors: np.ndarray, count: int, seed: int, noise: float = 0.1) -> np.ndarray:
+    """Consultas cerca de filas reales, pero no idénticas (si no el top-1 sería trivial)."""
+    rng = np.random.default_rng(seed + 1)
+    picked = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    queries = picked + noise * rng.standard_normal(picked.shape, dtype=np.float32) / np.sqrt(picked.shape[1])
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+async def load_source_vectors(engine: AsyncEngine, source: str, rows: int) -> np.ndarray:
+    table, column = source.split(".")
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY random() LIMIT :rows"),
+            {"rows": rows},
+        )
+        vectors = [np.asarray(row[0], dtype=np.float32) for row in result]
+    if not vectors:
+        raise ValueError(f"{source} has no embeddings to benchmark")
+    return np.vstack(vectors)
+
+
+async def create_bench_table(engine: AsyncEngine, vectors: np.ndarray) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        await conn.execute(
+            text(f"CREATE TABLE {BENCH_TABLE} (id integer PRIMARY KEY, embedding vector({vectors.shape[1]}))")
+        )
+        driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+        for start in range(0, len(vectors), COPY_CHUNK):
+            chunk = vectors[start : start + COPY_CHUNK]
+            await driver_connection.copy_records_to_table(
+                BENCH_TABLE, records=[(start + offset, vector) for offset, vector in enumerate(chunk)]
+            )
+        await conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+
+
+async def exact_neighbors(engine: AsyncEngine, queries: np.ndarray, k: int) -> list[list[int]]:
+    """Top-k exacto: sin índice y con los recorridos por índice desactivados, Postgres compara con todas las filas."""
+    async with engine.connect() as conn:
+        await conn.execute(text("SET enable_indexscan = off"))
+        await conn.execute(text("SET enable_bitmapscan = off"))
+        driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+        truth = [[row["id"] for row in await driver_connection.fetch(SEARCH_QUERY, query, k)] for query in queries]
+        await conn.rollback()
+    return truth
+
+
+async def build_bench_index(
+    engine: AsyncEngine, method: str, parameters: dict[str, int], settings: IndexBuildSettings
+) -> tuple[float, int]:
+    """Construye el índice y devuelve (segundos de construcción, tamaño en bytes)."""
+    options = ", ".join(f"{key} = {value}" for key, value in parameters.items())
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await apply_build_settings(conn, settings)
+        await conn.execute(text(f"DROP INDEX IF EXISTS {BENCH_INDEX}"))
+        started_at = time.perf_counter()
+        await conn.execute(
+            text(
+                f"CREATE INDEX {BENCH_INDEX} ON {BENCH_TABLE} USING {method} "
+                f"(embedding vector_cosine_ops) WITH ({options})"
+            )
+        )
+        build_seconds = time.perf_counter() - started_at
+        size = (await conn.execute(text(f"SELECT pg_relation_size('{BENCH_INDEX}')"))).scalar_one()
+    return build_seconds, size
+
+
+async def measure_searches(
+    engine: AsyncEngine, queries: np.ndarray, truth: list[list[int]], k: int, setting: str, value: int
+) -> dict[str, float]:
+    """Recall@k medio y latencias de las consultas con `setting` (hnsw.ef_search o ivfflat.probes) en `value`."""
+    async with engine.connect() as conn:
+        await conn.execute(text(f"SET {setting} = {int(value)}"))
+        # Se fuerza el índice: con tablas chicas el planificador podría preferir el recorrido secuencial
+        await conn.execute(text("SET enable_seqscan = off"))
+        driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+        # Una pasada sin medir para tener el índice en caché
+        for query in queries[:10]:
+            await driver_connection.fetch(SEARCH_QUERY, query, k)
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            started_at = time.perf_counter()
+            rows = await driver_connection.fetch(SEARCH_QUERY, query, k)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            recalls.append(recall_at_k([row["id"] for row in rows], expected, k))
+        await conn.rollback()
+    summary = latency_summary(latencies)
+    return {"recall": round(float(np.mean(recalls)), 4), "p50_ms": summary["p50"], "p95_ms": summary["p95"]}
+
+
+async def sweep(engine: AsyncEngine, args: argparse.Namespace) -> list[dict[str, Any]]:
+    if args.source:
+        vectors = await load_source_vectors(engine, args.source, args.rows)
+    else:
+        vectors = synthetic_vectors(args.rows, args.dims, args.clusters, args.seed)
+    queries = perturbed_queries(vectors, args.queries, args.seed)
+    logger.info("Loading %d vectors of %d dimensions into %s", len(vectors), vectors.shape[1], BENCH_TABLE)
+    await create_bench_table(engine, vectors)
+    logger.info("Computing exact top-%d for %d queries with a sequential scan", args.k, len(queries))
+    truth = await exact_neighbors(engine, queries, args.k)
+    settings = IndexBuildSettings(
+        maintenance_work_mem=args.maintenance_work_mem, max_parallel_maintenance_workers=args.parallel_workers
+    )
+    configurations = [
+        ("hnsw", {"m": m, "ef_construction": ef_construction}, "hnsw.ef_search", args.ef_search)
+        for m in args.m
+        for ef_construction in args.ef_construction
+        if ef_construction >= 2 * m
+    ] + [("ivfflat", {"lists": lists}, "ivfflat.probes", args.probes) for lists in args.lists]
+    results = []
+    for method, parameters, setting, values in configurations:
+        build_seconds, size = await build_bench_index(engine, method, parameters, settings)
+        logger.info("Built %s %s in %.1fs (%.1f MB)", method, parameters, build_seconds, size / 1024**2)
+        for value in values:
+            measured = await measure_searches(engine, queries, truth, args.k, setting, value)
+            results.append(
+                {
+                    "method": method,
+                    "m": parameters.get("m"),
+                    "ef_construction": parameters.get("ef_construction"),
+                    "lists": parameters.get("lists"),
+                    "ef_search": value if method == "hnsw" else None,
+                    "probes": value if method == "ivfflat" else None,
+                    f"recall@{args.k}": measured["recall"],
+                    "p50_ms": measured["p50_ms"],
+                    "p95_ms": measured["p95_ms"],
+                    "build_s": round(build_seconds, 2),
+                    "index_mb": round(size / 1024**2, 1),
+                }
+            )
+    if not args.keep:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {BENCH_TABLE}"))
+    return results
+
+
+def print_table(results: list[dict[str, Any]]) -> None:
+    columns = list(results[0])
+    print(" ".join(f"{column:>15}" for column in columns))
+    for result in results:
+        print(" ".join(f"{'' if result[column] is None else result[column]!s:>15}" for column in columns))
+
+
+def write_csv(results: list[dict[str, Any]], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = await create_postgres_engine_from_env()
+    try:
+        results = await sweep(engine, args)
+    finally:
+        await engine.dispose()
+    print_table(results)
+    if args.output is not None:
+        write_csv(results, args.output)
+        logger.info("Results written to %s", args.output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Sweep vector index parameters and report recall@k vs latency")
+    parser.add_argument("--source", help="table.column with real embeddings (default: synthetic vectors)")
+    parser.add_argument("--rows", type=int, default=20000, help="Vectors in the benchmark table")
+    parser.add_argument("--dims", type=int, default=1024, help="Dimensions of the synthetic vectors")
+    parser.add_argument("--clusters", type=int, default=50, help="Clusters of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Query vectors")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--m", type=int_list, default=[8, 16, 32], help="HNSW m values")
+    parser.add_argument("--ef-construction", type=int_list, default=[32, 64, 128], help="HNSW ef_construction values")
+    parser.add_argument("--ef-search", type=int_list, default=[10, 20, 40, 80, 160], help="hnsw.ef_search values")
+    parser.add_argument("--lists", type=int_list, default=[100, 200], help="IVFFlat lists values (empty to skip)")
+    parser.add_argument("--probes", type=int_list, default=[1, 5, 10, 20], help="ivfflat.probes values")
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--parallel-workers", type=int, default=4)
+    parser.add_argument("--keep", action="store_true", help=f"Keep the {BENCH_TABLE} table afterwards")
+    parser.add_argument(
+        "--output", type=Path, default=RESULTS_DIR / "vector_index_sweep.csv", help="CSV file for the results"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,3 @@
+"""
+Pruebas de carga de /chat/stream con locust (ver `locustfile.py` en la raíz y docs/loadtesting.md).
+"""
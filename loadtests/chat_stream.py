@@ -0,0 +1,53 @@
+"""
+Lectura de una respuesta NDJSON de /chat/stream con los tiempos que ve el usuario.
+"""
+
+import json
+import time
+from collections.abc import Iterable
+from typing import Any, Callable, Optional, Union
+
+from pydantic import BaseModel
+
+
+class StreamResult(BaseModel):
+    # Milisegundos desde el envío de la petición hasta el primer token de la respuesta
+    ttft_ms: Optional[float] = None
+    # Milisegundos desde el envío hasta el final del stream
+    duration_ms: float = 0.0
+    answer: str = ""
+    tokens: int = 0
+    error: Optional[str] = None
+    # El último session_state recibido, para enviarlo en el turno siguiente
+    session_state: Optional[Any] = None
+
+
+def read_chat_stream(
+    lines: Iterable[Union[str, bytes]], started_at: float, clock: Callable[[], float] = time.perf_counter
+) -> StreamResult:
+    """Consume las líneas del stream; `started_at` es el valor de `clock` al enviar la petición."""
+    result = StreamResult()
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            result.error = f"Invalid NDJSON line: {line[:80]}"
+            break
+        if "error" in event:
+            result.error = str(event["error"])
+            break
+        if event.get("session_state") is not None:
+            result.session_state = event["session_state"]
+        if content := (event.get("delta") or {}).get("content"):
+            if result.ttft_ms is None:
+                result.ttft_ms = round((clock() - started_at) * 1000, 1)
+            result.answer += content
+            result.tokens += 1
+    result.duration_ms = round((clock() - started_at) * 1000, 1)
+    if result.error is None and result.ttft_ms is None:
+        result.error = "Stream ended without answer tokens"
+    return result
@@ -0,0 +1,54 @@
+"""
+Levanta la app contra el stub de OpenAI y la base de benchmark, para correr locust con resultados
+reproducibles (sin la latencia ni las cuotas del servicio real). Queda corriendo hasta Ctrl+C.
+
+    python -m loadtests.local_backend --chat-latency 400 --tokens-per-second 50
+    locust -f locustfile.py --host http://127.0.0.1:8001
+"""
+
+import argparse
+import asyncio
+import logging
+import subprocess
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from benchmarks.openai_stub import add_stub_arguments, stub_settings_from_args
+from benchmarks.retrieval_bench import BENCH_DATABASE, FIXTURE_DIR
+from benchmarks.stage_latency import start_local_stack, stop_process
+
+logger = logging.getLogger("ragapp")
+
+
+async def main(args: argparse.Namespace) -> None:
+    processes: list[subprocess.Popen] = []
+    try:
+        app_url, processes = await start_local_stack(
+            stub_settings_from_args(args), args.database, args.fixtures, args.skip_load, args.stub_port, args.app_port
+        )
+        print(f"App ready at {app_url}; run locust with --host {app_url} and stop this with Ctrl+C")
+        while all(process.poll() is None for process in processes):
+            await asyncio.sleep(1)
+        logger.error("A backend process exited; see the logs in benchmarks/results/")
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+
+    parser = argparse.ArgumentParser(description="Run the app against a local OpenAI stub for load tests")
+    parser.add_argument("--app-port", type=int, default=8001)
+    parser.add_argument("--stub-port", type=int, default=8081)
+    parser.add_argument("--database", default=BENCH_DATABASE, help="Database the app runs against")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURE_DIR, help="Dataset loaded before starting")
+    parser.add_argument("--skip-load", action="store_true", help="Reuse the fixture already loaded in the database")
+    add_stub_arguments(parser)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
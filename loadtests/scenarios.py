@@ -0,0 +1,128 @@
+"""
+Conversaciones de carga sobre la flota: consultas puntuales, agregados y seguimientos de varios turnos.
+
+Las preguntas se arman con placas y vehículos reales de un archivo `veiculos.jsonl` (por defecto el dataset de
+benchmark, que es el que carga `loadtests.local_backend`), para que las búsquedas devuelvan filas.
+"""
+
+import json
+import random
+from datetime import date
+from pathlib import Path
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+DEFAULT_FLEET_FILE = Path(__file__).parents[1] / "benchmarks" / "fixtures" / "retrieval" / "veiculos.jsonl"
+DEFAULT_MONTHS = ("2025-01", "2025-02", "2025-03")
+MONTH_NAMES = (
+    "enero",
+    "febrero",
+    "marzo",
+    "abril",
+    "mayo",
+    "junio",
+    "julio",
+    "agosto",
+    "septiembre",
+    "octubre",
+    "noviembre",
+    "diciembre",
+)
+
+
+class Fleet(BaseModel):
+    plates: list[str]
+    vehicle_ids: list[str]
+    # Meses con datos, como "AAAA-MM"
+    months: list[str]
+
+
+class Conversation(BaseModel):
+    # Escenario, para separar las métricas en locust
+    name: str
+    turns: list[str]
+    retrieval_mode: str = "hybrid"
+
+
+def load_fleet(path: Path = DEFAULT_FLEET_FILE, months: tuple[str, ...] = DEFAULT_MONTHS) -> Fleet:
+    with open(path, encoding="utf-8") as f:
+        vehicles = [json.loads(line) for line in f if line.strip()]
+    if not vehicles:
+        raise ValueError(f"{path} has no vehicles")
+    return Fleet(
+        plates=[vehicle["placa"] for vehicle in vehicles if vehicle.get("placa")],
+        vehicle_ids=[vehicle["id_veiculo"] for vehicle in vehicles],
+        months=list(months),
+    )
+
+
+def month_name(month: str) -> str:
+    year, number = month.split("-")
+    return f"{MONTH_NAMES[int(number) - 1]} de {year}"
+
+
+def random_day(rng: random.Random, month: str) -> date:
+    year, number = map(int, month.split("-"))
+    return date(year, number, rng.randint(1, 28))
+
+
+def lookup_conversation(rng: random.Random, fleet: Fleet) -> Conversation:
+    """Una pregunta sobre un vehículo concreto (placa, ID o placa y fecha)."""
+    plate = rng.choice(fleet.plates)
+    month = rng.choice(fleet.months)
+    question = rng.choice(
+        [
+            f"¿Cuánto diesel cargó la placa {plate} en {month_name(month)}?",
+            f"Muestra los últimos abastecimientos del vehículo {rng.choice(fleet.vehicle_ids)}.",
+            f"¿Cuál fue la eficiencia en km/l de la placa {plate} el {random_day(rng, month).isoformat()}?",
+            f"¿Cuánto costó el combustible de la placa {plate} en {month_name(month)}?",
+        ]
+    )
+    return Conversation(name="lookup", turns=[question])
+
+
+def aggregate_conversation(rng: random.Random, fleet: Fleet) -> Conversation:
+    """Una pregunta sobre toda la flota: totales, rankings o la evolución en el tiempo (modo timeseries)."""
+    month = rng.choice(fleet.months)
+    if len(fleet.months) > 1 and rng.random() < 0.4:
+        start, end = sorted(rng.sample(fleet.months, 2))
+        question = f"¿Cómo evolucionó el consumo de diesel de la flota entre {month_name(start)} y {month_name(end)}?"
+        return Conversation(name="aggregate", turns=[question], retrieval_mode="timeseries")
+    question = rng.choice(
+        [
+            f"¿Cuál fue el costo total de combustible de la flota en {month_name(month)}?",
+            f"¿Qué vehículos tuvieron la peor eficiencia en {month_name(month)}?",
+            f"¿Cuál fue el precio promedio del diesel en {month_name(month)}?",
+            "¿Hubo abastecimientos con un costo total anormalmente alto?",
+        ]
+    )
+    return Conversation(name="aggregate", turns=[question])
+
+
+def follow_up_conversation(rng: random.Random, fleet: Fleet) -> Conversation:
+    """Una consulta sobre un vehículo seguida de preguntas que dependen del historial."""
+    plate = rng.choice(fleet.plates)
+    first, other = rng.sample(fleet.months, 2) if len(fleet.months) > 1 else (fleet.months[0], fleet.months[0])
+    follow_ups = [
+        f"¿Y en {month_name(other)}?",
+        "¿Cómo se compara con el promedio de la flota?",
+        "¿Hubo alguna anomalía de eficiencia en esas cargas?",
+        "¿Cuál de esas cargas fue la más cara?",
+    ]
+    turns = [f"Resume los abastecimientos de la placa {plate} en {month_name(first)}."]
+    turns += rng.sample(follow_ups, rng.randint(1, 3))
+    return Conversation(name="follow_up", turns=turns)
+
+
+def chat_request_body(
+    messages: list[dict[str, str]], retrieval_mode: str = "hybrid", session_state: Optional[Any] = None
+) -> dict[str, Any]:
+    return {
+        "messages": messages,
+        "context": {
+            "overrides": {"use_advanced_flow": True, "top": 3, "retrieval_mode": retrieval_mode, "temperature": 0.3}
+        },
+        # El resumen del historial vuelve en cada turno, como lo hace el frontend
+        "sessionState": session_state,
+    }
@@ -0,0 +1,50 @@
+"""
+Perfiles de carga: escalones (`step`) para encontrar dónde se degrada la latencia y pico (`spike`) para ver
+cómo se recupera la app. Cada función devuelve `(usuarios, spawn_rate)` para el segundo `run_time` de la
+prueba, o None cuando la prueba terminó, que es lo que espera `LoadTestShape.tick` de locust.
+"""
+
+import math
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class StepShapeSettings(BaseModel):
+    # Usuarios que se suman en cada escalón
+    step_users: int = 10
+    # Segundos que dura cada escalón
+    step_seconds: float = 60.0
+    max_users: int = 50
+    spawn_rate: float = 2.0
+    # Segundos a máxima carga antes de terminar
+    hold_seconds: float = 60.0
+
+
+class SpikeShapeSettings(BaseModel):
+    base_users: int = 5
+    spike_users: int = 50
+    # Segundos de carga base antes y después del pico
+    warmup_seconds: float = 60.0
+    spike_seconds: float = 30.0
+    recovery_seconds: float = 90.0
+    spawn_rate: float = 25.0
+
+
+def step_stage(run_time: float, settings: StepShapeSettings) -> Optional[tuple[int, float]]:
+    steps = math.ceil(settings.max_users / settings.step_users)
+    ramp_seconds = (steps - 1) * settings.step_seconds
+    if run_time >= ramp_seconds + settings.step_seconds + settings.hold_seconds:
+        return None
+    step = min(int(run_time // settings.step_seconds), steps - 1)
+    return min((step + 1) * settings.step_users, settings.max_users), settings.spawn_rate
+
+
+def spike_stage(run_time: float, settings: SpikeShapeSettings) -> Optional[tuple[int, float]]:
+    spike_start = settings.warmup_seconds
+    spike_end = spike_start + settings.spike_seconds
+    if run_time >= spike_end + settings.recovery_seconds:
+        return None
+    if spike_start <= run_time < spike_end:
+        return settings.spike_users, settings.spawn_rate
+    return settings.base_users, settings.spawn_rate
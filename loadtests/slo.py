@@ -0,0 +1,61 @@
+"""
+Objetivos de servicio de una prueba de carga. Los percentiles se calculan sobre los histogramas de locust
+(`StatsEntry.response_times`: milisegundos redondeados -> cantidad), así que valen también con workers.
+"""
+
+from collections import Counter
+from collections.abc import Iterable
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class SLOSettings(BaseModel):
+    ttft_p95_ms: float = 3000.0
+    stream_p95_ms: float = 15000.0
+    # Fracción máxima de conversaciones (peticiones a /chat/stream) con error
+    error_rate: float = 0.01
+
+
+def merged_percentile(histograms: Iterable[dict[int, int]], q: float) -> Optional[float]:
+    """Percentil `q` (0-1) del histograma combinado; None si no hay muestras."""
+    merged: Counter = Counter()
+    for histogram in histograms:
+        merged.update(histogram)
+    total = sum(merged.values())
+    if total == 0:
+        return None
+    # Igual que locust: el menor valor que cubre al menos q * total muestras
+    needed = max(1, round(q * total))
+    seen = 0
+    for value in sorted(merged):
+        seen += merged[value]
+        if seen >= needed:
+            return float(value)
+    return float(max(merged))
+
+
+def check_slos(
+    settings: SLOSettings,
+    ttft_histograms: Iterable[dict[int, int]],
+    stream_histograms: Iterable[dict[int, int]],
+    requests: int,
+    failures: int,
+) -> list[str]:
+    """Mensajes de los objetivos incumplidos; vacío si la prueba pasa."""
+    violations = []
+    if requests == 0:
+        return ["No /chat/stream requests were made"]
+    error_rate = failures / requests
+    if error_rate > settings.error_rate:
+        violations.append(f"Error rate {error_rate:.2%} > {settings.error_rate:.2%}")
+    for metric, histograms, limit in (
+        ("TTFT", ttft_histograms, settings.ttft_p95_ms),
+        ("Stream duration", stream_histograms, settings.stream_p95_ms),
+    ):
+        p95 = merged_percentile(histograms, 0.95)
+        if p95 is None:
+            violations.append(f"{metric}: no samples")
+        elif p95 > limit:
+            violations.append(f"{metric} p95 {p95:.0f} ms > {limit:.0f} ms")
+    return violations
@@ -1,46 +1,186 @@
+"""
+Prueba de carga de /chat/stream con conversaciones sobre la flota (ver docs/loadtesting.md).
+
+Cada usuario alterna consultas puntuales, agregados y seguimientos de varios turnos, y reporta dos métricas
+propias además de la petición: TTFT (hasta el primer token) y STREAM (hasta el final de la respuesta).
+La carga sigue el perfil de `--load-shape` y, al terminar, la prueba falla si no cumple los SLO.
+
+    locust -f locustfile.py --headless --host http://127.0.0.1:8001 --load-shape step
+"""
+
+import logging
 import random
 import time
+from pathlib import Path
+from typing import Any, Optional
 
-from locust import HttpUser, between, task
-
-
-class ChatUser(HttpUser):
-    wait_time = between(5, 20)
-
-    @task
-    def ask_question(self):
-        self.client.get("/")
-        time.sleep(5)
-        self.client.post(
-            "/chat",
-            json={
-                "messages": [
-                    {
-                        "content": random.choice(
-                            ["Cómo evolucionó el consumo de diesel en enero de 2025?", "Hubo un pico en Custo Combustivel durante febrero?", "Resume el abastecimiento del vehículo 103001 en marzo?","¿Cuál fue el costo promedio de combustible el mes pasado?"]
-                        ),
-                        "role": "user",
-                    }
-                ],
-                "context": {
-                    "overrides": {"use_advanced_flow": True, "top": 3, "retrieval_mode": "hybrid", "temperature": 0.3}
-                },
-            },
-        )
-        time.sleep(5)
-        self.client.post(
-            "/chat",
-            json={
-                "messages": [
-                    {"content": "Best shoe for hiking?", "role": "user"},
-                    {
-                        "content": "For the best shoe for hiking, I recommend the Trailblaze Steel-Blue Hiking Shoes.",
-                        "role": "assistant",
-                    },
-                    {"content": "any other options?", "role": "user"},
-                ],
-                "context": {
-                    "overrides": {"use_advanced_flow": True, "top": 3, "retrieval_mode": "hybrid", "temperature": 0.3}
-                },
-            },
+import requests
+from locust import HttpUser, LoadTestShape, between, events, task
+from locust.runners import WorkerRunner
+
+from loadtests.chat_stream import StreamResult, read_chat_stream
+from loadtests.scenarios import (
+    DEFAULT_FLEET_FILE,
+    DEFAULT_MONTHS,
+    Conversation,
+    Fleet,
+    aggregate_conversation,
+    chat_request_body,
+    follow_up_conversation,
+    load_fleet,
+    lookup_conversation,
+)
+from loadtests.shapes import SpikeShapeSettings, StepShapeSettings, spike_stage, step_stage
+from loadtests.slo import SLOSettings, check_slos
+
+logger = logging.getLogger("ragapp")
+CHAT_STREAM_PATH = "/chat/stream"
+fleet: Optional[Fleet] = None
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser: Any) -> None:
+    step, spike, slo = StepShapeSettings(), SpikeShapeSettings(), SLOSettings()
+    parser.add_argument("--load-shape", choices=["step", "spike"], default="step", help="Load profile of the run")
+    parser.add_argument("--step-users", type=int, default=step.step_users, help="Users added on each step")
+    parser.add_argument("--step-seconds", type=float, default=step.step_seconds, help="Seconds of each step")
+    parser.add_argument("--step-max-users", type=int, default=step.max_users, help="Users of the last step")
+    parser.add_argument("--step-spawn-rate", type=float, default=step.spawn_rate)
+    parser.add_argument("--step-hold-seconds", type=float, default=step.hold_seconds, help="Seconds at max users")
+    parser.add_argument("--spike-base-users", type=int, default=spike.base_users)
+    parser.add_argument("--spike-users", type=int, default=spike.spike_users, help="Users during the spike")
+    parser.add_argument("--spike-warmup-seconds", type=float, default=spike.warmup_seconds)
+    parser.add_argument("--spike-seconds", type=float, default=spike.spike_seconds)
+    parser.add_argument("--spike-recovery-seconds", type=float, default=spike.recovery_seconds)
+    parser.add_argument("--spike-spawn-rate", type=float, default=spike.spawn_rate)
+    parser.add_argument("--fleet-file", default=str(DEFAULT_FLEET_FILE), help="veiculos.jsonl with the plates to ask")
+    parser.add_argument("--months", default=",".join(DEFAULT_MONTHS), help="Comma-separated YYYY-MM with data")
+    parser.add_argument("--slo-ttft-p95", type=float, default=slo.ttft_p95_ms, help="Max p95 TTFT (ms)")
+    parser.add_argument("--slo-stream-p95", type=float, default=slo.stream_p95_ms, help="Max p95 stream (ms)")
+    parser.add_argument("--slo-error-rate", type=float, default=slo.error_rate, help="Max failed request ratio")
+
+
+@events.init.add_listener
+def load_fleet_file(environment: Any, **kwargs: Any) -> None:
+    global fleet
+    options = environment.parsed_options
+    if options is not None:
+        fleet = load_fleet(Path(options.fleet_file), tuple(options.months.split(",")))
+    else:
+        fleet = load_fleet()
+
+
+@events.quitting.add_listener
+def assert_slos(environment: Any, **kwargs: Any) -> None:
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    options = environment.parsed_options
+    settings = SLOSettings(
+        ttft_p95_ms=options.slo_ttft_p95, stream_p95_ms=options.slo_stream_p95, error_rate=options.slo_error_rate
+    )
+    entries = environment.stats.entries.values()
+    chat_entries = [entry for entry in entries if entry.method == "POST" and entry.name.startswith(CHAT_STREAM_PATH)]
+    violations = check_slos(
+        settings,
+        [entry.response_times for entry in entries if entry.method == "TTFT"],
+        [entry.response_times for entry in entries if entry.method == "STREAM"],
+        requests=sum(entry.num_requests for entry in chat_entries),
+        failures=sum(entry.num_failures for entry in chat_entries),
+    )
+    for violation in violations:
+        logger.error("SLO failed: %s", violation)
+    if violations:
+        environment.process_exit_code = 1
+
+
+class FleetChatUser(HttpUser):
+    # Tiempo que el usuario lee la respuesta antes de preguntar de nuevo
+    wait_time = between(3, 10)
+
+    def on_start(self):
+        self.random = random.Random()
+
+    def fire_metric(self, request_type: str, name: str, response_time: Optional[float]) -> None:
+        if response_time is not None:
+            self.environment.events.request.fire(
+                request_type=request_type,
+                name=name,
+                response_time=response_time,
+                response_length=0,
+                exception=None,
+                context={},
+            )
+
+    def ask(self, conversation: Conversation, messages: list[dict[str, str]], session_state: Any) -> StreamResult:
+        name = f"{CHAT_STREAM_PATH} [{conversation.name}]"
+        body = chat_request_body(messages, conversation.retrieval_mode, session_state)
+        started_at = time.perf_counter()
+        with self.client.post(CHAT_STREAM_PATH, json=body, stream=True, catch_response=True, name=name) as response:
+            if response.status_code != 200:
+                response.failure(f"HTTP {response.status_code}")
+                return StreamResult(error=f"HTTP {response.status_code}")
+            try:
+                result = read_chat_stream(response.iter_lines(), started_at)
+            except requests.RequestException as error:
+                result = StreamResult(error=f"{type(error).__name__}: {error}")
+            if result.error is not None:
+                response.failure(result.error)
+                return result
+            response.success()
+        self.fire_metric("TTFT", conversation.name, result.ttft_ms)
+        self.fire_metric("STREAM", conversation.name, result.duration_ms)
+        return result
+
+    def converse(self, conversation: Conversation) -> None:
+        messages: list[dict[str, str]] = []
+        session_state = None
+        for turn, question in enumerate(conversation.turns):
+            if turn > 0:
+                self.wait()
+            messages.append({"role": "user", "content": question})
+            result = self.ask(conversation, messages, session_state)
+            if result.error is not None:
+                return
+            messages.append({"role": "assistant", "content": result.answer})
+            session_state = result.session_state
+
+    @task(5)
+    def lookup(self):
+        self.converse(lookup_conversation(self.random, fleet))
+
+    @task(3)
+    def aggregate(self):
+        self.converse(aggregate_conversation(self.random, fleet))
+
+    @task(2)
+    def follow_up(self):
+        self.converse(follow_up_conversation(self.random, fleet))
+
+
+class FleetLoadShape(LoadTestShape):
+    """Perfil `--load-shape`: escalones de usuarios o un pico sobre una carga base."""
+
+    def tick(self):
+        options = self.runner.environment.parsed_options
+        if options.load_shape == "spike":
+            return spike_stage(
+                self.get_run_time(),
+                SpikeShapeSettings(
+                    base_users=options.spike_base_users,
+                    spike_users=options.spike_users,
+                    warmup_seconds=options.spike_warmup_seconds,
+                    spike_seconds=options.spike_seconds,
+                    recovery_seconds=options.spike_recovery_seconds,
+                    spawn_rate=options.spike_spawn_rate,
+                ),
+            )
+        return step_stage(
+            self.get_run_time(),
+            StepShapeSettings(
+                step_users=options.step_users,
+                step_seconds=options.step_seconds,
+                max_users=options.step_max_users,
+                spawn_rate=options.step_spawn_rate,
+                hold_seconds=options.step_hold_seconds,
+            ),
         )
@@ -84,6 +84,13 @@ def check_db_schema():
     finally:
         if conn: conn.close()
 
+def embedding_worker_active(cur):
+    """El worker de la app completará los embeddings si está activado y los triggers están instalados."""
+    if os.getenv("EMBEDDING_WORKER_ENABLED", "").lower() not in ("1", "true", "yes", "on"):
+        return False
+    cur.execute("SELECT 1 FROM pg_trigger WHERE tgname = %s;", (f"{TARGET_TABLE}_embedding_dirty_insert",))
+    return cur.fetchone() is not None
+
 def check_embeddings_status():
     print("\n4. Verificando el estado de los embeddings...")
     conn = None
@@ -101,8 +108,18 @@ def check_embeddings_status():
             percentage = (embedded_rows / total_rows) * 100
             print(f"   ✅ {embedded_rows} de {total_rows} filas ({percentage:.1f}%) en la tabla '{TARGET_TABLE}' tienen embeddings.")
             if percentage < 100:
+                if embedding_worker_active(cur):
+                    print(
+                        "\n   ⚠️ No todas las filas tienen embeddings todavía: "
+                        "el worker de embeddings las completará."
+                    )
+                    return True
                 print("\n   ⚠️ ¡Atención! No todas las filas tienen embeddings.")
-                print("      Ejecuta 'python scripts/generate_embeddings.py' para procesar las filas restantes.")
+                print(
+                    "      Ejecuta 'python src/backend/fastapi_app/update_embeddings.py' "
+                    "para procesar las filas restantes,"
+                )
+                print("      o activa el worker de embeddings con EMBEDDING_WORKER_ENABLED=true.")
                 sys.exit(1)
             return True
         else:
@@ -13,4 +13,57 @@ ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_alt vector(768);
 ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_main vector(1024);
 ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_alt vector(768);
 
+-- Step 4: Add the columns that record which text and model each embedding was computed from.
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_main_text_hash VARCHAR(64);
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_main_model VARCHAR;
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_alt_text_hash VARCHAR(64);
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_alt_model VARCHAR;
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_main_text_hash VARCHAR(64);
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_main_model VARCHAR;
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_alt_text_hash VARCHAR(64);
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_alt_model VARCHAR;
+
+-- Step 5: Create the cache of already computed embeddings, keyed by text hash and model:dimensions.
+CREATE TABLE IF NOT EXISTS public.embedding_cache (
+    text_hash VARCHAR(64) NOT NULL,
+    model_tag VARCHAR NOT NULL,
+    embedding vector NOT NULL,
+    PRIMARY KEY (text_hash, model_tag)
+);
+
+-- Step 6: Queue new or changed rows for the embedding worker (src/backend/fastapi_app/embedding_worker.py).
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_dirty_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_dirty_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_claimed_until TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_claimed_until TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.veiculos ADD COLUMN IF NOT EXISTS embedding_attempts INTEGER;
+ALTER TABLE public.abastecimento ADD COLUMN IF NOT EXISTS embedding_attempts INTEGER;
+CREATE OR REPLACE FUNCTION mark_embedding_dirty() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.embedding_dirty_at := clock_timestamp();
+    -- Texto nuevo: se vuelve a intentar aunque la fila estuviera apartada o esperando tras un fallo
+    NEW.embedding_claimed_until := NULL;
+    NEW.embedding_attempts := NULL;
+    RETURN NEW;
+END $$;
+CREATE OR REPLACE FUNCTION notify_embedding_dirty() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('embedding_dirty', TG_TABLE_NAME);
+    RETURN NULL;
+END $$;
+CREATE INDEX IF NOT EXISTS ix_veiculos_embedding_dirty ON veiculos (embedding_dirty_at) WHERE embedding_dirty_at IS NOT NULL;
+DROP TRIGGER IF EXISTS veiculos_embedding_dirty_insert ON veiculos;
+CREATE TRIGGER veiculos_embedding_dirty_insert BEFORE INSERT ON veiculos FOR EACH ROW EXECUTE FUNCTION mark_embedding_dirty();
+DROP TRIGGER IF EXISTS veiculos_embedding_dirty_update ON veiculos;
+CREATE TRIGGER veiculos_embedding_dirty_update BEFORE UPDATE OF id_veiculo, garagem, placa, ano, tipo_onibus, fabricante, modelo_chassi ON veiculos FOR EACH ROW WHEN ((OLD.id_veiculo, OLD.garagem, OLD.placa, OLD.ano, OLD.tipo_onibus, OLD.fabricante, OLD.modelo_chassi) IS DISTINCT FROM (NEW.id_veiculo, NEW.garagem, NEW.placa, NEW.ano, NEW.tipo_onibus, NEW.fabricante, NEW.modelo_chassi)) EXECUTE FUNCTION mark_embedding_dirty();
+DROP TRIGGER IF EXISTS veiculos_embedding_notify ON veiculos;
+CREATE TRIGGER veiculos_embedding_notify AFTER INSERT OR UPDATE OF id_veiculo, garagem, placa, ano, tipo_onibus, fabricante, modelo_chassi ON veiculos FOR EACH STATEMENT EXECUTE FUNCTION notify_embedding_dirty();
+CREATE INDEX IF NOT EXISTS ix_abastecimento_embedding_dirty ON abastecimento (embedding_dirty_at) WHERE embedding_dirty_at IS NOT NULL;
+DROP TRIGGER IF EXISTS abastecimento_embedding_dirty_insert ON abastecimento;
+CREATE TRIGGER abastecimento_embedding_dirty_insert BEFORE INSERT ON abastecimento FOR EACH ROW EXECUTE FUNCTION mark_embedding_dirty();
+DROP TRIGGER IF EXISTS abastecimento_embedding_dirty_update ON abastecimento;
+CREATE TRIGGER abastecimento_embedding_dirty_update BEFORE UPDATE OF id_veiculo, placa, km_percorrido, diesel, km_diesel, data, custo_combustivel, preco_combustivel ON abastecimento FOR EACH ROW WHEN ((OLD.id_veiculo, OLD.placa, OLD.km_percorrido, OLD.diesel, OLD.km_diesel, OLD.data, OLD.custo_combustivel, OLD.preco_combustivel) IS DISTINCT FROM (NEW.id_veiculo, NEW.placa, NEW.km_percorrido, NEW.diesel, NEW.km_diesel, NEW.data, NEW.custo_combustivel, NEW.preco_combustivel)) EXECUTE FUNCTION mark_embedding_dirty();
+DROP TRIGGER IF EXISTS abastecimento_embedding_notify ON abastecimento;
+CREATE TRIGGER abastecimento_embedding_notify AFTER INSERT OR UPDATE OF id_veiculo, placa, km_percorrido, diesel, km_diesel, data, custo_combustivel, preco_combustivel ON abastecimento FOR EACH STATEMENT EXECUTE FUNCTION notify_embedding_dirty();
+
 -- End of script.
\ No newline at end of file
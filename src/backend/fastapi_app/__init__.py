@@ -2,14 +2,11 @@ import logging
 import os
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
-from typing import TypedDict, Union
+from typing import Optional, TypedDict, Union
 
 import fastapi
-from azure.monitor.opentelemetry import configure_azure_monitor
 from dotenv import load_dotenv
 from openai import AsyncAzureOpenAI, AsyncOpenAI
-from opentelemetry.instrumentation.openai import OpenAIInstrumentor
-from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from fastapi_app.dependencies import (
@@ -18,8 +15,13 @@ from fastapi_app.dependencies import (
     create_async_sessionmaker,
     get_azure_credential,
 )
+from fastapi_app.embedding_worker import EmbeddingWorker, EmbeddingWorkerSettings
+from fastapi_app.hedging import RequestHedger, create_hedger_from_env
+from fastapi_app.http_transport import create_keepalive, create_shared_transport
 from fastapi_app.openai_clients import create_openai_chat_client, create_openai_embed_client
-from fastapi_app.postgres_engine import create_postgres_engine_from_env
+from fastapi_app.postgres_engine import create_postgres_engine_from_env, uses_entra_auth
+from fastapi_app.postgres_replicas import ReplicaRouter, create_replica_router_from_env
+from fastapi_app.warmup import Warmup, WarmupSettings
 
 logger = logging.getLogger("ragapp")
 
@@ -29,6 +31,10 @@ class State(TypedDict):
     context: FastAPIAppContext
     chat_client: Union[AsyncOpenAI, AsyncAzureOpenAI]
     embed_client: Union[AsyncOpenAI, AsyncAzureOpenAI]
+    replica_router: Optional[ReplicaRouter]
+    chat_hedger: Optional[RequestHedger]
+    embed_hedger: Optional[RequestHedger]
+    warmup: Warmup
 
 
 @asynccontextmanager
@@ -38,16 +44,56 @@ async def lifespan(app: fastapi.FastAPI) -> AsyncIterator[State]:
     if (
         os.getenv("OPENAI_CHAT_HOST") == "azure"
         or os.getenv("OPENAI_EMBED_HOST") == "azure"
-        or os.getenv("POSTGRES_HOST", "").endswith(".database.azure.com")
+        or uses_entra_auth(os.getenv("POSTGRES_HOST", ""), os.getenv("POSTGRES_PASSWORD"))
     ):
         azure_credential = await get_azure_credential()
     engine = await create_postgres_engine_from_env(azure_credential)
     sessionmaker = await create_async_sessionmaker(engine)
-    chat_client = await create_openai_chat_client(azure_credential)
-    embed_client = await create_openai_embed_client(azure_credential)
+    # Réplicas de lectura opcionales para búsquedas y analítica (POSTGRES_REPLICA_HOSTS)
+    replica_router = await create_replica_router_from_env(sessionmaker, azure_credential)
+    if replica_router is not None:
+        replica_router.start()
+    # Un solo pool de conexiones para chat y embeddings, con una conexión mantenida en caliente
+    http_transport = create_shared_transport()
+    chat_client = await create_openai_chat_client(azure_credential, shared_transport=http_transport)
+    embed_client = await create_openai_embed_client(azure_credential, shared_transport=http_transport)
+    keepalive = create_keepalive(http_transport, {str(chat_client.base_url), str(embed_client.base_url)})
+    keepalive.start()
+    # El warm-up corre en segundo plano; /ready responde 503 hasta que termina
+    warmup = Warmup(WarmupSettings.from_env(), engine, sessionmaker, embed_client, context)
+    warmup.start()
+    # Worker opcional que embebe las filas nuevas o modificadas (avisadas por NOTIFY desde un trigger)
+    embedding_worker = None
+    worker_settings = EmbeddingWorkerSettings.from_env()
+    if worker_settings.enabled:
+        worker_embed_client = await create_openai_embed_client(
+            azure_credential, background=True, shared_transport=http_transport
+        )
+        embedding_worker = EmbeddingWorker(engine, worker_embed_client, context, worker_settings)
+        embedding_worker.start()
     if os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING"):
+        # Importaciones diferidas: la instrumentación solo se carga si hay Application Insights
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+
         SQLAlchemyInstrumentor().instrument(engine=engine.sync_engine)
-    yield {"sessionmaker": sessionmaker, "context": context, "chat_client": chat_client, "embed_client": embed_client}
+    yield {
+        "sessionmaker": sessionmaker,
+        "context": context,
+        "chat_client": chat_client,
+        "embed_client": embed_client,
+        "replica_router": replica_router,
+        "chat_hedger": create_hedger_from_env("rewrite", "AZURE_OPENAI_CHAT_HEDGE_DEPLOYMENT"),
+        "embed_hedger": create_hedger_from_env("embeddings", "AZURE_OPENAI_EMBED_HEDGE_DEPLOYMENT"),
+        "warmup": warmup,
+    }
+    await warmup.stop()
+    if embedding_worker is not None:
+        await embedding_worker.stop()
+        await embedding_worker.openai_embed_client.close()
+    await keepalive.stop()
+    await http_transport.aclose()
+    if replica_router is not None:
+        await replica_router.stop()
     await engine.dispose()
 
 
@@ -65,6 +111,9 @@ def create_app(testing: bool = False):
     logging.getLogger("azure.identity").setLevel(logging.WARNING)
 
     if os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING"):
+        from azure.monitor.opentelemetry import configure_azure_monitor
+        from opentelemetry.instrumentation.openai import OpenAIInstrumentor
+
         logger.info("Configuring Azure Monitor")
         configure_azure_monitor(logger_name="ragapp")
         # OpenAI SDK requests use httpx, so are thus not auto-instrumented:
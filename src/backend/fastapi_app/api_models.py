@@ -18,6 +18,7 @@ class RetrievalMode(str, Enum):
     TEXT = "text"
     VECTORS = "vectors"
     HYBRID = "hybrid"
+    TIMESERIES = "timeseries"
 
 class ChatRequestOverrides(BaseModel):
     top: int = 3
@@ -35,6 +36,9 @@ class ChatRequest(BaseModel):
     context: Optional[ChatRequestContext] = None
     sessionState: Optional[Any] = None
 
+class ChatBatchRequest(BaseModel):
+    requests: list[ChatRequest] = Field(min_length=1, max_length=500)
+
 
 # --- Modelos para los Filtros y Parámetros ---
 
@@ -51,6 +55,14 @@ class AnoFilter(Filter):
 class ChatParams(ChatRequestOverrides):
     prompt_template: Optional[str]
     response_token_limit: int = 1024
+    # Cantidad de filas recuperadas para el resumen numérico (solo `top` se envían al LLM)
+    summary_row_limit: int = 100
+    # Puntos de la serie temporal (modo "timeseries") tras el downsampling
+    series_points: int = 60
+    # Historial acotado: últimos turnos literales, el resto resumido en sessionState
+    history_max_turns: int = 4
+    history_summarize_every: int = 4
+    history_max_tokens: int = 2000
     enable_text_search: bool
     enable_vector_search: bool
     original_user_query: str
@@ -101,4 +113,10 @@ class RetrievalResponseDelta(BaseModel):
 class RetrievalResponse(BaseModel):
     message: Message
     context: RAGContext
-    session_state: Optional[Any] = None
\ No newline at end of file
+    session_state: Optional[Any] = None
+
+class ChatBatchResult(BaseModel):
+    # Posición de la pregunta en ChatBatchRequest.requests (los resultados llegan en orden de finalización)
+    index: int
+    response: Optional[RetrievalResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from typing import Optional, Union
+
+import anyio
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from fastapi_app.api_models import ChatBatchResult, ChatRequest, ChatRequestOverrides, RetrievalMode
+from fastapi_app.embeddings import compute_text_embeddings
+from fastapi_app.postgres_searcher import PostgresSearcher
+from fastapi_app.rag_advanced import AdvancedRAGChat
+from fastapi_app.rag_base import RAGChatBase
+from fastapi_app.rag_simple import SimpleRAGChat
+
+logger = logging.getLogger("ragapp")
+
+# Llamadas simultáneas al modelo de chat (reescritura y respuesta) dentro de un lote
+BATCH_LLM_CONCURRENCY = 8
+# Sesiones de base de datos que comparten las búsquedas de un lote
+BATCH_DB_SESSIONS = 4
+
+
+class ChatBatchRunner:
+    """
+    Responde una lista de preguntas compartiendo recursos entre ellas:
+    reescrituras concurrentes bajo un semáforo, una sola llamada de embeddings para todas las consultas
+    y búsquedas repartidas sobre unas pocas sesiones. Los resultados salen en orden de finalización.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests: list[ChatRequest],
+        sessionmaker: async_sessionmaker[AsyncSession],
+        openai_chat_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+        chat_model: str,
+        chat_deployment: Optional[str],
+        openai_embed_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+        embed_model: str,
+        embed_deployment: Optional[str],
+        embed_dimensions: Optional[int],
+        embedding_column: str = "embedding_main",
+        llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+        db_sessions: int = BATCH_DB_SESSIONS,
+    ):
+        self.requests = requests
+        self.sessionmaker = sessionmaker
+        self.openai_chat_client = openai_chat_client
+        self.chat_model = chat_model
+        self.chat_deployment = chat_deployment
+        self.openai_embed_client = openai_embed_client
+        self.embed_model = embed_model
+        self.embed_deployment = embed_deployment
+        self.embed_dimensions = embed_dimensions
+        self.embedding_column = embedding_column
+        self.llm_slots = asyncio.Semaphore(llm_concurrency)
+        self.db_sessions = db_sessions
+
+    def build_flow(self, chat_request: ChatRequest) -> RAGChatBase:
+        overrides = chat_request.context.overrides if chat_request.context else ChatRequestOverrides()
+        flow_class = AdvancedRAGChat if overrides.use_advanced_flow else SimpleRAGChat
+        # El searcher se asigna al tomar una sesión del pool, justo antes de buscar
+        return flow_class(
+            messages=chat_request.messages,
+            overrides=overrides,
+            searcher=None,
+            openai_chat_client=self.openai_chat_client,
+            chat_model=self.chat_model,
+            chat_deployment=self.chat_deployment,
+            session_state=chat_request.sessionState,
+        )
+
+    def build_searcher(self, session: AsyncSession) -> PostgresSearcher:
+        return PostgresSearcher(
+            db_session=session,
+            openai_embed_client=self.openai_embed_client,
+            embed_deployment=self.embed_deployment,
+            embed_model=self.embed_model,
+            embed_dimensions=self.embed_dimensions,
+            embedding_column=self.embedding_column,
+        )
+
+    async def plan(self, flow: RAGChatBase) -> tuple[str, Optional[list[dict]]]:
+        async with self.llm_slots:
+            return await flow.plan_search()
+
+    async def embed_queries(self, queries: dict[int, str]) -> dict[int, list[float]]:
+        """Una sola llamada de embeddings (por lotes de la API) para todas las consultas."""
+        if not queries:
+            return {}
+        try:
+            vectors = await compute_text_embeddings(
+                list(queries.values()),
+                self.openai_embed_client,
+                self.embed_model,
+                self.embed_deployment,
+                self.embed_dimensions,
+            )
+        except Exception:
+            # Cada pregunta vuelve a calcular su embedding al buscar
+            logger.exception("Batch embedding failed, falling back to one embedding call per question")
+            return {}
+        return dict(zip(queries.keys(), vectors))
+
+    async def complete(
+        self,
+        index: int,
+        flow: RAGChatBase,
+        plan: tuple[str, Optional[list[dict]]],
+        query_vector: Optional[list[float]],
+        searchers: "asyncio.Queue[PostgresSearcher]",
+        started_at: float,
+    ) -> ChatBatchResult:
+        search_query, filters = plan
+        try:
+            thoughts = flow.plan_steps(search_query, filters, started_at)
+            started_at = time.perf_counter()
+            searcher = await searchers.get()
+            try:
+                flow.searcher = searcher
+                await flow.retrieve(search_query, filters, query_vector)
+            finally:
+                searchers.put_nowait(searcher)
+            thoughts += flow.retrieval_steps(started_at)
+            async with self.llm_slots:
+                response = await flow.answer(flow.search_results, thoughts)
+        except Exception as error:
+            logger.exception("Exception while answering batch question %d: %s", index, error)
+            return ChatBatchResult(index=index, error=str(error))
+        return ChatBatchResult(index=index, response=response)
+
+    async def run(self) -> AsyncGenerator[ChatBatchResult, None]:
+        started_at = time.perf_counter()
+        flows = [self.build_flow(chat_request) for chat_request in self.requests]
+
+        # 1. Reescrituras concurrentes, acotadas por el semáforo compartido
+        plans = await asyncio.gather(*(self.plan(flow) for flow in flows), return_exceptions=True)
+        pending = []
+        for index, plan in enumerate(plans):
+            if isinstance(plan, Exception):
+                yield ChatBatchResult(index=index, error=str(plan))
+            elif isinstance(plan, BaseException):
+                raise plan
+            else:
+                pending.append(index)
+
+        # 2. Embeddings de todas las consultas que los necesitan en una sola llamada
+        query_vectors = await self.embed_queries(
+            {
+                index: plans[index][0]
+                for index in pending
+                if flows[index].chat_params.enable_vector_search
+                and flows[index].chat_params.retrieval_mode != RetrievalMode.TIMESERIES
+            }
+        )
+
+        # 3. Búsquedas sobre unas pocas sesiones compartidas y respuestas en orden de finalización
+        sessions = [self.sessionmaker() for _ in range(min(self.db_sessions, len(pending)))]
+        searchers: asyncio.Queue[PostgresSearcher] = asyncio.Queue()
+        for session in sessions:
+            searchers.put_nowait(self.build_searcher(session))
+        tasks = [
+            asyncio.create_task(
+                self.complete(index, flows[index], plans[index], query_vectors.get(index), searchers, started_at)
+            )
+            for index in pending
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            with anyio.CancelScope(shield=True):
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for session in sessions:
+                    await session.close()
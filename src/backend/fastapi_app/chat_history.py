@@ -0,0 +1,111 @@
+from typing import Any, Optional, Union
+
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from pydantic import BaseModel
+
+from fastapi_app.api_models import AIChatRoles
+from fastapi_app.prompt_loader import load_prompt
+from fastapi_app.token_estimates import estimate_tokens
+
+# Clave dentro de sessionState donde se guarda el estado del historial
+SESSION_STATE_KEY = "history"
+
+
+def estimate_message_tokens(message: dict[str, Any]) -> int:
+    # A few extra tokens per message for the role and separators
+    return estimate_tokens(str(message.get("content") or "")) + 4
+
+
+class HistoryState(BaseModel):
+    summary: str = ""
+    # Number of leading messages of the conversation already folded into `summary`
+    summarized_messages: int = 0
+
+
+class ChatHistoryManager:
+    """
+    Keeps the last `max_turns` turns verbatim and folds older turns into a running summary that
+    travels in `sessionState`. The summary is refreshed only once `summarize_every` turns have
+    accumulated outside the verbatim window, and the whole history is capped at `max_tokens`.
+    """
+
+    @property
+    def summary_prompt_template(self) -> str:
+        return load_prompt("history_summary.txt")
+
+    def __init__(
+        self,
+        *,
+        openai_chat_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+        chat_model: str,
+        chat_deployment: Optional[str] = None,
+        max_turns: int = 4,
+        summarize_every: int = 4,
+        max_tokens: int = 2000,
+    ):
+        self.openai_chat_client = openai_chat_client
+        self.chat_model = chat_model
+        self.chat_deployment = chat_deployment
+        self.max_turns = max_turns
+        self.summarize_every = summarize_every
+        self.max_tokens = max_tokens
+
+    def load_state(self, session_state: Any, past_messages: list[dict[str, Any]]) -> HistoryState:
+        state = HistoryState()
+        if isinstance(session_state, dict) and isinstance(session_state.get(SESSION_STATE_KEY), dict):
+            state = HistoryState.model_validate(session_state[SESSION_STATE_KEY])
+        # The client started a new conversation (or edited it): the summary no longer applies
+        if state.summarized_messages > len(past_messages):
+            state = HistoryState()
+        return state
+
+    async def summarize(self, summary: str, messages: list[dict[str, Any]]) -> str:
+        conversation = "\n".join(f"{m['role']}: {m.get('content') or ''}" for m in messages)
+        response = await self.openai_chat_client.chat.completions.create(
+            model=self.chat_deployment or self.chat_model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": self.summary_prompt_template.format(summary=summary or "-", messages=conversation),
+                }
+            ],
+            temperature=0,
+            max_tokens=300,
+        )
+        return (response.choices[0].message.content or summary).strip()
+
+    async def compact(
+        self, past_messages: list[dict[str, Any]], session_state: Any
+    ) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+        """
+        Returns the bounded history to send to the model and the updated session state.
+        """
+        state = self.load_state(session_state, past_messages)
+        verbatim_start = max(len(past_messages) - 2 * self.max_turns, 0)
+        pending = past_messages[state.summarized_messages : verbatim_start]
+        if pending and len(pending) >= 2 * self.summarize_every:
+            state.summary = await self.summarize(state.summary, pending)
+            state.summarized_messages = verbatim_start
+
+        history = past_messages[state.summarized_messages :]
+        budget = self.max_tokens
+        summary_message: Optional[dict[str, Any]] = None
+        if state.summary:
+            summary_text = state.summary[: self.max_tokens * 2]
+            summary_message = {
+                "role": AIChatRoles.SYSTEM.value,
+                "content": f"Summary of the earlier conversation: {summary_text}",
+            }
+            budget -= estimate_message_tokens(summary_message)
+        # Hard cap: drop the oldest verbatim messages until the history fits
+        kept: list[dict[str, Any]] = []
+        for message in reversed(history):
+            budget -= estimate_message_tokens(message)
+            if budget < 0:
+                break
+            kept.append(message)
+        kept.reverse()
+
+        new_session_state = dict(session_state) if isinstance(session_state, dict) else {}
+        new_session_state[SESSION_STATE_KEY] = state.model_dump()
+        return ([summary_message] if summary_message else []) + kept, new_session_state
@@ -9,6 +9,8 @@ from openai import AsyncAzureOpenAI, AsyncOpenAI
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
 
+from fastapi_app.hedging import RequestHedger
+
 logger = logging.getLogger("ragapp")
 
 
@@ -18,6 +20,8 @@ class OpenAIClient(BaseModel):
     """
 
     client: Union[AsyncOpenAI, AsyncAzureOpenAI]
+    # Hedging opcional para las llamadas idempotentes hechas con este cliente
+    hedger: Optional[RequestHedger] = None
     model_config = {"arbitrary_types_allowed": True}
 
 
@@ -125,6 +129,14 @@ async def get_async_sessionmaker(
     yield request.state.sessionmaker
 
 
+async def get_async_read_sessionmaker(
+    request: Request,
+) -> AsyncGenerator[async_sessionmaker[AsyncSession], None]:
+    """Sessionmaker para lecturas: una réplica si hay alguna disponible, si no el primario."""
+    replica_router = getattr(request.state, "replica_router", None)
+    yield replica_router.read_sessionmaker() if replica_router is not None else request.state.sessionmaker
+
+
 async def get_context(
     request: Request,
 ) -> FastAPIAppContext:
@@ -138,21 +150,33 @@ async def get_async_db_session(
         yield session
 
 
+async def get_async_read_db_session(
+    sessionmaker: Annotated[async_sessionmaker[AsyncSession], Depends(get_async_read_sessionmaker)],
+) -> AsyncGenerator[AsyncSession, None]:
+    async with sessionmaker() as session:
+        yield session
+
+
 async def get_openai_chat_client(
     request: Request,
 ) -> OpenAIClient:
     """Get the OpenAI chat client"""
-    return OpenAIClient(client=request.state.chat_client)
+    return OpenAIClient(client=request.state.chat_client, hedger=getattr(request.state, "chat_hedger", None))
 
 
 async def get_openai_embed_client(
     request: Request,
 ) -> OpenAIClient:
     """Get the OpenAI embed client"""
-    return OpenAIClient(client=request.state.embed_client)
+    return OpenAIClient(client=request.state.embed_client, hedger=getattr(request.state, "embed_hedger", None))
 
 
 CommonDeps = Annotated[FastAPIAppContext, Depends(get_context)]
 DBSession = Annotated[AsyncSession, Depends(get_async_db_session)]
+DBSessionMaker = Annotated[async_sessionmaker[AsyncSession], Depends(get_async_sessionmaker)]
+# Escrituras siempre en el primario; búsquedas y analítica en una réplica cuando está configurada
+DBWriteSession = DBSession
+DBReadSession = Annotated[AsyncSession, Depends(get_async_read_db_session)]
+DBReadSessionMaker = Annotated[async_sessionmaker[AsyncSession], Depends(get_async_read_sessionmaker)]
 ChatClient = Annotated[OpenAIClient, Depends(get_openai_chat_client)]
 EmbeddingsClient = Annotated[OpenAIClient, Depends(get_openai_embed_client)]
@@ -0,0 +1,435 @@
+"""
+Worker de embeddings en segundo plano, disparado por LISTEN/NOTIFY.
+
+Un trigger en cada tabla con embeddings marca la fila como pendiente (embedding_dirty_at) al insertarla o al
+cambiar sus columnas de texto, y avisa por el canal `embedding_dirty`. El worker escucha el canal (y revisa igual
+cada poll_interval, por si se perdió un aviso), toma las filas pendientes en micro-lotes por el índice parcial
+sobre embedding_dirty_at, embebe los textos que no están en embedding_cache y las escribe. Una fila que cambió
+mientras se embebía no se pisa: sigue pendiente para el siguiente lote.
+
+Varios procesos pueden correr el worker a la vez: cada lote se toma con FOR UPDATE SKIP LOCKED y se marca con
+embedding_claimed_until, así ningún otro lo toma mientras se embebe. Si el lote falla, sus filas esperan un
+tiempo creciente antes de volver a tomarse (la cola sigue con las demás) y, tras max_attempts fallos, quedan
+apartadas hasta que cambie su texto.
+
+Corre dentro de la app (EMBEDDING_WORKER_ENABLED=true) o aparte:
+
+    python src/backend/fastapi_app/embedding_worker.py
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import timedelta
+from typing import Any, Optional, Union
+
+from dotenv import load_dotenv
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from pgvector.sqlalchemy import Vector
+from pydantic import BaseModel
+from sqlalchemy import Column, Select, Table, func, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import load_only
+
+from fastapi_app.dependencies import FastAPIAppContext, common_parameters, get_azure_credential
+from fastapi_app.embeddings import compute_text_embeddings, embedding_model_tag, text_hash
+from fastapi_app.metrics import embedding_worker_failures, embedding_worker_lag, embedding_worker_rows
+from fastapi_app.openai_clients import create_openai_embed_client
+from fastapi_app.postgres_engine import create_postgres_engine_from_env
+from fastapi_app.postgres_models import Base, EmbeddingCache
+from fastapi_app.update_embeddings import EMBEDDING_MODELS, check_embedding_column, fetch_cached_vectors
+
+logger = logging.getLogger("ragapp")
+
+NOTIFY_CHANNEL = "embedding_dirty"
+DIRTY_COLUMN = "embedding_dirty_at"
+CLAIM_COLUMN = "embedding_claimed_until"
+ATTEMPTS_COLUMN = "embedding_attempts"
+QUEUE_COLUMNS = (DIRTY_COLUMN, CLAIM_COLUMN, ATTEMPTS_COLUMN)
+# Cada cuánto se comprueba que la conexión de LISTEN sigue viva (segundos)
+LISTEN_CHECK_INTERVAL = 5.0
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if not value else value.lower() in ("1", "true", "yes", "on")
+
+
+def text_columns(table: Table) -> list[Column]:
+    """Columnas de las que sale el texto embebido: todas menos los vectores y su contabilidad."""
+    return [
+        column
+        for column in table.columns
+        if not isinstance(column.type, Vector)
+        and not column.name.endswith(("_text_hash", "_model"))
+        and column.name not in QUEUE_COLUMNS
+    ]
+
+
+def trigger_ddl(tables: list[Table]) -> list[str]:
+    """Sentencias idempotentes que instalan las funciones, el índice y los triggers de cada tabla."""
+    statements = [
+        f"""CREATE OR REPLACE FUNCTION mark_embedding_dirty() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.{DIRTY_COLUMN} := clock_timestamp();
+    -- Texto nuevo: se vuelve a intentar aunque la fila estuviera apartada o esperando tras un fallo
+    NEW.{CLAIM_COLUMN} := NULL;
+    NEW.{ATTEMPTS_COLUMN} := NULL;
+    RETURN NEW;
+END $$""",
+        f"""CREATE OR REPLACE FUNCTION notify_embedding_dirty() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('{NOTIFY_CHANNEL}', TG_TABLE_NAME);
+    RETURN NULL;
+END $$""",
+    ]
+    for table in tables:
+        names = [column.name for column in text_columns(table)]
+        old_values = ", ".join(f"OLD.{name}" for name in names)
+        new_values = ", ".join(f"NEW.{name}" for name in names)
+        statements += [
+            f"CREATE INDEX IF NOT EXISTS ix_{table.name}_embedding_dirty ON {table.name} ({DIRTY_COLUMN}) "
+            f"WHERE {DIRTY_COLUMN} IS NOT NULL",
+            f"DROP TRIGGER IF EXISTS {table.name}_embedding_dirty_insert ON {table.name}",
+            f"CREATE TRIGGER {table.name}_embedding_dirty_insert BEFORE INSERT ON {table.name} "
+            "FOR EACH ROW EXECUTE FUNCTION mark_embedding_dirty()",
+            f"DROP TRIGGER IF EXISTS {table.name}_embedding_dirty_update ON {table.name}",
+            # Solo si cambió el texto: escribir el embedding (u otra columna) no vuelve a marcar la fila
+            f"CREATE TRIGGER {table.name}_embedding_dirty_update BEFORE UPDATE OF {', '.join(names)} "
+            f"ON {table.name} FOR EACH ROW WHEN (({old_values}) IS DISTINCT FROM ({new_values})) "
+            "EXECUTE FUNCTION mark_embedding_dirty()",
+            f"DROP TRIGGER IF EXISTS {table.name}_embedding_notify ON {table.name}",
+            # Un aviso por sentencia, no por fila: una carga masiva no inunda el canal
+            f"CREATE TRIGGER {table.name}_embedding_notify AFTER INSERT OR UPDATE OF {', '.join(names)} "
+            f"ON {table.name} FOR EACH STATEMENT EXECUTE FUNCTION notify_embedding_dirty()",
+        ]
+    return statements
+
+
+class EmbeddingWorkerSettings(BaseModel):
+    enabled: bool = False
+    column: str = "embedding_main"
+    # Filas por micro-lote (y por petición de embeddings)
+    batch_size: int = 256
+    # Revisión periódica aunque no lleguen avisos (segundos)
+    poll_interval: float = 30.0
+    # Espera tras un fallo, duplicada en cada fallo seguido hasta retry_max (segundos)
+    retry_initial: float = 1.0
+    retry_max: float = 60.0
+    # Segundos que un lote queda tomado por un worker; si el proceso muere, otro lo retoma al vencer
+    claim_timeout: float = 300.0
+    # Fallos tras los que una fila queda apartada hasta que cambie su texto
+    max_attempts: int = 5
+    # LISTEN necesita una conexión de sesión: detrás de PgBouncer en transaction pooling solo se sondea
+    listen: bool = True
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingWorkerSettings":
+        defaults = cls()
+        return cls(
+            enabled=_env_bool("EMBEDDING_WORKER_ENABLED", defaults.enabled),
+            column=os.getenv("EMBEDDING_WORKER_COLUMN") or defaults.column,
+            batch_size=int(os.getenv("EMBEDDING_WORKER_BATCH_SIZE") or defaults.batch_size),
+            poll_interval=float(os.getenv("EMBEDDING_WORKER_POLL_INTERVAL") or defaults.poll_interval),
+            retry_initial=float(os.getenv("EMBEDDING_WORKER_RETRY_INITIAL") or defaults.retry_initial),
+            retry_max=float(os.getenv("EMBEDDING_WORKER_RETRY_MAX") or defaults.retry_max),
+            claim_timeout=float(os.getenv("EMBEDDING_WORKER_CLAIM_TIMEOUT") or defaults.claim_timeout),
+            max_attempts=int(os.getenv("EMBEDDING_WORKER_MAX_ATTEMPTS") or defaults.max_attempts),
+            listen=not _env_bool("POSTGRES_PGBOUNCER", False),
+        )
+
+
+class EmbeddingWorker:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        openai_embed_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+        context: FastAPIAppContext,
+        settings: EmbeddingWorkerSettings,
+        models: Optional[list[type[Base]]] = None,
+    ):
+        self.engine = engine
+        self.openai_embed_client = openai_embed_client
+        self.context = context
+        self.settings = settings
+        self.models = models or list(EMBEDDING_MODELS.values())
+        self.column = settings.column
+        self.hash_column = f"{settings.column}_text_hash"
+        self.model_column = f"{settings.column}_model"
+        self.model_tags = {
+            model: embedding_model_tag(
+                context.openai_embed_model,
+                check_embedding_column(model.__table__, settings.column, context.openai_embed_dimensions),
+            )
+            for model in self.models
+        }
+        # Los avisos solo encienden esta señal: ráfagas de NOTIFY no encolan trabajo, se drena hasta vaciar
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.listener_task: Optional[asyncio.Task] = None
+
+    def notified(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        self.wakeup.set()
+
+    def claim_query(self, model: type[Base]) -> Select:
+        """Pendientes más antiguas que nadie tiene tomadas ni están apartadas, bloqueadas sin esperar a otros."""
+        table = model.__table__
+        dirty, claimed_until = table.c[DIRTY_COLUMN], table.c[CLAIM_COLUMN]
+        loaded = [
+            column
+            for column in table.columns
+            if not isinstance(column.type, Vector) and column.name not in QUEUE_COLUMNS
+        ]
+        return (
+            select(
+                model,
+                dirty,
+                # Retraso medido con el reloj del servidor, el mismo que marcó la fila
+                func.extract("epoch", func.clock_timestamp() - dirty).label("lag"),
+                table.c[self.column].is_(None).label("missing"),
+            )
+            .options(load_only(*(getattr(model, column.key) for column in loaded)))
+            .where(
+                dirty.is_not(None),
+                claimed_until.is_(None) | (claimed_until < func.clock_timestamp()),
+                func.coalesce(table.c[ATTEMPTS_COLUMN], 0) < self.settings.max_attempts,
+            )
+            .order_by(dirty)
+            .limit(self.settings.batch_size)
+            .with_for_update(of=table, skip_locked=True)
+        )
+
+    async def claim(self, model: type[Base]) -> list[tuple[Any, Any, float, bool]]:
+        """
+        Toma un lote de filas pendientes: (fila, embedding_dirty_at, segundos de retraso, sin vector).
+        Quedan marcadas por claim_timeout y con un intento más, aunque el bloqueo se suelte al confirmar.
+        """
+        table = model.__table__
+        key_columns = list(table.primary_key.columns)
+        async with AsyncSession(self.engine, expire_on_commit=False) as session, session.begin():
+            rows = [tuple(row) for row in (await session.execute(self.claim_query(model))).all()]
+            if rows:
+                keys = [tuple(getattr(row, column.key) for column in key_columns) for row, *_ in rows]
+                await session.execute(
+                    update(table)
+                    .where(tuple_(*key_columns).in_(keys))
+                    .values(
+                        {
+                            CLAIM_COLUMN: func.clock_timestamp() + timedelta(seconds=self.settings.claim_timeout),
+                            ATTEMPTS_COLUMN: func.coalesce(table.c[ATTEMPTS_COLUMN], 0) + 1,
+                        }
+                    )
+                )
+            return rows
+
+    async def release(self, model: type[Base], keys: list[tuple]) -> None:
+        """Tras un fallo, las filas esperan retry_initial * 2^(intentos - 1) (hasta retry_max) antes de retomarse."""
+        table = model.__table__
+        attempts = table.c[ATTEMPTS_COLUMN]
+        backoff = func.least(self.settings.retry_max, self.settings.retry_initial * func.power(2, attempts - 1))
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(table)
+                .where(tuple_(*table.primary_key.columns).in_(keys))
+                .values({CLAIM_COLUMN: func.clock_timestamp() + func.make_interval(0, 0, 0, 0, 0, 0, backoff)})
+                .returning(attempts)
+            )
+            set_aside = sum(1 for (row_attempts,) in result if row_attempts >= self.settings.max_attempts)
+        if set_aside:
+            logger.error(
+                "Embedding worker set aside %d rows of %s after %d failed attempts",
+                set_aside,
+                model.__tablename__,
+                self.settings.max_attempts,
+            )
+
+    async def write(self, model: type[Base], records: list[tuple], new_hashes: list[str]) -> int:
+        """
+        Escribe (clave..., vector o None, hash, modelo, embedding_dirty_at) y limpia la marca.
+        Sin vector la fila ya estaba al día y solo se limpia la marca. Devuelve las filas escritas.
+        """
+        table = model.__table__
+        staging = f"{table.name}_embedding_worker"
+        key_names = [column.name for column in table.primary_key.columns]
+        join = " AND ".join(f"t.{name} = u.{name}" for name in key_names)
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                    f"SELECT {', '.join(key_names)}, {self.column} AS embedding, {self.hash_column} AS text_hash, "
+                    f"{self.model_column} AS model_tag, {DIRTY_COLUMN} AS dirty_at FROM {table.name} WITH NO DATA"
+                )
+            )
+            driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+            await driver_connection.copy_records_to_table(
+                staging, records=records, columns=[*key_names, "embedding", "text_hash", "model_tag", "dirty_at"]
+            )
+            # Si la fila volvió a cambiar mientras se embebía, su marca es otra y queda para el próximo lote
+            result = await conn.execute(
+                text(
+                    f"UPDATE {table.name} t SET {self.column} = COALESCE(u.embedding, t.{self.column}), "
+                    f"{self.hash_column} = u.text_hash, {self.model_column} = u.model_tag, {DIRTY_COLUMN} = NULL, "
+                    f"{CLAIM_COLUMN} = NULL, {ATTEMPTS_COLUMN} = NULL "
+                    f"FROM {staging} u WHERE {join} AND t.{DIRTY_COLUMN} = u.dirty_at"
+                )
+            )
+            if new_hashes:
+                await conn.execute(
+                    text(
+                        f"INSERT INTO {EmbeddingCache.__tablename__} (text_hash, model_tag, embedding) "
+                        f"SELECT DISTINCT ON (text_hash) text_hash, model_tag, embedding FROM {staging} "
+                        "WHERE text_hash = ANY(:new_hashes) ON CONFLICT DO NOTHING"
+                    ),
+                    {"new_hashes": new_hashes},
+                )
+            return result.rowcount
+
+    async def process(self, model: type[Base]) -> int:
+        """Procesa un micro-lote de la tabla y devuelve cuántas filas pendientes tomó."""
+        rows = await self.claim(model)
+        if not rows:
+            return 0
+        started_at = time.perf_counter()
+        model_tag = self.model_tags[model]
+        key_columns = list(model.__table__.primary_key.columns)
+        items = []
+        for row, dirty_at, _, missing in rows:
+            row_text = row.to_str_for_embedding()
+            row_hash = text_hash(row_text)
+            # Insertada con su embedding ya calculado (o con el mismo texto): solo se limpia la marca
+            stale = (
+                missing or getattr(row, self.hash_column) != row_hash or getattr(row, self.model_column) != model_tag
+            )
+            items.append(
+                (tuple(getattr(row, column.key) for column in key_columns), row_text, row_hash, stale, dirty_at)
+            )
+        texts = {row_hash: row_text for _, row_text, row_hash, stale, _ in items if stale}
+        try:
+            vectors = await fetch_cached_vectors(self.engine, model_tag, list(texts))
+            misses = [row_hash for row_hash in texts if row_hash not in vectors]
+            if misses:
+                embedded = await compute_text_embeddings(
+                    [texts[row_hash] for row_hash in misses],
+                    self.openai_embed_client,
+                    self.context.openai_embed_model,
+                    self.context.openai_embed_deployment,
+                    self.context.openai_embed_dimensions,
+                    batch_size=self.settings.batch_size,
+                )
+                vectors.update(zip(misses, embedded))
+            records = [
+                (*key, vectors[row_hash] if stale else None, row_hash, model_tag, dirty_at)
+                for key, _, row_hash, stale, dirty_at in items
+            ]
+            written = await self.write(model, records, misses)
+        except Exception:
+            # El lote no bloquea la cola: sus filas esperan y el siguiente drenado sigue con las demás
+            await self.release(model, [key for key, *_ in items])
+            raise
+        elapsed = time.perf_counter() - started_at
+        attributes = {"table": model.__tablename__}
+        embedding_worker_rows.add(written, attributes)
+        for _, _, lag, _ in rows:
+            embedding_worker_lag.record(float(lag) + elapsed, attributes)
+        logger.info(
+            "Embedding worker: %d dirty rows in %s, %d new texts embedded, %d written",
+            len(rows),
+            model.__tablename__,
+            len(misses),
+            written,
+        )
+        return len(rows)
+
+    async def drain(self) -> int:
+        """Procesa micro-lotes, de a uno, hasta que ninguna tabla tenga filas pendientes."""
+        total = 0
+        for model in self.models:
+            while True:
+                claimed = await self.process(model)
+                total += claimed
+                if claimed < self.settings.batch_size:
+                    break
+        return total
+
+    async def run(self) -> None:
+        delay = self.settings.retry_initial
+        while True:
+            # Un aviso que llegue mientras se drena vuelve a encender la señal y se drena otra vez
+            self.wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as error:
+                # Las filas siguen marcadas: se reintentan tras una espera creciente (con jitter)
+                embedding_worker_failures.add(1)
+                logger.warning("Embedding worker batch failed, retrying in %.0fs: %s", delay, error)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.settings.retry_max)
+                continue
+            delay = self.settings.retry_initial
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.settings.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def listen(self) -> None:
+        delay = self.settings.retry_initial
+        while True:
+            try:
+                async with self.engine.connect() as conn:
+                    driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+                    await driver_connection.add_listener(NOTIFY_CHANNEL, self.notified)
+                    logger.info("Embedding worker listening on channel %s", NOTIFY_CHANNEL)
+                    delay = self.settings.retry_initial
+                    # Al (re)conectar se pudo perder un aviso
+                    self.wakeup.set()
+                    try:
+                        while not driver_connection.is_closed():
+                            await asyncio.sleep(LISTEN_CHECK_INTERVAL)
+                    finally:
+                        if not driver_connection.is_closed():
+                            await driver_connection.remove_listener(NOTIFY_CHANNEL, self.notified)
+            except Exception as error:
+                logger.warning("Embedding worker lost its LISTEN connection: %s", error)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.settings.retry_max)
+
+    def start(self) -> None:
+        if not self.settings.enabled:
+            return
+        self.task = asyncio.create_task(self.run())
+        if self.settings.listen:
+            self.listener_task = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        for task in (self.listener_task, self.task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+
+async def main():
+    azure_credential = await get_azure_credential()
+    engine = await create_postgres_engine_from_env(azure_credential)
+    openai_embed_client = await create_openai_embed_client(azure_credential, background=True)
+    settings = EmbeddingWorkerSettings.from_env()
+    settings.enabled = True
+    worker = EmbeddingWorker(engine, openai_embed_client, await common_parameters(), settings)
+    worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+        await openai_embed_client.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+    asyncio.run(main())
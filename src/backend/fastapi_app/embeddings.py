@@ -1,35 +1,83 @@
+import hashlib
 from typing import Optional, TypedDict, Union
 
 from openai import AsyncAzureOpenAI, AsyncOpenAI
 
+from fastapi_app.hedging import RequestHedger, client_for_deployment
 
-async def compute_text_embedding(
-    q: str,
-    openai_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
-    embed_model: str,
-    embed_deployment: Optional[str] = None,
-    embedding_dimensions: Optional[int] = None,
-) -> list[float]:
-    SUPPORTED_DIMENSIONS_MODEL = {
-        "text-embedding-ada-002": False,
-        "text-embedding-3-small": True,
-        "text-embedding-3-large": True,
-    }
+SUPPORTED_DIMENSIONS_MODEL = {
+    "text-embedding-ada-002": False,
+    "text-embedding-3-small": True,
+    "text-embedding-3-large": True,
+}
+
+# Maximum number of inputs sent in a single embeddings request
+EMBEDDING_BATCH_SIZE = 256
 
-    class ExtraArgs(TypedDict, total=False):
-        dimensions: int
 
+def text_hash(text: str) -> str:
+    """Hash of the text sent to the embeddings API, stored next to the vector to detect changes."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def embedding_model_tag(embed_model: str, dimensions: int) -> str:
+    """Model and dimensions a vector was computed with, e.g. `text-embedding-3-large:1024`."""
+    return f"{embed_model}:{dimensions}"
+
+
+class ExtraArgs(TypedDict, total=False):
+    dimensions: int
+
+
+def _dimensions_args(embed_model: str, embedding_dimensions: Optional[int]) -> ExtraArgs:
     dimensions_args: ExtraArgs = {}
     if SUPPORTED_DIMENSIONS_MODEL.get(embed_model):
         if embedding_dimensions is None:
             raise ValueError(f"Model {embed_model} requires embedding dimensions")
         else:
             dimensions_args = {"dimensions": embedding_dimensions}
+    return dimensions_args
+
 
-    embedding = await openai_client.embeddings.create(
-        # Azure OpenAI takes the deployment name as the model name
-        model=embed_deployment if embed_deployment else embed_model,
-        input=q,
-        **dimensions_args,
-    )
+async def compute_text_embedding(
+    q: str,
+    openai_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+    embed_model: str,
+    embed_deployment: Optional[str] = None,
+    embedding_dimensions: Optional[int] = None,
+    hedger: Optional[RequestHedger] = None,
+) -> list[float]:
+    dimensions_args = _dimensions_args(embed_model, embedding_dimensions)
+
+    def create_embedding(model: str):
+        client = client_for_deployment(openai_client, model)
+        return client.embeddings.create(model=model, input=q, **dimensions_args)
+
+    # Azure OpenAI takes the deployment name as the model name
+    model = embed_deployment if embed_deployment else embed_model
+    if hedger is not None:
+        embedding = await hedger.run(create_embedding, model)
+    else:
+        embedding = await create_embedding(model)
     return embedding.data[0].embedding
+
+
+async def compute_text_embeddings(
+    texts: list[str],
+    openai_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+    embed_model: str,
+    embed_deployment: Optional[str] = None,
+    embedding_dimensions: Optional[int] = None,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+) -> list[list[float]]:
+    """Embeds many texts with one request per `batch_size` inputs, returning vectors in input order."""
+    dimensions_args = _dimensions_args(embed_model, embedding_dimensions)
+    vectors: list[list[float]] = []
+    for start in range(0, len(texts), batch_size):
+        embedding = await openai_client.embeddings.create(
+            model=embed_deployment if embed_deployment else embed_model,
+            input=texts[start : start + batch_size],
+            **dimensions_args,
+        )
+        vectors.extend(item.embedding for item in sorted(embedding.data, key=lambda item: item.index))
+    return vectors
@@ -0,0 +1,155 @@
+from collections.abc import Sequence
+from datetime import date
+from typing import Any, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+# Numeric columns of Abastecimento that the answer model should never have to add up by itself
+NUMERIC_COLUMNS = ("km_percorrido", "diesel", "km_diesel", "custo_combustivel", "preco_combustivel")
+
+# Robust z-score (median/MAD) above which a value is reported as an outlier
+OUTLIER_ZSCORE = 3.5
+MAX_OUTLIERS = 5
+
+
+class ColumnSummary(BaseModel):
+    column: str
+    count: int
+    total: float
+    mean: float
+    min: float
+    min_date: Optional[date] = None
+    max: float
+    max_date: Optional[date] = None
+    slope_per_day: Optional[float] = None
+
+
+class Outlier(BaseModel):
+    column: str
+    value: float
+    placa: Optional[str] = None
+    data: Optional[date] = None
+    zscore: float
+
+
+class FuelingSummary(BaseModel):
+    row_count: int
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    columns: list[ColumnSummary]
+    outliers: list[Outlier]
+
+    def to_prompt(self) -> str:
+        """Compact text block with the precomputed numbers, so the LLM does no arithmetic."""
+        if not self.row_count:
+            return "Sin registros."
+        lines = [f"Registros analizados: {self.row_count} (de {self.start_date} a {self.end_date})"]
+        for col in self.columns:
+            line = (
+                f"- {col.column}: n={col.count}, suma={col.total:.2f}, media={col.mean:.2f}, "
+                f"min={col.min:.2f} ({col.min_date}), max={col.max:.2f} ({col.max_date})"
+            )
+            if col.slope_per_day is not None:
+                line += f", tendencia={col.slope_per_day:+.4f}/día"
+            lines.append(line)
+        if self.outliers:
+            lines.append("Valores atípicos:")
+            for outlier in self.outliers:
+                lines.append(
+                    f"- {outlier.column}={outlier.value:.2f} placa {outlier.placa} el {outlier.data} "
+                    f"(z={outlier.zscore:+.1f})"
+                )
+        return "\n".join(lines)
+
+
+def _to_float(value: Any) -> float:
+    return float("nan") if value is None else float(value)
+
+
+def summarize_fueling_rows(rows: Sequence[Any], columns: Sequence[str] = NUMERIC_COLUMNS) -> FuelingSummary:
+    """
+    Computes count, sum, mean, min/max (with dates), linear trend and outliers for the numeric
+    columns of the given rows. Works with both Abastecimento and AbastecimentoPublic objects,
+    columns that are missing or entirely empty are left out of the summary.
+    """
+    if not rows:
+        return FuelingSummary(row_count=0, columns=[], outliers=[])
+
+    values = np.array([[_to_float(getattr(row, c, None)) for c in columns] for row in rows], dtype=np.float64)
+    dates = np.array([getattr(row, "data", None) for row in rows], dtype="datetime64[D]")
+    placas = [getattr(row, "placa", None) for row in rows]
+
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    has_data = count > 0
+    safe_count = np.maximum(count, 1)
+    total = np.where(valid, values, 0.0).sum(axis=0)
+    mean = total / safe_count
+    argmin = np.where(valid, values, np.inf).argmin(axis=0)
+    argmax = np.where(valid, values, -np.inf).argmax(axis=0)
+
+    # Least-squares slope of each column against the day number
+    date_valid = ~np.isnat(dates)
+    if date_valid.any():
+        days = (dates - dates[date_valid].min()).astype(np.float64)
+        start_date, end_date = dates[date_valid].min().item(), dates[date_valid].max().item()
+    else:
+        days = np.zeros(len(rows))
+        start_date = end_date = None
+    fit_mask = valid & date_valid[:, None]
+    fit_count = fit_mask.sum(axis=0)
+    safe_fit_count = np.maximum(fit_count, 1)
+    x = np.where(fit_mask, days[:, None], 0.0)
+    y = np.where(fit_mask, values, 0.0)
+    x_centered = np.where(fit_mask, x - x.sum(axis=0) / safe_fit_count, 0.0)
+    y_centered = np.where(fit_mask, y - y.sum(axis=0) / safe_fit_count, 0.0)
+    x_var = (x_centered**2).sum(axis=0)
+    slope = (x_centered * y_centered).sum(axis=0) / np.where(x_var > 0, x_var, 1.0)
+    slope_defined = (fit_count >= 2) & (x_var > 0)
+
+    # Robust z-scores based on the median absolute deviation
+    # (empty columns are filled with 0 to avoid medians over all-NaN slices)
+    filled = np.where(has_data, values, 0.0)
+    median = np.nanmedian(filled, axis=0)
+    mad = np.nanmedian(np.abs(filled - median), axis=0)
+    zscores = 0.6745 * (filled - median) / np.where(mad > 0, mad, np.inf)
+    zscores = np.where(valid, zscores, 0.0)
+    outlier_rows, outlier_cols = np.nonzero(np.abs(zscores) > OUTLIER_ZSCORE)
+    order = np.argsort(-np.abs(zscores[outlier_rows, outlier_cols]))[:MAX_OUTLIERS]
+
+    def date_at(index: int) -> Optional[date]:
+        return dates[index].item() if date_valid[index] else None
+
+    column_summaries = [
+        ColumnSummary(
+            column=column,
+            count=int(count[i]),
+            total=float(total[i]),
+            mean=float(mean[i]),
+            min=float(values[argmin[i], i]),
+            min_date=date_at(argmin[i]),
+            max=float(values[argmax[i], i]),
+            max_date=date_at(argmax[i]),
+            slope_per_day=float(slope[i]) if slope_defined[i] else None,
+        )
+        for i, column in enumerate(columns)
+        if has_data[i]
+    ]
+    outliers = [
+        Outlier(
+            column=columns[outlier_cols[j]],
+            value=float(values[outlier_rows[j], outlier_cols[j]]),
+            placa=placas[outlier_rows[j]],
+            data=date_at(outlier_rows[j]),
+            zscore=float(zscores[outlier_rows[j], outlier_cols[j]]),
+        )
+        for j in order
+    ]
+    return FuelingSummary(
+        row_count=len(rows),
+        start_date=start_date,
+        end_date=end_date,
+        columns=column_summaries,
+        outliers=outliers,
+    )
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from collections.abc import Awaitable
+from typing import Callable, Optional, TypeVar, Union
+
+import numpy as np
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+from fastapi_app.metrics import hedge_attempts, hedge_requests, hedge_wins
+
+logger = logging.getLogger("ragapp")
+
+T = TypeVar("T")
+
+# Máximo de hedges acumulables cuando hubo poco tráfico reciente
+HEDGE_BURST = 5.0
+
+
+class RequestHedger:
+    """
+    Hedging para llamadas idempotentes: si el primer intento no respondió tras el percentil observado
+    (p90 por defecto), lanza un segundo intento (opcionalmente a otro deployment), se queda con el primero
+    que termine y cancela al otro. Los hedges están limitados a `max_hedge_ratio` del tráfico.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 0.9,
+        max_hedge_ratio: float = 0.05,
+        hedge_deployment: Optional[str] = None,
+        initial_delay: float = 1.0,
+        min_delay: float = 0.02,
+        window: int = 512,
+        min_samples: int = 20,
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.hedge_deployment = hedge_deployment
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.hedge_credit = 0.0
+
+    def hedge_delay(self) -> float:
+        # Hasta tener suficientes muestras se usa el retardo inicial
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, float(np.percentile(self.latencies, self.percentile * 100)))
+
+    def take_hedge_credit(self) -> bool:
+        if self.hedge_credit < 1.0:
+            return False
+        self.hedge_credit -= 1.0
+        return True
+
+    async def run(self, call: Callable[[str], Awaitable[T]], model: str) -> T:
+        """
+        Ejecuta `call(model)` con hedging. El segundo intento usa `call(hedge_deployment or model)`.
+        """
+        attributes = {"call": self.name}
+        hedge_requests.add(1, attributes)
+        # Cada llamada suma max_hedge_ratio de crédito: los hedges nunca superan ese porcentaje del tráfico
+        self.hedge_credit = min(self.hedge_credit + self.max_hedge_ratio, HEDGE_BURST)
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        primary = asyncio.ensure_future(call(model))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if done or not self.take_hedge_credit():
+                result = await primary
+                self.latencies.append(loop.time() - started_at)
+                return result
+
+            hedge_attempts.add(1, attributes)
+            hedge = asyncio.ensure_future(call(self.hedge_deployment or model))
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            hedge_wins.add(1, attributes)
+                        self.latencies.append(loop.time() - started_at)
+                        return task.result()
+            # Fallaron los dos intentos: se propaga el error del primero
+            raise primary.exception()  # type: ignore[misc]
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+
+def client_for_deployment(
+    client: Union[AsyncOpenAI, AsyncAzureOpenAI], deployment: str
+) -> Union[AsyncOpenAI, AsyncAzureOpenAI]:
+    """
+    Los clientes de Azure creados con azure_deployment ignoran `model` al armar la URL:
+    para el hedge a otro deployment se usa una copia (que comparte el cliente HTTP) apuntada a ese deployment.
+    """
+    if isinstance(client, AsyncAzureOpenAI) and "/deployments/" in client.base_url.path:
+        base_url, pinned = str(client.base_url).rstrip("/").rsplit("/deployments/", 1)
+        if pinned != deployment:
+            return client.with_options(base_url=f"{base_url}/deployments/{deployment}")
+    return client
+
+
+def create_hedger_from_env(name: str, hedge_deployment_env: str) -> Optional[RequestHedger]:
+    """
+    Hedging opcional (OPENAI_HEDGING_ENABLED=true). Devuelve None si está desactivado.
+    """
+    if os.getenv("OPENAI_HEDGING_ENABLED", "false").lower() != "true":
+        return None
+    hedger = RequestHedger(
+        name,
+        percentile=float(os.getenv("OPENAI_HEDGE_PERCENTILE") or 0.9),
+        max_hedge_ratio=float(os.getenv("OPENAI_HEDGE_MAX_RATIO") or 0.05),
+        hedge_deployment=os.getenv(hedge_deployment_env) or None,
+    )
+    logger.info(
+        "Request hedging enabled for %s (p%d, max %.0f%% of calls, hedge deployment %s)",
+        name,
+        round(hedger.percentile * 100),
+        hedger.max_hedge_ratio * 100,
+        hedger.hedge_deployment or "same",
+    )
+    return hedger
@@ -0,0 +1,136 @@
+"""
+Transporte HTTP compartido por los clientes de chat y embeddings de OpenAI:
+un único pool de conexiones configurado desde el entorno, HTTP/2 opcional,
+métricas de espera en el pool y reutilización de conexiones, y un ping periódico
+que mantiene al menos una conexión abierta (sin volver a pagar TCP + TLS tras un rato inactivo).
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+from typing import Any, Optional
+
+import httpx
+
+from fastapi_app.metrics import http_pool_wait, http_requests
+
+logger = logging.getLogger("ragapp")
+
+# Eventos de httpcore que indican que la petición ya tiene una conexión asignada
+CONNECTION_READY_EVENTS = ("http11.send_request_headers.started", "http2.send_request_headers.started")
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Envuelve el transporte del pool y usa la extensión `trace` de httpcore para medir
+    cuánto esperó cada petición por una conexión y si reutilizó una ya abierta.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.requests_sent = 0
+        self.connections_reused = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        return self.connections_reused / self.requests_sent if self.requests_sent else 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        previous_trace = request.extensions.get("trace")
+        state = {"new_connection": False, "recorded": False}
+
+        async def trace(event_name: str, info: dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.started" and not state["recorded"]:
+                # Hay que abrir una conexión nueva: la espera en el pool termina aquí
+                state["new_connection"] = True
+                state["recorded"] = True
+                http_pool_wait.record((loop.time() - started_at) * 1000)
+            elif event_name in CONNECTION_READY_EVENTS and not state["recorded"]:
+                state["recorded"] = True
+                http_pool_wait.record((loop.time() - started_at) * 1000)
+            if previous_trace is not None:
+                await previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        response = await self.transport.handle_async_request(request)
+        self.requests_sent += 1
+        self.connections_reused += not state["new_connection"]
+        http_requests.add(1, {"connection_reused": not state["new_connection"]})
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_shared_transport() -> InstrumentedTransport:
+    """
+    Pool configurado con OPENAI_HTTP_MAX_CONNECTIONS, OPENAI_HTTP_MAX_KEEPALIVE,
+    OPENAI_HTTP_KEEPALIVE_EXPIRY (segundos) y OPENAI_HTTP2 (requiere el paquete opcional `h2`).
+    """
+    use_http2 = os.getenv("OPENAI_HTTP2", "false").lower() == "true"
+    if use_http2 and not http2_available():
+        logger.warning("OPENAI_HTTP2 is enabled but the 'h2' package is not installed, using HTTP/1.1")
+        use_http2 = False
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS") or 100),
+        max_keepalive_connections=int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE") or 20),
+        keepalive_expiry=float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY") or 120),
+    )
+    logger.info(
+        "Shared OpenAI HTTP pool: %d connections, %d keepalive for %.0fs, HTTP/2 %s",
+        limits.max_connections,
+        limits.max_keepalive_connections,
+        limits.keepalive_expiry,
+        "on" if use_http2 else "off",
+    )
+    # Con HTTP/2 las peticiones se multiplexan sobre la misma conexión si el endpoint lo negocia (ALPN)
+    return InstrumentedTransport(httpx.AsyncHTTPTransport(http2=use_http2, limits=limits))
+
+
+class ConnectionKeepalive:
+    """
+    Envía un HEAD liviano a cada endpoint cada `interval` segundos (menor que keepalive_expiry)
+    para que el pool conserve una conexión abierta. El código de estado no importa.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, urls: set[str], interval: float):
+        self.client = httpx.AsyncClient(transport=transport, timeout=10)
+        self.urls = urls
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    async def ping(self) -> None:
+        for url in self.urls:
+            try:
+                await self.client.head(url)
+            except httpx.HTTPError as error:
+                logger.debug("Keepalive ping to %s failed: %s", url, error)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.ping()
+
+    def start(self) -> None:
+        if self.interval > 0 and self.urls:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+def create_keepalive(transport: httpx.AsyncBaseTransport, urls: set[str]) -> ConnectionKeepalive:
+    """Ping periódico según OPENAI_HTTP_KEEPALIVE_INTERVAL (segundos, 0 lo desactiva)."""
+    return ConnectionKeepalive(transport, urls, float(os.getenv("OPENAI_HTTP_KEEPALIVE_INTERVAL") or 30))
@@ -0,0 +1,285 @@
+"""
+Carga masiva de exportaciones de abastecimiento (p. ej. abastecimentos.csv) en la tabla `abastecimento`.
+
+El CSV se lee en bloques; cada bloque se valida de forma vectorizada con numpy (fechas como `1-May-25`,
+números con punto decimal) en un hilo mientras el bloque anterior se envía con COPY
+(asyncpg copy_records_to_table) a una tabla temporal. Al final un único INSERT ... ON CONFLICT
+sobre la clave compuesta pasa los datos a `abastecimento` y se ejecuta ANALYZE.
+
+    python src/backend/fastapi_app/load_fueling_csv.py abastecimentos.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import itertools
+import logging
+import time
+from collections.abc import Iterator
+from datetime import date
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from fastapi_app.postgres_engine import create_postgres_engine_from_args, create_postgres_engine_from_env
+from fastapi_app.postgres_models import Abastecimento
+
+logger = logging.getLogger("ragapp")
+
+CHUNK_SIZE = 50_000
+STAGING_TABLE = "abastecimento_staging"
+# Columna del CSV -> columna de `abastecimento`
+CSV_COLUMNS = {
+    "Numero Veiculo": "id_veiculo",
+    "Placa": "placa",
+    "Data": "data",
+    "Km Percorrido": "km_percorrido",
+    "Diesel": "diesel",
+    "Km Diesel": "km_diesel",
+    "Custo Combustivel": "custo_combustivel",
+}
+# Orden de las columnas en los registros enviados con COPY (preco_combustivel se calcula como custo / diesel)
+COPY_COLUMNS = (
+    "id_veiculo",
+    "placa",
+    "data",
+    "km_percorrido",
+    "diesel",
+    "km_diesel",
+    "custo_combustivel",
+    "preco_combustivel",
+)
+KEY_COLUMNS = tuple(column.name for column in Abastecimento.__table__.primary_key.columns)
+# Independiente del locale, a diferencia de strptime("%b")
+MONTHS = {
+    name: number
+    for number, name in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1
+    )
+}
+MAX_LOGGED_ERRORS = 20
+
+
+class ParsedChunk(BaseModel):
+    records: list[tuple]
+    # (número de línea del CSV, motivo)
+    errors: list[tuple[int, str]]
+
+
+class LoadReport(BaseModel):
+    rows_read: int = 0
+    rows_rejected: int = 0
+    rows_inserted: int = 0
+    rows_updated: int = 0
+    duration_seconds: float = 0.0
+
+
+def parse_short_date(value: str) -> Optional[date]:
+    """`1-May-25` -> date(2025, 5, 1). Devuelve None si el valor no es una fecha válida."""
+    try:
+        day, month, year = value.strip().split("-")
+        return date(2000 + int(year) if len(year) == 2 else int(year), MONTHS[month.lower()[:3]], int(day))
+    except (ValueError, KeyError):
+        return None
+
+
+def parse_dates(values: np.ndarray) -> np.ndarray:
+    # Un export tiene pocas fechas distintas: se interpreta cada una una sola vez
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.array([parse_short_date(value) for value in uniques], dtype=object)[inverse]
+
+
+def parse_numbers(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Convierte una columna de texto a float64. Devuelve los valores y la máscara de valores vacíos o inválidos."""
+    values = np.char.strip(values)
+    try:
+        numbers = np.where(values == "", "nan", values).astype(np.float64)
+    except ValueError:
+        # Hay algún valor inválido en el bloque: solo entonces se recorre elemento por elemento
+        numbers = np.array([to_float(value) for value in values], dtype=np.float64)
+    return numbers, np.isnan(numbers)
+
+
+def to_float(value: str) -> float:
+    try:
+        return float(value) if value else float("nan")
+    except ValueError:
+        return float("nan")
+
+
+def number_strings(values: np.ndarray, missing: np.ndarray) -> list[Optional[str]]:
+    # Se envían como texto para que Postgres guarde el NUMERIC exacto que venía en el CSV
+    return np.where(missing, None, np.char.strip(values)).tolist()
+
+
+def parse_chunk(rows: list[list[str]], header: dict[str, int], first_line: int) -> ParsedChunk:
+    """Valida un bloque de filas del CSV. `first_line` es el número de línea de la primera fila."""
+    # Transpuesta en C; las filas cortas se completan con ""
+    transposed = list(itertools.zip_longest(*rows, fillvalue=""))
+    columns = {column: np.array(transposed[header[csv_name]], dtype=str) for csv_name, column in CSV_COLUMNS.items()}
+    id_veiculo = np.char.strip(columns["id_veiculo"])
+    placa = np.char.strip(columns["placa"])
+    dates = parse_dates(columns["data"])
+    km_percorrido, km_missing = parse_numbers(columns["km_percorrido"])
+    diesel, diesel_missing = parse_numbers(columns["diesel"])
+    km_diesel, km_diesel_missing = parse_numbers(columns["km_diesel"])
+    custo, custo_missing = parse_numbers(columns["custo_combustivel"])
+
+    # Las columnas de la clave primaria son obligatorias; las demás pueden quedar en NULL
+    checks = {
+        "missing Numero Veiculo": id_veiculo == "",
+        "invalid Data": dates == None,  # noqa: E711 (comparación elemento a elemento)
+        "invalid Km Percorrido": km_missing | (np.mod(np.nan_to_num(km_percorrido), 1) != 0),
+        "invalid Diesel": diesel_missing | (diesel < 0),
+    }
+    # Las líneas en blanco se descartan sin contarlas como errores
+    invalid = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows)) == 0
+    errors: list[tuple[int, str]] = []
+    for reason, mask in checks.items():
+        for index in np.flatnonzero(mask & ~invalid):
+            errors.append((first_line + int(index), reason))
+        invalid |= mask
+    errors.sort()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        preco = np.round(custo / diesel, 4)
+    preco_missing = custo_missing | diesel_missing | (diesel == 0)
+
+    valid = ~invalid
+    records = list(
+        zip(
+            id_veiculo[valid].tolist(),
+            np.where(placa == "", None, placa)[valid].tolist(),
+            dates[valid].tolist(),
+            km_percorrido[valid].astype(np.int64).tolist(),
+            number_strings(columns["diesel"][valid], diesel_missing[valid]),
+            number_strings(columns["km_diesel"][valid], km_diesel_missing[valid]),
+            number_strings(columns["custo_combustivel"][valid], custo_missing[valid]),
+            np.where(preco_missing, None, preco.astype(str))[valid].tolist(),
+        )
+    )
+    # model_construct: los registros ya están validados, no hace falta recorrerlos otra vez
+    return ParsedChunk.model_construct(records=records, errors=errors)
+
+
+def read_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[ParsedChunk]:
+    with open(path, newline="", encoding="utf-8-sig") as csv_file:
+        reader = csv.reader(csv_file)
+        header_row = next(reader)
+        header = {name.strip(): index for index, name in enumerate(header_row)}
+        missing = [name for name in CSV_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"{path} is missing the columns {missing}")
+        # La línea 1 es el encabezado
+        first_line = 2
+        while rows := list(itertools.islice(reader, chunk_size)):
+            yield parse_chunk(rows, header, first_line)
+            first_line += len(rows)
+
+
+def upsert_statement() -> str:
+    columns = ", ".join(COPY_COLUMNS)
+    keys = ", ".join(KEY_COLUMNS)
+    updated = [column for column in COPY_COLUMNS if column not in KEY_COLUMNS]
+    assignments = ", ".join(f"{column} = EXCLUDED.{column}" for column in updated)
+    current = ", ".join(f"{Abastecimento.__tablename__}.{column}" for column in updated)
+    incoming = ", ".join(f"EXCLUDED.{column}" for column in updated)
+    # DISTINCT ON: si el CSV repite una clave gana la última fila (ON CONFLICT no admite tocar una fila dos veces).
+    # El WHERE evita reescribir filas que no cambiaron (sin tuplas muertas ni trabajo extra para VACUUM).
+    return f"""
+        WITH upserted AS (
+            INSERT INTO {Abastecimento.__tablename__} ({columns})
+            SELECT DISTINCT ON ({keys}) {columns} FROM {STAGING_TABLE} ORDER BY {keys}, line DESC
+            ON CONFLICT ON CONSTRAINT abastecimento_pk DO UPDATE SET {assignments}
+            WHERE ({current}) IS DISTINCT FROM ({incoming})
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+    """
+
+
+async def load_fueling_csv(engine: AsyncEngine, path: Path, chunk_size: int = CHUNK_SIZE) -> LoadReport:
+    report = LoadReport()
+    started_at = time.perf_counter()
+    chunks = read_chunks(path, chunk_size)
+
+    def next_chunk() -> "asyncio.Future[Optional[ParsedChunk]]":
+        # El siguiente bloque se lee y valida en un hilo mientras el actual se envía con COPY
+        return asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                f"CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+                f"SELECT {', '.join(COPY_COLUMNS)}, 0::bigint AS line FROM {Abastecimento.__tablename__} WITH NO DATA"
+            )
+        )
+        driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+        pending = next_chunk()
+        while (chunk := await pending) is not None:
+            pending = next_chunk()
+            for line, reason in chunk.errors:
+                if report.rows_rejected < MAX_LOGGED_ERRORS:
+                    logger.warning("%s line %d rejected: %s", path.name, line, reason)
+                report.rows_rejected += 1
+            line_offset = report.rows_read
+            report.rows_read += len(chunk.records) + len(chunk.errors)
+            await driver_connection.copy_records_to_table(
+                STAGING_TABLE,
+                records=[(*record, line_offset + index) for index, record in enumerate(chunk.records)],
+                columns=[*COPY_COLUMNS, "line"],
+            )
+            logger.info("Copied %d rows into staging (%d rejected so far)", report.rows_read, report.rows_rejected)
+        report.rows_inserted, report.rows_updated = (await conn.execute(text(upsert_statement()))).one()
+
+    # Estadísticas al día para que el planner no siga usando las de la tabla antes de la carga
+    async with engine.connect() as conn:
+        await conn.execute(text(f"ANALYZE {Abastecimento.__tablename__}"))
+        await conn.commit()
+
+    report.duration_seconds = round(time.perf_counter() - started_at, 2)
+    logger.info(
+        "Loaded %s in %.1fs: %d rows read, %d rejected, %d inserted, %d updated",
+        path.name,
+        report.duration_seconds,
+        report.rows_read,
+        report.rows_rejected,
+        report.rows_inserted,
+        report.rows_updated,
+    )
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk load a fueling CSV export into the abastecimento table")
+    parser.add_argument("csv_path", type=Path, help="CSV export, e.g. abastecimentos.csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows validated and copied per chunk")
+    parser.add_argument("--host", type=str, help="Postgres host")
+    parser.add_argument("--username", type=str, help="Postgres username")
+    parser.add_argument("--password", type=str, help="Postgres password")
+    parser.add_argument("--database", type=str, help="Postgres database")
+    parser.add_argument("--sslmode", type=str, help="Postgres sslmode")
+    parser.add_argument("--tenant-id", type=str, help="Azure tenant ID", default=None)
+
+    # if no args are specified, use environment variables
+    args = parser.parse_args()
+    if args.host is None:
+        engine = await create_postgres_engine_from_env()
+    else:
+        engine = await create_postgres_engine_from_args(args)
+
+    await load_fueling_csv(engine, args.csv_path, args.chunk_size)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+    asyncio.run(main())
@@ -0,0 +1,284 @@
+"""
+Gestión de los índices vectoriales (HNSW/IVFFlat) sin cortar el servicio.
+
+Los índices se construyen con CREATE INDEX CONCURRENTLY (no bloquea escrituras), con maintenance_work_mem y
+max_parallel_maintenance_workers ajustados solo para esa sesión, y el avance se informa desde
+pg_stat_progress_create_index. Para cambiar parámetros se construye un índice nuevo al lado del actual,
+se intercambian los nombres en una transacción corta y el viejo se borra con DROP INDEX CONCURRENTLY.
+
+    python src/backend/fastapi_app/manage_indexes.py status
+    python src/backend/fastapi_app/manage_indexes.py build
+    python src/backend/fastapi_app/manage_indexes.py rebuild hnsw_abastecimento_main --m 24 --ef-construction 128
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from sqlalchemy import Index, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from fastapi_app.postgres_engine import create_postgres_engine_from_args, create_postgres_engine_from_env
+from fastapi_app.postgres_models import VECTOR_INDEXES
+
+logger = logging.getLogger("ragapp")
+
+MEMORY_SETTING = re.compile(r"^\d+\s*(kB|MB|GB|TB)?$")
+# Parámetros de construcción que acepta cada método de pgvector
+INDEX_PARAMETERS = {"hnsw": ("m", "ef_construction"), "ivfflat": ("lists",)}
+
+INDEX_STATUS_QUERY = """
+SELECT c.relname AS name, t.relname AS table_name, am.amname AS method, c.reloptions AS options,
+       pg_relation_size(c.oid) AS size_bytes, i.indisvalid AS valid
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_class t ON t.oid = i.indrelid
+JOIN pg_am am ON am.oid = c.relam
+WHERE am.amname IN ('hnsw', 'ivfflat')
+ORDER BY t.relname, c.relname
+"""
+
+PROGRESS_QUERY = """
+SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+FROM pg_stat_progress_create_index WHERE pid = :pid
+"""
+
+
+class IndexBuildSettings(BaseModel):
+    maintenance_work_mem: str = "1GB"
+    max_parallel_maintenance_workers: int = 4
+    # Segundos entre reportes de avance
+    progress_interval: float = 10.0
+    # Espera máxima por el lock del intercambio de nombres, y reintentos si se agota
+    lock_timeout: str = "5s"
+    swap_attempts: int = 5
+
+
+def declared_indexes() -> dict[str, Index]:
+    return {index.name: index for index in VECTOR_INDEXES}
+
+
+def check_index_parameters(index: Index, parameters: dict[str, Any]) -> None:
+    """Rechaza parámetros de otro método (p. ej. lists en un HNSW), que Postgres solo reportaría al construir."""
+    method = index.dialect_options["postgresql"]["using"]
+    invalid = [key for key in parameters if key not in INDEX_PARAMETERS.get(method, ())]
+    if invalid:
+        raise ValueError(
+            f"{', '.join(invalid)} not valid for {method} index {index.name}, "
+            f"valid parameters: {', '.join(INDEX_PARAMETERS.get(method, ()))}"
+        )
+
+
+def index_ddl(index: Index, name: Optional[str] = None, parameters: Optional[dict[str, Any]] = None) -> str:
+    """CREATE INDEX CONCURRENTLY de un índice declarado, con otro nombre o parámetros si se indican."""
+    check_index_parameters(index, parameters or {})
+    options = index.dialect_options["postgresql"]
+    columns = ", ".join(
+        f"{column.name} {options['ops'][column.name]}" if column.name in (options["ops"] or {}) else column.name
+        for column in index.expressions
+    )
+    ddl = f"CREATE INDEX CONCURRENTLY {name or index.name} ON {index.table.name} USING {options['using']} ({columns})"
+    parameters = {**(options["with"] or {}), **(parameters or {})}
+    if parameters:
+        ddl += f" WITH ({', '.join(f'{key} = {int(value)}' for key, value in parameters.items())})"
+    return ddl
+
+
+def format_progress(name: str, progress: dict[str, Any]) -> str:
+    # HNSW informa tuplas procesadas; otras fases solo bloques recorridos
+    for unit in ("tuples", "blocks"):
+        total = progress.get(f"{unit}_total")
+        if total:
+            done = progress[f"{unit}_done"]
+            return f"Building {name}: {progress['phase']}, {done}/{total} {unit} ({done / total:.0%})"
+    return f"Building {name}: {progress['phase']}"
+
+
+async def apply_build_settings(conn: AsyncConnection, settings: IndexBuildSettings) -> None:
+    if not MEMORY_SETTING.match(settings.maintenance_work_mem):
+        raise ValueError(f"Invalid maintenance_work_mem {settings.maintenance_work_mem!r}")
+    await conn.execute(
+        text("SELECT set_config('maintenance_work_mem', :value, false)"), {"value": settings.maintenance_work_mem}
+    )
+    await conn.execute(
+        text("SELECT set_config('max_parallel_maintenance_workers', :value, false)"),
+        {"value": str(settings.max_parallel_maintenance_workers)},
+    )
+
+
+async def report_progress(engine: AsyncEngine, pid: int, name: str, interval: float) -> None:
+    async with engine.connect() as conn:
+        while True:
+            await asyncio.sleep(interval)
+            row = (await conn.execute(text(PROGRESS_QUERY), {"pid": pid})).mappings().first()
+            # Cada consulta en su propia transacción, para ver el avance actualizado
+            await conn.rollback()
+            if row is not None:
+                logger.info(format_progress(name, dict(row)))
+
+
+async def drop_index(engine: AsyncEngine, name: str) -> None:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+async def build_index(engine: AsyncEngine, ddl: str, name: str, settings: IndexBuildSettings) -> None:
+    async with engine.connect() as conn:
+        # CONCURRENTLY no puede correr dentro de una transacción
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await apply_build_settings(conn, settings)
+        pid = (await conn.execute(text("SELECT pg_backend_pid()"))).scalar_one()
+        logger.info(
+            "Building %s with maintenance_work_mem=%s and %d parallel workers",
+            name,
+            settings.maintenance_work_mem,
+            settings.max_parallel_maintenance_workers,
+        )
+        monitor = asyncio.create_task(report_progress(engine, pid, name, settings.progress_interval))
+        try:
+            await conn.execute(text(ddl))
+        except BaseException:
+            # Un CREATE INDEX CONCURRENTLY fallido deja un índice inválido que igual se mantiene en cada escritura
+            monitor.cancel()
+            await asyncio.shield(drop_index(engine, name))
+            raise
+        finally:
+            monitor.cancel()
+    logger.info("Index %s built", name)
+
+
+async def index_status(engine: AsyncEngine) -> list[dict[str, Any]]:
+    async with engine.connect() as conn:
+        return [dict(row) for row in (await conn.execute(text(INDEX_STATUS_QUERY))).mappings()]
+
+
+async def build_missing_indexes(engine: AsyncEngine, settings: IndexBuildSettings) -> list[str]:
+    """Construye los índices declarados que no existen (o quedaron inválidos). Devuelve sus nombres."""
+    existing = {row["name"]: row["valid"] for row in await index_status(engine)}
+    built = []
+    for name, index in declared_indexes().items():
+        if existing.get(name):
+            continue
+        if name in existing:
+            logger.warning("Index %s is invalid (failed build), dropping it", name)
+            await drop_index(engine, name)
+        await build_index(engine, index_ddl(index), name, settings)
+        built.append(name)
+    return built
+
+
+async def swap_indexes(engine: AsyncEngine, name: str, new_name: str, settings: IndexBuildSettings) -> None:
+    """Da al índice nuevo el nombre del actual en una transacción corta y borra el viejo."""
+    old_name = f"{name}_old"
+    for attempt in range(1, settings.swap_attempts + 1):
+        try:
+            async with engine.begin() as conn:
+                # Si hay una transacción larga usando la tabla, mejor fallar rápido y reintentar que encolar a todos
+                await conn.execute(
+                    text("SELECT set_config('lock_timeout', :value, true)"), {"value": settings.lock_timeout}
+                )
+                await conn.execute(text(f"ALTER INDEX {name} RENAME TO {old_name}"))
+                await conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {name}"))
+            break
+        except DBAPIError as error:
+            if attempt == settings.swap_attempts:
+                raise
+            logger.warning("Swap of %s failed (attempt %d): %s, retrying", name, attempt, error.orig)
+            await asyncio.sleep(attempt)
+    await drop_index(engine, old_name)
+    logger.info("Index %s swapped for the rebuilt one", name)
+
+
+async def rebuild_index(
+    engine: AsyncEngine, name: str, parameters: dict[str, Any], settings: IndexBuildSettings
+) -> None:
+    """Construye `<nombre>_new` con los parámetros nuevos al lado del actual y los intercambia."""
+    index = declared_indexes().get(name)
+    if index is None:
+        raise ValueError(f"Unknown vector index {name}, declared indexes: {', '.join(declared_indexes())}")
+    # Antes de borrar restos o construir nada
+    check_index_parameters(index, parameters)
+    new_name = f"{name}_new"
+    # Restos de una reconstrucción anterior interrumpida
+    await drop_index(engine, new_name)
+    await drop_index(engine, f"{name}_old")
+    await build_index(engine, index_ddl(index, new_name, parameters), new_name, settings)
+    if not any(row["name"] == name for row in await index_status(engine)):
+        async with engine.begin() as conn:
+            await conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {name}"))
+    else:
+        await swap_indexes(engine, name, new_name, settings)
+    if parameters:
+        logger.info("Update the parameters of %s in postgres_models.py to %s to keep them", name, parameters)
+
+
+def print_status(rows: list[dict[str, Any]]) -> None:
+    for row in rows:
+        print(
+            f"{row['table_name']:<15} {row['name']:<30} {row['method']:<8} {','.join(row['options'] or []):<30} "
+            f"{row['size_bytes'] / 1024**2:>10.1f} MB {'' if row['valid'] else 'INVALID'}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build, rebuild and inspect the vector indexes")
+    parser.add_argument("--host", type=str, help="Postgres host")
+    parser.add_argument("--username", type=str, help="Postgres username")
+    parser.add_argument("--password", type=str, help="Postgres password")
+    parser.add_argument("--database", type=str, help="Postgres database")
+    parser.add_argument("--sslmode", type=str, help="Postgres sslmode")
+    parser.add_argument("--tenant-id", type=str, help="Azure tenant ID", default=None)
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="maintenance_work_mem for the builds")
+    parser.add_argument("--parallel-workers", type=int, default=4, help="max_parallel_maintenance_workers")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Seconds between progress reports")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="List the vector indexes with their parameters and size")
+    commands.add_parser("build", help="Build the declared indexes that are missing or invalid")
+    rebuild = commands.add_parser("rebuild", help="Rebuild an index alongside the current one and swap them")
+    rebuild.add_argument("index", choices=list(declared_indexes()), help="Index to rebuild")
+    rebuild.add_argument("--m", type=int, help="HNSW m")
+    rebuild.add_argument("--ef-construction", type=int, help="HNSW ef_construction")
+    rebuild.add_argument("--lists", type=int, help="IVFFlat lists")
+
+    # if no args are specified, use environment variables
+    args = parser.parse_args()
+    parameters = {}
+    if args.command == "rebuild":
+        parameters = {"m": args.m, "ef_construction": args.ef_construction, "lists": args.lists}
+        parameters = {key: value for key, value in parameters.items() if value is not None}
+        try:
+            check_index_parameters(declared_indexes()[args.index], parameters)
+        except ValueError as error:
+            parser.error(str(error))
+    if args.host is None:
+        engine = await create_postgres_engine_from_env()
+    else:
+        engine = await create_postgres_engine_from_args(args)
+
+    settings = IndexBuildSettings(
+        maintenance_work_mem=args.maintenance_work_mem,
+        max_parallel_maintenance_workers=args.parallel_workers,
+        progress_interval=args.progress_interval,
+    )
+    try:
+        if args.command == "status":
+            print_status(await index_status(engine))
+        elif args.command == "build":
+            await build_missing_indexes(engine, settings)
+        else:
+            await rebuild_index(engine, args.index, parameters, settings)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    load_dotenv(override=True)
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+Métricas de la aplicación (OpenTelemetry).
+Si no hay un MeterProvider configurado (p. ej. sin Application Insights) los instrumentos son no-op.
+"""
+
+from opentelemetry import metrics
+
+meter = metrics.get_meter("ragapp")
+
+# Streams de /chat/stream cortados antes de terminar (cliente desconectado o tarea cancelada)
+chat_stream_cancellations = meter.create_counter(
+    "ragapp.chat_stream.cancellations",
+    unit="1",
+    description="Chat streams cancelled before completion because the client went away",
+)
+
+# Hedging de llamadas idempotentes a OpenAI (atributo "call": "embeddings" o "rewrite")
+hedge_requests = meter.create_counter(
+    "ragapp.hedge.requests", unit="1", description="Calls that went through a request hedger"
+)
+hedge_attempts = meter.create_counter(
+    "ragapp.hedge.attempts", unit="1", description="Second attempts fired because the first one was slow"
+)
+hedge_wins = meter.create_counter(
+    "ragapp.hedge.wins", unit="1", description="Hedged calls where the second attempt answered first"
+)
+
+# Control de admisión de las llamadas a OpenAI (atributo "budget": "chat", "embed" o "background_embed")
+openai_admission_wait = meter.create_histogram(
+    "ragapp.openai.admission.wait", unit="ms", description="Time a call waited for quota and concurrency"
+)
+openai_admission_shed = meter.create_counter(
+    "ragapp.openai.admission.shed", unit="1", description="Calls rejected locally before reaching OpenAI"
+)
+openai_throttled = meter.create_counter(
+    "ragapp.openai.throttled", unit="1", description="429 responses received from OpenAI"
+)
+
+# Pool de conexiones HTTP compartido por los clientes de OpenAI
+http_pool_wait = meter.create_histogram(
+    "ragapp.http.pool_wait", unit="ms", description="Time until a request got a connection from the shared pool"
+)
+http_requests = meter.create_counter(
+    "ragapp.http.requests",
+    unit="1",
+    description="Requests sent through the shared pool, by whether they reused an open connection",
+)
+
+# Pool de conexiones de Postgres (atributo "pool": "primary" o el nombre de la réplica)
+db_pool_checkout = meter.create_histogram(
+    "ragapp.db.pool.checkout", unit="ms", description="Time to check out a connection from the pool"
+)
+db_pool_overflow = meter.create_counter(
+    "ragapp.db.pool.overflow", unit="1", description="Connections opened beyond pool_size (overflow)"
+)
+db_pool_timeouts = meter.create_counter(
+    "ragapp.db.pool.timeouts", unit="1", description="Checkouts that gave up after pool_timeout"
+)
+
+# Warm-up al arrancar (atributo "step": connections, embeddings, queries, prewarm, tokenizer)
+warmup_duration = meter.create_histogram(
+    "ragapp.warmup.duration", unit="ms", description="Duration of the startup warm-up and of each of its steps"
+)
+
+# Ruteo de lecturas (atributo "target": el host de la réplica o "primary" cuando no hay réplica disponible)
+db_reads = meter.create_counter(
+    "ragapp.db.reads", unit="1", description="Read sessions handed out, by the database that serves them"
+)
+
+# Worker de embeddings disparado por LISTEN/NOTIFY (atributo "table")
+embedding_worker_rows = meter.create_counter(
+    "ragapp.embedding_worker.rows", unit="1", description="Dirty rows whose embedding the worker brought up to date"
+)
+embedding_worker_lag = meter.create_histogram(
+    "ragapp.embedding_worker.lag",
+    unit="s",
+    description="Time from a row being marked dirty until its embedding was written",
+)
+embedding_worker_failures = meter.create_counter(
+    "ragapp.embedding_worker.failures", unit="1", description="Worker batches that failed and will be retried"
+)
@@ -1,17 +1,26 @@
 import logging
 import os
-from typing import Union
+from typing import Optional, Union
 
 import azure.identity
+import httpx
 import openai
 
+from fastapi_app.openai_limiter import create_admission_transport
+
 logger = logging.getLogger("ragapp")
 
 
 async def create_openai_chat_client(
     azure_credential: Union[azure.identity.AzureDeveloperCliCredential, azure.identity.ManagedIdentityCredential, None],
+    shared_transport: Optional[httpx.AsyncBaseTransport] = None,
 ) -> Union[openai.AsyncAzureOpenAI, openai.AsyncOpenAI]:
+    """
+    `shared_transport` es el pool de conexiones compartido con el cliente de embeddings (ver http_transport).
+    """
     openai_chat_client: Union[openai.AsyncAzureOpenAI, openai.AsyncOpenAI]
+    # Las llamadas pasan por el control de admisión del presupuesto de chat interactivo
+    http_client = openai.DefaultAsyncHttpxClient(transport=create_admission_transport("chat", shared_transport))
     OPENAI_CHAT_HOST = os.getenv("OPENAI_CHAT_HOST")
     if OPENAI_CHAT_HOST == "azure":
         api_version = os.environ["AZURE_OPENAI_VERSION"] or "2024-10-21"
@@ -28,6 +37,7 @@ async def create_openai_chat_client(
                 azure_endpoint=azure_endpoint,
                 azure_deployment=azure_deployment,
                 api_key=api_key,
+                http_client=http_client,
             )
         elif azure_credential:
             logger.info(
@@ -43,6 +53,7 @@ async def create_openai_chat_client(
                 azure_endpoint=azure_endpoint,
                 azure_deployment=azure_deployment,
                 azure_ad_token_provider=token_provider,
+                http_client=http_client,
             )
         else:
             raise ValueError("Azure OpenAI client requires either an API key or Azure Identity credential.")
@@ -51,6 +62,7 @@ async def create_openai_chat_client(
         openai_chat_client = openai.AsyncOpenAI(
             base_url=os.getenv("OLLAMA_ENDPOINT"),
             api_key="nokeyneeded",
+            http_client=http_client,
         )
     elif OPENAI_CHAT_HOST == "github":
         logger.info("Setting up OpenAI client for chat completions using GitHub Models")
@@ -60,18 +72,29 @@ async def create_openai_chat_client(
         openai_chat_client = openai.AsyncOpenAI(
             base_url=github_base_url,
             api_key=os.getenv("GITHUB_TOKEN"),
+            http_client=http_client,
         )
     else:
         logger.info("Setting up OpenAI client for chat completions using OpenAI.com API key")
-        openai_chat_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAICOM_KEY"))
+        openai_chat_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAICOM_KEY"), http_client=http_client)
 
     return openai_chat_client
 
 
 async def create_openai_embed_client(
     azure_credential: Union[azure.identity.AzureDeveloperCliCredential, azure.identity.ManagedIdentityCredential, None],
+    background: bool = False,
+    shared_transport: Optional[httpx.AsyncBaseTransport] = None,
 ) -> Union[openai.AsyncAzureOpenAI, openai.AsyncOpenAI]:
+    """
+    `background=True` para trabajos por lotes (p. ej. regenerar embeddings): usan su propio presupuesto
+    de cuota para no competir con las búsquedas interactivas.
+    `shared_transport` es el pool de conexiones compartido con el cliente de chat (ver http_transport).
+    """
     openai_embed_client: Union[openai.AsyncAzureOpenAI, openai.AsyncOpenAI]
+    http_client = openai.DefaultAsyncHttpxClient(
+        transport=create_admission_transport("background_embed" if background else "embed", shared_transport)
+    )
     OPENAI_EMBED_HOST = os.getenv("OPENAI_EMBED_HOST")
     if OPENAI_EMBED_HOST == "azure":
         api_version = os.environ["AZURE_OPENAI_VERSION"] or "2024-03-01-preview"
@@ -88,6 +111,7 @@ async def create_openai_embed_client(
                 azure_endpoint=azure_endpoint,
                 azure_deployment=azure_deployment,
                 api_key=api_key,
+                http_client=http_client,
             )
         elif azure_credential:
             logger.info(
@@ -103,6 +127,7 @@ async def create_openai_embed_client(
                 azure_endpoint=azure_endpoint,
                 azure_deployment=azure_deployment,
                 azure_ad_token_provider=token_provider,
+                http_client=http_client,
             )
         else:
             raise ValueError("Azure OpenAI client requires either an API key or Azure Identity credential.")
@@ -111,6 +136,7 @@ async def create_openai_embed_client(
         openai_embed_client = openai.AsyncOpenAI(
             base_url=os.getenv("OLLAMA_ENDPOINT"),
             api_key="nokeyneeded",
+            http_client=http_client,
         )
     elif OPENAI_EMBED_HOST == "github":
         logger.info("Setting up OpenAI client for embeddings using GitHub Models")
@@ -120,8 +146,9 @@ async def create_openai_embed_client(
         openai_embed_client = openai.AsyncOpenAI(
             base_url=github_base_url,
             api_key=os.getenv("GITHUB_TOKEN"),
+            http_client=http_client,
         )
     else:
         logger.info("Setting up OpenAI client for embeddings using OpenAI.com API key")
-        openai_embed_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAICOM_KEY"))
+        openai_embed_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAICOM_KEY"), http_client=http_client)
     return openai_embed_client
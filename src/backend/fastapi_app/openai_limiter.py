@@ -0,0 +1,401 @@
+"""
+Control de admisión para las llamadas a OpenAI, como transporte httpx de los clientes del SDK.
+
+La cuota la aplica Azure OpenAI por deployment, así que cada deployment tiene sus token buckets
+para peticiones y tokens estimados por minuto y su límite de concurrencia AIMD, que baja a la mitad
+con cada 429 (o latencia por encima del objetivo) y sube de a poco con cada éxito. Los comparten todos
+los clientes del proceso: chat, embeddings interactivos, embeddings en segundo plano y los hedges a otro
+deployment se descuentan del deployment al que va cada petición.
+
+El presupuesto (chat, embed, background_embed) es la prioridad sobre esa cuota: los interactivos
+reservan de inmediato, mientras que los de segundo plano solo usan la parte de la cuota y de la
+concurrencia que dejan libre (`{PREFIJO}_SHARE`). Las peticiones que no entran dentro del plazo de
+su presupuesto se rechazan localmente con un 429 que el SDK no reintenta.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import weakref
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, Optional
+
+import httpx
+
+from fastapi_app.metrics import openai_admission_shed, openai_admission_wait, openai_throttled
+from fastapi_app.token_estimates import estimate_tokens
+
+logger = logging.getLogger("ragapp")
+
+# Prefijo de las variables de entorno de cada presupuesto
+BUDGET_ENV_PREFIXES = {
+    "chat": "OPENAI_CHAT",
+    "embed": "OPENAI_EMBED",
+    "background_embed": "OPENAI_BACKGROUND_EMBED",
+}
+# Plazo por defecto en la cola: corto para tráfico interactivo, largo para trabajos en segundo plano
+DEFAULT_QUEUE_TIMEOUTS = {"chat": 5.0, "embed": 5.0, "background_embed": 120.0}
+# Fracción de la cuota y de la concurrencia de un deployment que puede usar cada presupuesto
+DEFAULT_SHARES = {"chat": 1.0, "embed": 1.0, "background_embed": 0.5}
+# Prefijo de las variables de entorno de cada deployment: OPENAI_DEPLOYMENT_<NOMBRE>_RPM, ..._TPM, etc.
+DEPLOYMENT_ENV_PREFIX = "OPENAI_DEPLOYMENT"
+DEPLOYMENT_PATH = re.compile(r"/deployments/([^/]+)/")
+# Tokens de respuesta supuestos cuando la petición de chat no fija max_tokens
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+class TokenBucket:
+    """
+    Token bucket con reservas: se descuenta al pedir (el saldo puede quedar negativo) y se devuelve
+    cuánto hay que esperar hasta que la reserva esté cubierta. La capacidad equivale a una ventana
+    de `window_seconds`, como las ventanas cortas con las que Azure OpenAI aplica la cuota por minuto.
+    """
+
+    def __init__(self, per_minute: float, window_seconds: float = 10.0):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * window_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def clamp(self, amount: float) -> float:
+        return min(amount, self.capacity)
+
+    def reserve(self, amount: float) -> float:
+        self._refill()
+        self.tokens -= self.clamp(amount)
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + self.clamp(amount))
+
+    def wait_above(self, amount: float, share: float) -> float:
+        """
+        Para presupuestos de menor prioridad: cuánto esperar hasta que `amount` entre sin bajar el saldo
+        de la parte reservada a los demás (`1 - share` de la capacidad). 0 si ya entra; no descuenta nada.
+        """
+        self._refill()
+        floor = (1 - share) * self.capacity
+        needed = floor + min(amount, self.capacity - floor)
+        return max(0.0, (needed - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.tokens -= self.clamp(amount)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Límite de concurrencia AIMD: +1/limit por cada respuesta sana (≈ +1 por ronda),
+    x`backoff` ante un 429 o una latencia por encima de `latency_target` (como mucho una vez por `cooldown`).
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 32,
+        min_limit: int = 1,
+        backoff: float = 0.5,
+        latency_target: Optional[float] = None,
+        cooldown: float = 1.0,
+    ):
+        self.limit = float(max_limit)
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, timeout: float, share: float = 1.0) -> bool:
+        """Espera un cupo; con `share` < 1 solo entra mientras haya menos de `share` del límite en vuelo."""
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self.in_flight < max(1, int(self.limit * share))),
+                    max(timeout, 0.0),
+                )
+            except asyncio.TimeoutError:
+                return False
+            self.in_flight += 1
+            return True
+
+    async def release(self) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        if self.latency_target is not None and latency > self.latency_target:
+            self.decrease()
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def decrease(self) -> None:
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+
+
+class DeploymentLimiter:
+    """Cuota y concurrencia de un deployment, compartidas por todos los presupuestos que lo usan."""
+
+    def __init__(
+        self,
+        requests_bucket: Optional[TokenBucket] = None,
+        tokens_bucket: Optional[TokenBucket] = None,
+        concurrency: Optional[AdaptiveConcurrencyLimit] = None,
+    ):
+        self.requests_bucket = requests_bucket
+        self.tokens_bucket = tokens_bucket
+        self.concurrency = concurrency or AdaptiveConcurrencyLimit()
+
+    @classmethod
+    def from_env(cls, deployment: str) -> "DeploymentLimiter":
+        """
+        Configurado con OPENAI_DEPLOYMENT_<NOMBRE>_RPM, _TPM, _MAX_CONCURRENCY y _LATENCY_TARGET (segundos),
+        donde <NOMBRE> es el deployment (o modelo) en mayúsculas y con `_` en lugar de otros símbolos.
+        Sin RPM/TPM solo se aplica el límite de concurrencia adaptativo.
+        """
+        prefix = f"{DEPLOYMENT_ENV_PREFIX}_{re.sub(r'[^A-Z0-9]', '_', deployment.upper())}"
+        rpm = os.getenv(f"{prefix}_RPM")
+        tpm = os.getenv(f"{prefix}_TPM")
+        latency_target = os.getenv(f"{prefix}_LATENCY_TARGET")
+        return cls(
+            requests_bucket=TokenBucket(float(rpm)) if rpm else None,
+            tokens_bucket=TokenBucket(float(tpm)) if tpm else None,
+            concurrency=AdaptiveConcurrencyLimit(
+                max_limit=int(os.getenv(f"{prefix}_MAX_CONCURRENCY") or 32),
+                latency_target=float(latency_target) if latency_target else None,
+            ),
+        )
+
+
+class DeploymentLimiters:
+    """Un DeploymentLimiter por deployment, creado desde el entorno la primera vez que se usa."""
+
+    def __init__(self, limiters: Optional[dict[str, DeploymentLimiter]] = None):
+        self.limiters = dict(limiters or {})
+
+    def get(self, deployment: str) -> DeploymentLimiter:
+        if deployment not in self.limiters:
+            self.limiters[deployment] = DeploymentLimiter.from_env(deployment)
+        return self.limiters[deployment]
+
+
+# Las Condition de asyncio no se pueden usar desde otro event loop: un registro por loop
+_shared_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, DeploymentLimiters]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def shared_limiters() -> DeploymentLimiters:
+    """Los límites por deployment compartidos por todos los clientes del event loop actual."""
+    loop = asyncio.get_running_loop()
+    if loop not in _shared_limiters:
+        _shared_limiters[loop] = DeploymentLimiters()
+    return _shared_limiters[loop]
+
+
+def request_body(request: httpx.Request) -> dict[str, Any]:
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def request_deployment(request: httpx.Request) -> str:
+    """El deployment de Azure OpenAI de la URL o, en OpenAI y compatibles, el modelo del cuerpo."""
+    if match := DEPLOYMENT_PATH.search(request.url.path):
+        return match.group(1)
+    return str(request_body(request).get("model") or "default")
+
+
+def estimate_request_tokens(request: httpx.Request) -> int:
+    """Tokens estimados de una petición de chat o embeddings a partir del cuerpo JSON."""
+    body = request_body(request)
+    if not body:
+        return 1
+    if "messages" in body:
+        prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) for message in body["messages"])
+        completion_tokens = body.get("max_tokens") or body.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+        return prompt_tokens + int(completion_tokens)
+    inputs = body.get("input")
+    if isinstance(inputs, list):
+        return sum(estimate_tokens(str(item)) for item in inputs)
+    return estimate_tokens(str(inputs or ""))
+
+
+class ReleasingStream(httpx.AsyncByteStream):
+    """Cuerpo de respuesta que libera el cupo de concurrencia al cerrarse (los streams de chat lo retienen)."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], Awaitable[None]]):
+        self.stream = stream
+        self.release = release
+        self.released = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.released:
+                self.released = True
+                await self.release()
+
+
+class AdmissionControlTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        budget: str,
+        limiters: Optional[DeploymentLimiters] = None,
+        share: float = 1.0,
+        queue_timeout: float = 5.0,
+        close_transport: bool = True,
+    ):
+        self.transport = transport
+        self.budget = budget
+        # Sin registro propio se usan los límites compartidos por todos los clientes del proceso
+        self._limiters = limiters
+        self.share = share
+        self.queue_timeout = queue_timeout
+        # Un transporte compartido entre clientes lo cierra quien lo creó
+        self.close_transport = close_transport
+
+    @property
+    def limiters(self) -> DeploymentLimiters:
+        return self._limiters if self._limiters is not None else shared_limiters()
+
+    def shed(self, request: httpx.Request, deployment: str, limit: str, reason: str) -> httpx.Response:
+        openai_admission_shed.add(1, {"budget": self.budget, "deployment": deployment, "limit": limit})
+        logger.warning("Shedding OpenAI %s request to %s: %s", self.budget, deployment, reason)
+        # x-should-retry: false evita que el SDK reintente y vuelva a hacer cola
+        return httpx.Response(
+            429,
+            headers={"x-should-retry": "false"},
+            json={
+                "error": {
+                    "message": f"Request rejected by local admission control ({self.budget}, {deployment}): {reason}",
+                    "type": "rate_limit_exceeded",
+                    "code": "local_admission_control",
+                }
+            },
+            request=request,
+        )
+
+    async def reserve_quota(self, amounts: list[tuple[TokenBucket, float]], deadline: float) -> Optional[float]:
+        """
+        Descuenta `amounts` de los buckets del deployment y espera a que la reserva esté cubierta.
+        Los presupuestos con prioridad completa reservan enseguida; los de `share` < 1 esperan a que
+        sobre cuota por encima de la parte reservada a los demás. Devuelve None si se descontó,
+        o la espera que no entraba en el plazo (y no descuenta nada).
+        """
+        loop = asyncio.get_running_loop()
+        if self.share >= 1:
+            wait = 0.0
+            for bucket, amount in amounts:
+                wait = max(wait, bucket.reserve(amount))
+            if loop.time() + wait > deadline:
+                for bucket, amount in amounts:
+                    bucket.refund(amount)
+                return wait
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                for bucket, amount in amounts:
+                    bucket.refund(amount)
+                raise
+            return None
+        while True:
+            wait = max((bucket.wait_above(amount, self.share) for bucket, amount in amounts), default=0.0)
+            if wait == 0:
+                for bucket, amount in amounts:
+                    bucket.take(amount)
+                return None
+            if loop.time() + wait > deadline:
+                return wait
+            await asyncio.sleep(wait)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        deadline = started_at + self.queue_timeout
+        deployment = request_deployment(request)
+        limiter = self.limiters.get(deployment)
+        attributes = {"budget": self.budget, "deployment": deployment}
+
+        # 1. Cuota del deployment, con la prioridad del presupuesto; si la espera no entra en el plazo se rechaza ya
+        amounts = [
+            (bucket, amount)
+            for bucket, amount in (
+                (limiter.requests_bucket, 1),
+                (limiter.tokens_bucket, estimate_request_tokens(request)),
+            )
+            if bucket is not None
+        ]
+        wait = await self.reserve_quota(amounts, deadline)
+        if wait is not None:
+            return self.shed(request, deployment, "quota", f"quota exhausted, next slot in {wait:.1f}s")
+
+        # 2. Concurrencia adaptativa del deployment
+        concurrency = limiter.concurrency
+        if not await concurrency.acquire(deadline - loop.time(), self.share):
+            for bucket, amount in amounts:
+                bucket.refund(amount)
+            return self.shed(request, deployment, "concurrency", f"{concurrency.in_flight} requests in flight")
+        openai_admission_wait.record((loop.time() - started_at) * 1000, attributes)
+
+        sent_at = loop.time()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            await concurrency.release()
+            raise
+        if response.status_code == 429:
+            openai_throttled.add(1, attributes)
+            concurrency.decrease()
+        else:
+            concurrency.on_success(loop.time() - sent_at)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=ReleasingStream(response.stream, concurrency.release),  # type: ignore[arg-type]
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        if self.close_transport:
+            await self.transport.aclose()
+
+
+def create_admission_transport(
+    budget: str, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> AdmissionControlTransport:
+    """
+    Transporte con control de admisión para un presupuesto, con su prioridad configurada con
+    {PREFIJO}_SHARE y {PREFIJO}_QUEUE_TIMEOUT. La cuota y la concurrencia son las de cada deployment
+    (ver DeploymentLimiter.from_env), compartidas con los demás clientes del proceso.
+    Si se pasa `transport` (p. ej. el pool compartido) no se cierra junto con el cliente.
+    """
+    prefix = BUDGET_ENV_PREFIXES[budget]
+    return AdmissionControlTransport(
+        transport or httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100)),
+        budget,
+        share=float(os.getenv(f"{prefix}_SHARE") or DEFAULT_SHARES[budget]),
+        queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT") or DEFAULT_QUEUE_TIMEOUTS[budget]),
+        close_transport=transport is None,
+    )
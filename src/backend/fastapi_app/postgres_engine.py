@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import Optional
 
 from azure.identity import AzureDeveloperCliCredential
 from pgvector.asyncpg import register_vector
@@ -8,22 +9,44 @@ from sqlalchemy.engine import AdaptedConnection
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from fastapi_app.dependencies import get_azure_credential
+from fastapi_app.postgres_pool import PoolSettings, log_pool_settings
+from fastapi_app.postgres_token import CachedTokenProvider
 
 logger = logging.getLogger("ragapp")
 
-
-async def create_postgres_engine(*, host, username, database, password, sslmode, azure_credential) -> AsyncEngine:
-    def get_password_from_azure_credential():
-        token = azure_credential.get_token("https://ossrdbms-aad.database.windows.net/.default")
-        return token.token
-
-    token_based_password = False
-    if False :#host.endswith(".database.azure.com")
-        token_based_password = True
+AZURE_POSTGRES_SUFFIX = ".database.azure.com"
+
+
+def uses_entra_auth(host: str, password: Optional[str]) -> bool:
+    """
+    Token de Entra solo para un servidor de Azure sin contraseña configurada, o si se pide con
+    POSTGRES_ENTRA_AUTH=true. Con contraseña (como en run_app_linux.py) se autentica con ella.
+    """
+    if not host.endswith(AZURE_POSTGRES_SUFFIX):
+        return False
+    return not password or os.getenv("POSTGRES_ENTRA_AUTH", "").lower() in ("1", "true", "yes", "on")
+
+
+async def create_postgres_engine(
+    *,
+    host,
+    username,
+    database,
+    password,
+    sslmode,
+    azure_credential,
+    pool_settings: Optional[PoolSettings] = None,
+    pool_name: str = "primary",
+) -> AsyncEngine:
+    token_provider: Optional[CachedTokenProvider] = None
+    if uses_entra_auth(host, password):
         logger.info("Authenticating to Azure Database for PostgreSQL using Azure Identity...")
         if azure_credential is None:
             raise ValueError("Azure credential must be provided for Azure Database for PostgreSQL")
-        password = get_password_from_azure_credential()
+        # El token se obtiene una vez aquí y luego se renueva en segundo plano antes de vencer
+        token_provider = CachedTokenProvider(azure_credential)
+        await token_provider.start()
+        password = token_provider.token
     else:
         logger.info("Authenticating to PostgreSQL using password...")
 
@@ -32,7 +55,10 @@ async def create_postgres_engine(*, host, username, database, password, sslmode,
     if sslmode:
         DATABASE_URI += f"?ssl={sslmode}"
 
-    engine = create_async_engine(DATABASE_URI, echo=False)
+    # Tamaño, timeouts, reciclado, pre-ping y ajustes de asyncpg/servidor desde el entorno (POSTGRES_POOL_*, ...)
+    pool_settings = pool_settings or PoolSettings.from_env()
+    log_pool_settings(pool_settings, pool_name)
+    engine = create_async_engine(DATABASE_URI, echo=False, **pool_settings.engine_kwargs(pool_name))
 
     @event.listens_for(engine.sync_engine, "connect")
     def register_custom_types(dbapi_connection: AdaptedConnection, *args):
@@ -44,16 +70,20 @@ async def create_postgres_engine(*, host, username, database, password, sslmode,
 
     @event.listens_for(engine.sync_engine, "do_connect")
     def update_password_token(dialect, conn_rec, cargs, cparams):
-        if token_based_password:
-            logger.info("Updating password token for Azure Database for PostgreSQL")
-            cparams["password"] = get_password_from_azure_credential()
+        if token_provider is not None:
+            cparams["password"] = token_provider.token
+
+    @event.listens_for(engine.sync_engine, "engine_disposed")
+    def stop_token_refresh(*args):
+        if token_provider is not None:
+            token_provider.stop()
 
     return engine
 
 
 async def create_postgres_engine_from_env(azure_credential=None) -> AsyncEngine:
-    if azure_credential is None and os.environ["POSTGRES_HOST"].endswith(".database.azure.com"):
-        azure_credential = get_azure_credential()
+    if azure_credential is None and uses_entra_auth(os.environ["POSTGRES_HOST"], os.environ.get("POSTGRES_PASSWORD")):
+        azure_credential = await get_azure_credential()
 
     return await create_postgres_engine(
         host=os.environ["POSTGRES_HOST"],
@@ -66,7 +96,7 @@ async def create_postgres_engine_from_env(azure_credential=None) -> AsyncEngine:
 
 
 async def create_postgres_engine_from_args(args, azure_credential=None) -> AsyncEngine:
-    if azure_credential is None and args.host.endswith(".database.azure.com"):
+    if azure_credential is None and uses_entra_auth(args.host, args.password):
         if tenant_id := args.tenant_id:
             logger.info("Authenticating to Azure using Azure Developer CLI Credential for tenant %s", tenant_id)
             azure_credential = AzureDeveloperCliCredential(tenant_id=tenant_id, process_timeout=60)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import (Index,Integer,String,Date,Numeric,PrimaryKeyConstraint)
+from sqlalchemy import (DateTime,Index,Integer,String,Date,Numeric,PrimaryKeyConstraint,text)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 from datetime import date
@@ -23,6 +23,17 @@ class Veiculo(Base):
 
     embedding_main = mapped_column(Vector(1024), nullable=True)
     embedding_alt = mapped_column(Vector(768), nullable=True)
+    # Hash del texto embebido y modelo:dimensiones de cada vector (update_embeddings solo re-embebe lo que cambió).
+    # Diferidas: las búsquedas no las cargan
+    embedding_main_text_hash = mapped_column(String(64), nullable=True, deferred=True)
+    embedding_main_model = mapped_column(String, nullable=True, deferred=True)
+    embedding_alt_text_hash = mapped_column(String(64), nullable=True, deferred=True)
+    embedding_alt_model = mapped_column(String, nullable=True, deferred=True)
+    # Marcada por un trigger cuando la fila se inserta o cambia su texto; embedding_worker la limpia al embeberla
+    embedding_dirty_at = mapped_column(DateTime(timezone=True), nullable=True, deferred=True)
+    # Hasta cuándo la tiene tomada un worker (o espera tras un fallo) y cuántas veces se intentó embeber
+    embedding_claimed_until = mapped_column(DateTime(timezone=True), nullable=True, deferred=True)
+    embedding_attempts = mapped_column(Integer, nullable=True, deferred=True)
 
     def to_str_for_embedding(self) -> str:
         """
@@ -54,6 +65,14 @@ class Abastecimento(Base):
 
     embedding_main = mapped_column(Vector(1024), nullable=True)
     embedding_alt = mapped_column(Vector(768), nullable=True)
+    # Igual que en Veiculo
+    embedding_main_text_hash = mapped_column(String(64), nullable=True, deferred=True)
+    embedding_main_model = mapped_column(String, nullable=True, deferred=True)
+    embedding_alt_text_hash = mapped_column(String(64), nullable=True, deferred=True)
+    embedding_alt_model = mapped_column(String, nullable=True, deferred=True)
+    embedding_dirty_at = mapped_column(DateTime(timezone=True), nullable=True, deferred=True)
+    embedding_claimed_until = mapped_column(DateTime(timezone=True), nullable=True, deferred=True)
+    embedding_attempts = mapped_column(Integer, nullable=True, deferred=True)
 
     # Composite primary 
     __table_args__ = (
@@ -81,9 +100,40 @@ class Abastecimento(Base):
         return (f"Record from {self.data} for plate {self.placa}: {self.diesel} liters of diesel "
                 f"cost {self.custo_combustivel}. The efficiency was {self.km_diesel} km/l.")
 
+class EmbeddingCache(Base):
+    """
+    Vectores ya calculados por hash del texto y modelo:dimensiones, para no volver a pedir a la API
+    un texto que ya se embebió (en esta u otra tabla, en esta u otra ejecución).
+    """
+
+    __tablename__ = "embedding_cache"
+
+    text_hash = mapped_column(String(64), primary_key=True)
+    model_tag = mapped_column(String, primary_key=True)
+    # Sin dimensión fija: cada modelo guarda la suya
+    embedding = mapped_column(Vector(), nullable=False)
+
+
 # Indexes 
 index_veiculos_main = Index("hnsw_veiculos_main", Veiculo.embedding_main, postgresql_using="hnsw", postgresql_with={"m": 16, "ef_construction": 64}, postgresql_ops={"embedding_main": "vector_cosine_ops"})
 index_veiculos_alt = Index("hnsw_veiculos_alt", Veiculo.embedding_alt, postgresql_using="hnsw", postgresql_with={"m": 16, "ef_construction": 64}, postgresql_ops={"embedding_alt": "vector_cosine_ops"})
 
 index_abastecimento_main = Index("hnsw_abastecimento_main", Abastecimento.embedding_main, postgresql_using="hnsw", postgresql_with={"m": 16, "ef_construction": 64}, postgresql_ops={"embedding_main": "vector_cosine_ops"})
-index_abastecimento_alt = Index("hnsw_abastecimento_alt", Abastecimento.embedding_alt, postgresql_using="hnsw", postgresql_with={"m": 16, "ef_construction": 64}, postgresql_ops={"embedding_alt": "vector_cosine_ops"})
\ No newline at end of file
+index_abastecimento_alt = Index("hnsw_abastecimento_alt", Abastecimento.embedding_alt, postgresql_using="hnsw", postgresql_with={"m": 16, "ef_construction": 64}, postgresql_ops={"embedding_alt": "vector_cosine_ops"})
+
+# create_all no crea los índices vectoriales (sin CONCURRENTLY bloquearía las escrituras): los construye manage_indexes
+VECTOR_INDEXES = (index_veiculos_main, index_veiculos_alt, index_abastecimento_main, index_abastecimento_alt)
+for vector_index in VECTOR_INDEXES:
+    vector_index.ddl_if(callable_=lambda *args, **kwargs: False)
+
+# Parciales: solo las filas pendientes del worker de embeddings
+index_veiculos_dirty = Index(
+    "ix_veiculos_embedding_dirty",
+    Veiculo.embedding_dirty_at,
+    postgresql_where=text("embedding_dirty_at IS NOT NULL"),
+)
+index_abastecimento_dirty = Index(
+    "ix_abastecimento_embedding_dirty",
+    Abastecimento.embedding_dirty_at,
+    postgresql_where=text("embedding_dirty_at IS NOT NULL"),
+)
@@ -0,0 +1,157 @@
+"""
+Configuración del pool de conexiones del engine asyncpg, a partir de variables de entorno.
+"""
+
+import logging
+import os
+import time
+import weakref
+from collections.abc import Iterable
+from typing import Any
+from uuid import uuid4
+
+from opentelemetry.metrics import CallbackOptions, Observation
+from pydantic import BaseModel
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from fastapi_app.metrics import db_pool_checkout, db_pool_overflow, db_pool_timeouts, meter
+
+logger = logging.getLogger("ragapp")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if not value else value.lower() in ("1", "true", "yes", "on")
+
+
+class PoolSettings(BaseModel):
+    """
+    Ajustes del pool y de las conexiones asyncpg.
+    `pgbouncer=True` es el modo seguro para PgBouncer en transaction pooling: sin caché de sentencias
+    preparadas (una sentencia preparada en una conexión de servidor no existe en la siguiente transacción)
+    y sin parámetros de arranque que PgBouncer rechazaría.
+    """
+
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 10.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100
+    pgbouncer: bool = False
+    # JIT de Postgres: solo agrega latencia de compilación a las consultas cortas de búsqueda
+    jit: bool = False
+    application_name: str = "ragapp"
+    # Keepalives TCP del lado del servidor (segundos), para detectar conexiones muertas detrás de NAT/balanceadores
+    tcp_keepalives_idle: int = 60
+    tcp_keepalives_interval: int = 10
+    tcp_keepalives_count: int = 5
+
+    @classmethod
+    def from_env(cls, prefix: str = "POSTGRES") -> "PoolSettings":
+        defaults = cls()
+        return cls(
+            pool_size=int(os.getenv(f"{prefix}_POOL_SIZE") or defaults.pool_size),
+            max_overflow=int(os.getenv(f"{prefix}_MAX_OVERFLOW") or defaults.max_overflow),
+            pool_timeout=float(os.getenv(f"{prefix}_POOL_TIMEOUT") or defaults.pool_timeout),
+            pool_recycle=int(os.getenv(f"{prefix}_POOL_RECYCLE") or defaults.pool_recycle),
+            pool_pre_ping=_env_bool(f"{prefix}_POOL_PRE_PING", defaults.pool_pre_ping),
+            statement_cache_size=int(os.getenv(f"{prefix}_STATEMENT_CACHE_SIZE") or defaults.statement_cache_size),
+            pgbouncer=_env_bool(f"{prefix}_PGBOUNCER", defaults.pgbouncer),
+            jit=_env_bool(f"{prefix}_JIT", defaults.jit),
+            application_name=os.getenv(f"{prefix}_APPLICATION_NAME") or defaults.application_name,
+            tcp_keepalives_idle=int(os.getenv(f"{prefix}_TCP_KEEPALIVES_IDLE") or defaults.tcp_keepalives_idle),
+            tcp_keepalives_interval=int(
+                os.getenv(f"{prefix}_TCP_KEEPALIVES_INTERVAL") or defaults.tcp_keepalives_interval
+            ),
+            tcp_keepalives_count=int(os.getenv(f"{prefix}_TCP_KEEPALIVES_COUNT") or defaults.tcp_keepalives_count),
+        )
+
+    def connect_args(self) -> dict[str, Any]:
+        if self.pgbouncer:
+            return {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                # Nombres únicos: evita choques con sentencias de otros clientes en la misma conexión de servidor
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+                "server_settings": {"application_name": self.application_name},
+            }
+        return {
+            "statement_cache_size": self.statement_cache_size,
+            "prepared_statement_cache_size": self.statement_cache_size,
+            "server_settings": {
+                "application_name": self.application_name,
+                "jit": "on" if self.jit else "off",
+                "tcp_keepalives_idle": str(self.tcp_keepalives_idle),
+                "tcp_keepalives_interval": str(self.tcp_keepalives_interval),
+                "tcp_keepalives_count": str(self.tcp_keepalives_count),
+            },
+        }
+
+    def engine_kwargs(self, pool_name: str = "primary") -> dict[str, Any]:
+        """Argumentos para create_async_engine."""
+        return {
+            "poolclass": InstrumentedAsyncPool,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+            "connect_args": self.connect_args(),
+            "pool_logging_name": pool_name,
+        }
+
+
+# Pools vivos, para el gauge de conexiones en uso
+_pools: "weakref.WeakSet[InstrumentedAsyncPool]" = weakref.WeakSet()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Pool que mide el tiempo de checkout y cuenta las conexiones de overflow y los timeouts."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # recreate() vuelve a pasar logging_name, así el nombre sobrevive a invalidaciones del pool
+        self.pool_name: str = kwargs.get("logging_name") or "primary"
+        _pools.add(self)
+
+    def _do_get(self):  # type: ignore[no-untyped-def]
+        attributes = {"pool": self.pool_name}
+        overflow_before = self._overflow
+        started_at = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            db_pool_timeouts.add(1, attributes)
+            raise
+        db_pool_checkout.record((time.perf_counter() - started_at) * 1000, attributes)
+        if self._overflow > max(overflow_before, 0):
+            db_pool_overflow.add(1, attributes)
+        return connection
+
+
+def _observe_in_use(options: CallbackOptions) -> Iterable[Observation]:
+    for pool in list(_pools):
+        yield Observation(pool.checkedout(), {"pool": pool.pool_name})
+
+
+db_pool_in_use = meter.create_observable_gauge(
+    "ragapp.db.pool.in_use",
+    callbacks=[_observe_in_use],
+    unit="1",
+    description="Connections currently checked out of the pool",
+)
+
+
+def log_pool_settings(settings: PoolSettings, pool_name: str = "primary") -> None:
+    logger.info(
+        "Postgres pool %s: size %d + overflow %d, timeout %.0fs, recycle %ds, pre-ping %s, pgbouncer %s",
+        pool_name,
+        settings.pool_size,
+        settings.max_overflow,
+        settings.pool_timeout,
+        settings.pool_recycle,
+        settings.pool_pre_ping,
+        settings.pgbouncer,
+    )
@@ -0,0 +1,172 @@
+"""
+Ruteo de lecturas a réplicas de Postgres: las búsquedas y consultas analíticas van a una réplica
+(round-robin o la de menor latencia) y vuelven al primario cuando ninguna está sana o al día.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from fastapi_app.dependencies import create_async_sessionmaker
+from fastapi_app.metrics import db_reads
+from fastapi_app.postgres_engine import create_postgres_engine
+from fastapi_app.postgres_pool import PoolSettings
+
+logger = logging.getLogger("ragapp")
+
+REPLICA_STRATEGIES = ("round_robin", "least_latency")
+# Retraso de la réplica en segundos. Si ya aplicó todo lo recibido está al día aunque el primario
+# no haya escrito nada en un rato (ahí pg_last_xact_replay_timestamp() queda viejo sin que haya retraso real).
+REPLICATION_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+# Peso de la última medición en la latencia suavizada (EWMA)
+LATENCY_SMOOTHING = 0.3
+
+
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine, sessionmaker: async_sessionmaker[AsyncSession]):
+        self.name = name
+        self.engine = engine
+        self.sessionmaker = sessionmaker
+        # Hasta el primer chequeo la réplica no recibe lecturas
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.latency: Optional[float] = None
+
+    def observe_latency(self, latency: float) -> None:
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+
+
+class ReplicaRouter:
+    """
+    Elige el sessionmaker de cada lectura entre las réplicas sanas con retraso <= `max_lag` segundos.
+    Un chequeo en segundo plano mide cada `check_interval` segundos la latencia y el retraso de cada réplica.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        replicas: list[Replica],
+        strategy: str = "round_robin",
+        max_lag: float = 10.0,
+        check_interval: float = 5.0,
+    ):
+        if strategy not in REPLICA_STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy!r}, expected one of {REPLICA_STRATEGIES}")
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.next_index = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def available(self) -> list[Replica]:
+        return [
+            replica
+            for replica in self.replicas
+            if replica.healthy and replica.lag is not None and replica.lag <= self.max_lag
+        ]
+
+    def choose(self) -> Optional[Replica]:
+        candidates = self.available()
+        if not candidates:
+            return None
+        if self.strategy == "least_latency":
+            return min(candidates, key=lambda replica: replica.latency or 0.0)
+        replica = candidates[self.next_index % len(candidates)]
+        self.next_index += 1
+        return replica
+
+    def read_sessionmaker(self) -> async_sessionmaker[AsyncSession]:
+        replica = self.choose()
+        db_reads.add(1, {"target": replica.name if replica else "primary"})
+        return replica.sessionmaker if replica else self.primary
+
+    async def check(self, replica: Replica) -> None:
+        started_at = time.perf_counter()
+        try:
+            async with replica.engine.connect() as connection:
+                result = await asyncio.wait_for(connection.execute(REPLICATION_LAG_QUERY), self.check_interval)
+                lag = float(result.scalar_one())
+        except Exception as error:
+            if replica.healthy:
+                logger.warning("Read replica %s is unavailable, reading from the primary: %s", replica.name, error)
+            replica.healthy = False
+            return
+        replica.observe_latency(time.perf_counter() - started_at)
+        was_fresh = replica.lag is not None and replica.lag <= self.max_lag
+        if was_fresh and lag > self.max_lag:
+            logger.warning("Read replica %s is %.1fs behind, skipping it until it catches up", replica.name, lag)
+        replica.lag = lag
+        replica.healthy = True
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def run(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.gather(*(replica.engine.dispose() for replica in self.replicas))
+
+
+async def create_replica_router_from_env(
+    primary: async_sessionmaker[AsyncSession], azure_credential: Any = None
+) -> Optional[ReplicaRouter]:
+    """
+    Réplicas en POSTGRES_REPLICA_HOSTS (separadas por comas), con el mismo usuario, base y SSL que el primario.
+    El pool de cada réplica se configura con POSTGRES_REPLICA_POOL_SIZE, etc. Devuelve None sin réplicas.
+    """
+    hosts = [host.strip() for host in os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",") if host.strip()]
+    if not hosts:
+        return None
+    pool_settings = PoolSettings.from_env("POSTGRES_REPLICA")
+    replicas = []
+    for host in hosts:
+        engine = await create_postgres_engine(
+            host=host,
+            username=os.environ["POSTGRES_USERNAME"],
+            database=os.environ["POSTGRES_DATABASE"],
+            password=os.environ.get("POSTGRES_PASSWORD"),
+            sslmode=os.environ.get("POSTGRES_SSL"),
+            azure_credential=azure_credential,
+            pool_settings=pool_settings,
+            pool_name=host,
+        )
+        replicas.append(Replica(host, engine, await create_async_sessionmaker(engine)))
+    router = ReplicaRouter(
+        primary,
+        replicas,
+        strategy=os.getenv("POSTGRES_REPLICA_STRATEGY") or "round_robin",
+        max_lag=float(os.getenv("POSTGRES_REPLICA_MAX_LAG") or 10),
+        check_interval=float(os.getenv("POSTGRES_REPLICA_CHECK_INTERVAL") or 5),
+    )
+    logger.info("Routing reads to %d replica(s) (%s, max lag %.0fs)", len(replicas), router.strategy, router.max_lag)
+    return router
@@ -1,13 +1,51 @@
+import logging
+import time
+from datetime import date
 from typing import Optional, Union, List, Any
 
 import numpy as np
 from openai import AsyncAzureOpenAI, AsyncOpenAI
-from sqlalchemy import Float, Integer, String, column, select, text
+from sqlalchemy import Float, Integer, String, column, literal_column, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Importamos los modelos correctos
-from fastapi_app.postgres_models import Abastecimento
+from fastapi_app.postgres_models import Abastecimento, Veiculo
 from fastapi_app.embeddings import compute_text_embedding
+from fastapi_app.hedging import RequestHedger
+from fastapi_app.timeseries import DownsampledSeries, SeriesPoint, lttb_indices
+
+# Columnas que solo existen en `veiculos` (se filtran con una subconsulta sobre id_veiculo)
+VEICULO_FILTER_COLUMNS = {"garagem", "fabricante", "tipo_onibus", "ano", "modelo_chassi"}
+FILTER_COLUMNS = {"id_veiculo", "placa"} | VEICULO_FILTER_COLUMNS
+INTEGER_FILTER_COLUMNS = {"ano"}
+FILTER_OPERATORS = {"=", "!=", "<>", "<", "<=", ">", ">="}
+# Agregación de la serie según los días que abarca: rangos largos van por semana o por mes
+WEEK_BUCKET_DAYS = 180
+MONTH_BUCKET_DAYS = 3 * 365
+
+logger = logging.getLogger("ragapp")
+
+
+def series_bucket(span_days: int) -> str:
+    if span_days > MONTH_BUCKET_DAYS:
+        return "month"
+    if span_days > WEEK_BUCKET_DAYS:
+        return "week"
+    return "day"
+
+
+def filter_date_range(filters: Optional[list[dict]]) -> Optional[tuple[date, date]]:
+    """Rango (inicio, fin) del date_filter, o None si no hay uno completo y válido."""
+    for f in filters or []:
+        date_filter = f.get("value")
+        if isinstance(date_filter, dict) and "start_date" in date_filter:
+            start_date, end_date = date_filter.get("start_date"), date_filter.get("end_date")
+            try:
+                return date.fromisoformat(str(start_date)), date.fromisoformat(str(end_date))
+            except ValueError:
+                return None
+    return None
+
 
 class PostgresSearcher:
     def __init__(
@@ -18,6 +56,7 @@ class PostgresSearcher:
         embed_model: str,
         embed_dimensions: Optional[int],
         embedding_column: str,
+        embed_hedger: Optional[RequestHedger] = None,
     ):
         self.db_session = db_session
         self.openai_embed_client = openai_embed_client
@@ -25,36 +64,61 @@ class PostgresSearcher:
         self.embed_deployment = embed_deployment
         self.embed_dimensions = embed_dimensions
         self.embedding_column = embedding_column
+        self.embed_hedger = embed_hedger
+        # Duración (ms) del último embedding de search_and_embed, para separar embedding y búsqueda por etapa
+        self.embed_duration_ms: Optional[float] = None
 
-    def build_filter_clause(self, filters: Optional[List[dict]]) -> tuple[str, str]:
+    def build_filter_clause(self, filters: Optional[list[dict]]) -> tuple[str, str, dict[str, Any]]:
         """
-        Construye la cláusula WHERE de SQL a partir de una lista de diccionarios de filtros.
+        Construye la cláusula WHERE de SQL (sobre `abastecimento`) a partir de una lista de diccionarios de filtros.
+        Los filtros por columnas de `veiculos` van en una subconsulta sobre id_veiculo, y los valores (que vienen
+        de la salida del LLM) se devuelven como parámetros en vez de escribirse en el SQL. Un filtro inválido
+        (columna u operador desconocido, fecha incompleta o mal formada) se descarta con un aviso en el log:
+        la búsqueda sigue sin él.
         """
-        if not filters:
-            return "", ""
-        
-        filter_clauses = []
-        for f in filters:
+        conditions: list[str] = []
+        veiculo_conditions: list[str] = []
+        params: dict[str, Any] = {}
+
+        def bind(value: Any) -> str:
+            name = f"filter_{len(params)}"
+            params[name] = value
+            return f":{name}"
+
+        for f in filters or []:
             # Si el filtro es un date_filter, lo manejamos de forma especial
-            if 'start_date' in f.get('value', {}):
-                date_filter = f['value']
-                start_date = date_filter.get('start_date')
-                end_date = date_filter.get('end_date')
-                if start_date and end_date:
-                    filter_clauses.append(f"data BETWEEN '{start_date}' AND '{end_date}'")
-            else:
-                # Si no, es un filtro normal
-                column_name = f['column']
-                operator = f['operator']
-                value = f['value']
-                filter_value = f"'{value}'" if isinstance(value, str) else value
-                filter_clauses.append(f"{column_name} {operator} {filter_value}")
-        
-        filter_clause_str = " AND ".join(filter_clauses)
-        
-        if filter_clause_str:
-            return f"WHERE {filter_clause_str}", f"AND {filter_clause_str}"
-        return "", ""
+            if isinstance(f.get("value"), dict) and "start_date" in f["value"]:
+                date_range = filter_date_range([f])
+                if date_range is None:
+                    logger.warning("Ignoring invalid date filter: %s", f)
+                    continue
+                conditions.append(f"data BETWEEN {bind(date_range[0])} AND {bind(date_range[1])}")
+                continue
+            # Si no, es un filtro normal: columna y operador van en el SQL, así que solo se aceptan los conocidos
+            column_name = f.get("column")
+            operator = f.get("operator")
+            if column_name not in FILTER_COLUMNS or operator not in FILTER_OPERATORS:
+                logger.warning("Ignoring unsupported filter: %s", f)
+                continue
+            value = f.get("value")
+            if column_name in INTEGER_FILTER_COLUMNS:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    logger.warning("Ignoring filter with a non-integer value: %s", f)
+                    continue
+            target = veiculo_conditions if column_name in VEICULO_FILTER_COLUMNS else conditions
+            target.append(f"{column_name} {operator} {bind(value)}")
+
+        if veiculo_conditions:
+            conditions.append(
+                f"id_veiculo IN (SELECT id_veiculo FROM {Veiculo.__tablename__} "
+                f"WHERE {' AND '.join(veiculo_conditions)})"
+            )
+        if not conditions:
+            return "", "", params
+        filter_clause_str = " AND ".join(conditions)
+        return f"WHERE {filter_clause_str}", f"AND {filter_clause_str}", params
 
     async def search(
         self,
@@ -63,17 +127,19 @@ class PostgresSearcher:
         top: int = 5,
         filters: Optional[List[dict]] = None,
     ) -> list[Abastecimento]:
-        filter_clause_where, filter_clause_and = self.build_filter_clause(filters)
-        
+        filter_clause_where, filter_clause_and, filter_params = self.build_filter_clause(filters)
+
         table_name = Abastecimento.__tablename__
-        pk_column = "ctid" 
+        pk_column = "ctid"
+        # Con `top` grande (p. ej. para el resumen numérico) se amplía la ventana de candidatos
+        candidate_limit = max(top, 20)
 
         vector_query = f"""
             SELECT {pk_column}, RANK () OVER (ORDER BY {self.embedding_column} <=> :embedding) AS rank
             FROM {table_name}
             {filter_clause_where}
             ORDER BY {self.embedding_column} <=> :embedding
-            LIMIT 20
+            LIMIT :candidate_limit
         """
 
         fulltext_query = f"""
@@ -81,7 +147,7 @@ class PostgresSearcher:
             FROM {table_name}, plainto_tsquery('english', :query) query
             WHERE to_tsvector('english', placa) @@ query {filter_clause_and}
             ORDER BY ts_rank_cd(to_tsvector('english', placa), query) DESC
-            LIMIT 20
+            LIMIT :candidate_limit
         """
 
         hybrid_query = f"""
@@ -94,7 +160,7 @@ class PostgresSearcher:
         FROM vector_search
         FULL OUTER JOIN fulltext_search ON vector_search.{pk_column} = fulltext_search.{pk_column}
         ORDER BY score DESC
-        LIMIT 20
+        LIMIT :candidate_limit
         """
         
         if query_text and query_vector:
@@ -109,18 +175,26 @@ class PostgresSearcher:
         results = (
             await self.db_session.execute(
                 sql,
-                {"embedding": np.array(query_vector), "query": query_text, "k": 60},
+                {
+                    "embedding": np.array(query_vector),
+                    "query": query_text,
+                    "k": 60,
+                    "candidate_limit": candidate_limit,
+                    **filter_params,
+                },
             )
         ).fetchall()
 
-        row_models = []
-        for row_data in results[:top]:
-            ctid_value = row_data[0]
-            query = select(Abastecimento).where(text(f"ctid = '{ctid_value}'"))
-            abastecimento_obj = (await self.db_session.execute(query)).scalar_one_or_none()
-            if abastecimento_obj:
-                row_models.append(abastecimento_obj)
-        return row_models
+        # Una sola consulta para todas las filas en vez de una por ctid, conservando el orden del ranking
+        ctids = [row_data[0] for row_data in results[:top]]
+        if not ctids:
+            return []
+        query = select(Abastecimento, literal_column(pk_column)).where(
+            text(f"{pk_column} = ANY(:ctids)").bindparams(ctids=ctids)
+        )
+        rows = (await self.db_session.execute(query)).all()
+        row_models_by_ctid = {row_ctid: abastecimento_obj for abastecimento_obj, row_ctid in rows}
+        return [row_models_by_ctid[ctid_value] for ctid_value in ctids if ctid_value in row_models_by_ctid]
 
     async def search_and_embed(
         self,
@@ -131,15 +205,88 @@ class PostgresSearcher:
         filters: Optional[List[dict]] = None,
     ) -> list[Abastecimento]:
         vector: list[float] = []
+        self.embed_duration_ms = None
         if enable_vector_search and query_text:
+            started_at = time.perf_counter()
             vector = await compute_text_embedding(
                 query_text,
                 self.openai_embed_client,
                 self.embed_model,
                 self.embed_deployment,
                 self.embed_dimensions,
+                hedger=self.embed_hedger,
             )
-        
+            self.embed_duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+
         text_query = query_text if enable_text_search else None
 
-        return await self.search(text_query, vector, top, filters)
\ No newline at end of file
+        return await self.search(text_query, vector, top, filters)
+
+    async def fetch_series(
+        self,
+        filters: Optional[list[dict]] = None,
+        max_points: int = 60,
+        bucket: Optional[str] = None,
+    ) -> DownsampledSeries:
+        """
+        Obtiene la serie temporal filtrada (agregada por día, semana o mes) con un cursor del lado del servidor
+        y la reduce a `max_points` puntos con LTTB, para que el contexto tenga tamaño fijo.
+        Sin `bucket`, se elige según los días que abarcan los datos filtrados (ver series_bucket).
+        """
+        if bucket not in (None, "day", "week", "month"):
+            raise ValueError(f"Unsupported bucket: {bucket}")
+        filter_clause_where, _, filter_params = self.build_filter_clause(filters)
+        if bucket is None:
+            date_range = filter_date_range(filters)
+            if date_range is None:
+                # Sin rango de fechas en los filtros, el que cubren las filas filtradas
+                span_query = f"SELECT MIN(data), MAX(data) FROM {Abastecimento.__tablename__} {filter_clause_where}"
+                date_range = tuple((await self.db_session.execute(text(span_query), filter_params)).one())
+            start, end = date_range
+            bucket = series_bucket((end - start).days if start and end else 0)
+
+        series_query = f"""
+            SELECT date_trunc('{bucket}', data)::date AS fecha,
+                COUNT(*) AS registros,
+                SUM(diesel)::float8 AS diesel,
+                SUM(km_percorrido)::float8 AS km_percorrido,
+                SUM(custo_combustivel)::float8 AS custo_combustivel
+            FROM {Abastecimento.__tablename__}
+            {filter_clause_where}
+            GROUP BY fecha
+            ORDER BY fecha
+        """
+
+        fechas: list = []
+        values: list[tuple] = []
+        result = await self.db_session.stream(text(series_query), filter_params)
+        async for partition in result.partitions(500):
+            for row in partition:
+                fechas.append(row.fecha)
+                values.append((row.registros, row.diesel, row.km_percorrido, row.custo_combustivel))
+
+        if not fechas:
+            return DownsampledSeries(bucket=bucket, source_points=0, points=[])
+
+        dates = np.array(fechas, dtype="datetime64[D]")
+        matrix = np.array(values, dtype=np.float64)
+        registros, diesel, km_percorrido, custo = matrix.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            km_diesel = np.where(diesel > 0, km_percorrido / diesel, np.nan)
+        indices = lttb_indices(dates.astype(np.float64), diesel, max_points)
+
+        def optional(value: float) -> Optional[float]:
+            return None if np.isnan(value) else float(value)
+
+        points = [
+            SeriesPoint(
+                fecha=dates[i].item(),
+                registros=int(registros[i]),
+                diesel=optional(diesel[i]),
+                km_percorrido=optional(km_percorrido[i]),
+                custo_combustivel=optional(custo[i]),
+                km_diesel=optional(km_diesel[i]),
+            )
+            for i in indices
+        ]
+        return DownsampledSeries(bucket=bucket, source_points=len(fechas), points=points)
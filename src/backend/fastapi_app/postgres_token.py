@@ -0,0 +1,76 @@
+"""
+Caché del token de Entra ID usado como contraseña de Azure Database for PostgreSQL.
+El token se renueva en segundo plano (en un hilo, porque las credenciales de azure.identity son síncronas
+y AzureDeveloperCliCredential ejecuta `azd`) antes de que venza, así abrir una conexión nueva no espera a Entra.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+from azure.core.credentials import AccessToken
+
+logger = logging.getLogger("ragapp")
+
+POSTGRES_TOKEN_SCOPE = "https://ossrdbms-aad.database.windows.net/.default"
+
+
+class CachedTokenProvider:
+    """
+    Entrega el token vigente en O(1) y lo renueva `refresh_margin` segundos antes de que venza.
+    Si la renovación falla se reintenta cada `retry_interval` segundos mientras el token actual siga siendo válido.
+    """
+
+    def __init__(
+        self,
+        credential: Any,
+        scope: str = POSTGRES_TOKEN_SCOPE,
+        refresh_margin: float = 300.0,
+        retry_interval: float = 10.0,
+    ):
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.access_token: Optional[AccessToken] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def token(self) -> str:
+        access_token = self.access_token
+        if access_token is None or access_token.expires_on <= time.time():
+            # Solo si la renovación en segundo plano no consiguió un token válido a tiempo
+            logger.warning("Cached Postgres token is missing or expired, fetching one synchronously")
+            access_token = self.access_token = self.credential.get_token(self.scope)
+        return access_token.token
+
+    def seconds_until_refresh(self) -> float:
+        if self.access_token is None:
+            return 0.0
+        return max(0.0, self.access_token.expires_on - self.refresh_margin - time.time())
+
+    async def refresh(self) -> None:
+        self.access_token = await asyncio.to_thread(self.credential.get_token, self.scope)
+        logger.info("Refreshed Postgres access token, valid for %.0fs", self.access_token.expires_on - time.time())
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.seconds_until_refresh())
+            try:
+                await self.refresh()
+            except Exception as error:
+                logger.warning(
+                    "Could not refresh Postgres access token, retrying in %.0fs: %s", self.retry_interval, error
+                )
+                await asyncio.sleep(self.retry_interval)
+
+    async def start(self) -> None:
+        await self.refresh()
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        # Síncrono: se llama desde el evento engine_disposed de SQLAlchemy
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
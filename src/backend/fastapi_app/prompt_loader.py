@@ -0,0 +1,27 @@
+"""
+Lectura diferida de los archivos de `prompts/`: cada archivo se lee una sola vez, la primera vez que se usa,
+en lugar de al definir las clases (lo que sumaba E/S al arranque en frío).
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+PROMPTS_DIR = Path(__file__).parent.resolve() / "prompts"
+
+
+@lru_cache
+def load_prompt(name: str) -> str:
+    return (PROMPTS_DIR / name).read_text()
+
+
+@lru_cache
+def load_prompt_json(name: str) -> Any:
+    return json.loads(load_prompt(name))
+
+
+def preload_prompts() -> None:
+    for path in PROMPTS_DIR.iterdir():
+        if path.is_file():
+            load_prompt(path.name)
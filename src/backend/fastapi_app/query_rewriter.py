@@ -55,6 +55,10 @@ def build_search_function() -> list[ChatCompletionToolParam]:
                                 },
                             },
                         },
+                        "garagem_filter": {
+                            "type": "string",
+                            "description": "Filter results by the garage (garagem) the vehicles belong to.",
+                        },
                         "fabricante_filter": {
                             "type": "string",
                             "description": "Filter results by the vehicle manufacturer, e.g., 'Volvo', 'Mercedes-Benz'.",
@@ -90,6 +94,14 @@ def extract_search_arguments(original_user_query: str, chat_completion: ChatComp
                 if "placa_filter" in arg and arg["placa_filter"]:
                     filters.append({"column": "placa", "operator": "=", "value": arg["placa_filter"]})
 
+                if "garagem_filter" in arg and arg["garagem_filter"]:
+                    filters.append({"column": "garagem", "operator": "=", "value": arg["garagem_filter"]})
+
+                if "date_filter" in arg and isinstance(arg["date_filter"], dict):
+                    date_filter_args = arg["date_filter"]
+                    if date_filter_args.get("start_date") and date_filter_args.get("end_date"):
+                        filters.append({"column": "data", "operator": "BETWEEN", "value": date_filter_args})
+
                 if "fabricante_filter" in arg and arg["fabricante_filter"]:
                     filters.append({"column": "fabricante", "operator": "=", "value": arg["fabricante_filter"]})
 
@@ -1,25 +1,26 @@
-import json
 import logging
-from typing import Optional, Union, List, Tuple
+import time
+from collections.abc import AsyncGenerator
+from typing import Any, Optional, Union
 
 from openai import AsyncAzureOpenAI, AsyncOpenAI
-# CÓDIGO CORREGIDO
-from openai.types.chat import ChatCompletion
-from openai.types.responses import EasyInputMessageParam # <-- Se importa desde aquí# CAMBIO: Ya no importamos nada de la librería 'agents'
 
 # Importaciones consistentes
-from fastapi_app.api_models import (
-    AnoFilter, AbastecimentoPublic, ChatRequest, ChatRequestOverrides, RAGContext,
-    RetrievalResponse, RetrievalResponseDelta, SearchResults, ThoughtStep, Message, AIChatRoles
-)
+from fastapi_app.api_models import ChatRequestOverrides, Message, ThoughtStep
+from fastapi_app.hedging import RequestHedger, client_for_deployment
 from fastapi_app.postgres_searcher import PostgresSearcher
+from fastapi_app.prompt_loader import load_prompt_json
 from fastapi_app.rag_base import RAGChatBase
 from fastapi_app.query_rewriter import build_search_function, extract_search_arguments # Importamos las funciones que necesitamos
 
+logger = logging.getLogger("ragapp")
+
 
 class AdvancedRAGChat(RAGChatBase):
 
-    query_fewshots = json.loads(open(RAGChatBase.prompts_dir / "query_fewshots.json").read())
+    @property
+    def query_fewshots(self) -> list[dict[str, Any]]:
+        return load_prompt_json("query_fewshots.json")
 
 
     def __init__(
@@ -27,23 +28,29 @@ class AdvancedRAGChat(RAGChatBase):
         *,
         messages: list[Message],
         overrides: ChatRequestOverrides,
-        searcher: PostgresSearcher,
+        searcher: Optional[PostgresSearcher],
         openai_chat_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
         chat_model: str,
         chat_deployment: Optional[str] = None,
+        session_state: Optional[Any] = None,
+        chat_hedger: Optional[RequestHedger] = None,
     ):
+        super().__init__()
         self.searcher = searcher
         self.openai_chat_client = openai_chat_client
         self.chat_params = self.get_chat_params(messages, overrides)
         self.chat_model = chat_model
         self.chat_deployment = chat_deployment
+        self.session_state = session_state
+        self.chat_hedger = chat_hedger
 
 
-    async def prepare_context(self) -> tuple[list, list[ThoughtStep]]:
+    async def plan_search(self) -> tuple[str, Optional[list[dict]]]:
             """
-            Prepara el contexto para la respuesta.
-            Esta versión corregida soluciona el error 'model_dump'.
+            Acota el historial y pide al modelo la consulta de búsqueda y los filtros.
             """
+            # 0. Acota el historial (últimos turnos + resumen) antes de reescribir y responder
+            await self.compact_history()
             user_query = self.chat_params.original_user_query
             history = self.chat_params.past_messages
 
@@ -51,71 +58,53 @@ class AdvancedRAGChat(RAGChatBase):
             tools = build_search_function()
             messages_for_llm = self.query_fewshots + history + [{"role": "user", "content": user_query}]
 
-            chat_completion = await self.openai_chat_client.chat.completions.create(
-                model=self.chat_deployment or self.chat_model,
-                messages=messages_for_llm,
-                tools=tools,
-                tool_choice="auto",
-            )
+            def create_rewrite(model: str):
+                client = client_for_deployment(self.openai_chat_client, model)
+                return client.chat.completions.create(
+                    model=model,
+                    messages=messages_for_llm,
+                    tools=tools,
+                    tool_choice="auto",
+                )
+
+            # La reescritura es idempotente: con hedging, un segundo intento corta la cola de latencia
+            if self.chat_hedger is not None:
+                chat_completion = await self.chat_hedger.run(create_rewrite, self.chat_deployment or self.chat_model)
+            else:
+                chat_completion = await create_rewrite(self.chat_deployment or self.chat_model)
 
             # 2. Extrae los argumentos y filtros
             search_query, filters = extract_search_arguments(user_query, chat_completion)
 
-            print("--- DEBUG: Plan de Búsqueda Generado ---")
-            print(f"Search Query: {search_query}")
-            print(f"Filters: {filters}")
-            print("--------------------------------------")
+            logger.debug("Search plan: query=%r filters=%s", search_query, filters)
 
             if not search_query:
                 raise ValueError("El modelo no generó una consulta de búsqueda.")
+            return search_query, filters
 
-            # 3. Busca en la base de datos (devuelve objetos de base de datos)
-            search_results = await self.searcher.search_and_embed(
-                search_query,
-                top=self.chat_params.top,
-                enable_vector_search=self.chat_params.enable_vector_search,
-                enable_text_search=self.chat_params.enable_text_search,
-                filters=filters,
-            )
-            
-            # 4. Prepara los "pensamientos" para el frontend
-            thoughts = [
-                ThoughtStep(title="Search query generated", description=search_query),
+    def plan_steps(self, search_query: str, filters: Optional[list[dict]], started_at: float) -> list[ThoughtStep]:
+            return [
+                ThoughtStep(
+                    title="Search query generated", description=search_query, props=self.phase_props(started_at)
+                ),
                 ThoughtStep(title="Filters applied", description=filters),
-                # CORRECCIÓN: Se convierten los objetos a su versión pública solo para esta descripción
-                ThoughtStep(title="Search results", description=[AbastecimentoPublic.model_validate(item, from_attributes=True).model_dump() for item in search_results]),
             ]
-            # Se devuelven los resultados originales (objetos de base de datos)
-            return search_results, thoughts
-
-    async def answer_stream(self, items: list, earlier_thoughts: list[ThoughtStep]):
-            rag_prompt = self.prepare_rag_request(self.chat_params.original_user_query, items)
-            
-            # Prepara los mensajes para la API de OpenAI
-            messages_for_llm = self.chat_params.past_messages + [{"role": "user", "content": rag_prompt}]
-            print(f"DEBUG: Se encontraron {len(items)} resultados. Guion final enviado a la IA:\n---\n{rag_prompt}\n---")
-
-            # Prepara el contexto para enviarlo al frontend
-            web_friendly_items = [AbastecimentoPublic.model_validate(item, from_attributes=True) for item in items]
-            data_points = {f"{item.placa}-{item.data}": item.model_dump() for item in web_friendly_items}
-            
-            yield RetrievalResponseDelta(
-                delta=Message(content="", role=AIChatRoles.ASSISTANT),
-                context=RAGContext(data_points=data_points, thoughts=earlier_thoughts)
-            )
-            
-            # CORRECCIÓN: Se reemplaza la lógica del 'Runner' por una llamada directa a la API
-            response_stream = await self.openai_chat_client.chat.completions.create(
-                model=self.chat_deployment or self.chat_model,
-                messages=messages_for_llm,
-                temperature=self.chat_params.temperature,
-                max_tokens=self.chat_params.response_token_limit,
-                seed=self.chat_params.seed,
-                stream=True
-            )
-
-            # Procesa la respuesta en "pedacitos" y la envía al frontend
-            async for chunk in response_stream:
-                content_delta = chunk.choices[0].delta.content
-                if content_delta:
-                    yield RetrievalResponseDelta(delta=Message(content=content_delta, role=AIChatRoles.ASSISTANT))
\ No newline at end of file
+
+    async def prepare_context_steps(self) -> AsyncGenerator[ThoughtStep, None]:
+            """
+            Prepara el contexto para la respuesta, emitiendo cada paso (con su duración) apenas termina.
+            Al final deja los resultados en self.search_results.
+            """
+            started_at = time.perf_counter()
+            search_query, filters = await self.plan_search()
+            for step in self.plan_steps(search_query, filters, started_at):
+                yield step
+
+            # 3. Busca en la base de datos (devuelve objetos de base de datos), o para preguntas de tendencia
+            # trae la serie temporal filtrada en lugar de la búsqueda por ranking
+            started_at = time.perf_counter()
+            await self.retrieve(search_query, filters)
+
+            # 4. Prepara los "pensamientos" para el frontend
+            for step in self.retrieval_steps(started_at):
+                yield step
@@ -1,12 +1,136 @@
-from pathlib import Path
-from typing import Optional
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections.abc import AsyncGenerator
+from typing import Any, Optional
+
+import anyio
 
 # CAMBIO: Se usan los modelos correctos desde api_models
-from fastapi_app.api_models import ChatParams, ChatRequestOverrides, Message, AbastecimentoPublic
+from fastapi_app.api_models import (
+    AbastecimentoPublic,
+    AIChatRoles,
+    ChatParams,
+    ChatRequestOverrides,
+    Message,
+    RAGContext,
+    RetrievalMode,
+    RetrievalResponse,
+    RetrievalResponseDelta,
+    ThoughtStep,
+)
+from fastapi_app.chat_history import ChatHistoryManager
+from fastapi_app.fueling_stats import summarize_fueling_rows
+from fastapi_app.prompt_loader import load_prompt
+from fastapi_app.timeseries import DownsampledSeries
+
+logger = logging.getLogger("ragapp")
+
+class RAGChatBase(ABC):
+    # Serie temporal recuperada en modo "timeseries" (se completa en prepare_context)
+    series: Optional[DownsampledSeries]
+    # Estado de sesión que el cliente reenvía en cada turno (incluye el resumen del historial)
+    session_state: Any
+    # Filas recuperadas por prepare_context_steps (objetos de base de datos)
+    search_results: list
+    # Parte de la recuperación que llevó el embedding de la consulta (ms), si se calculó en retrieve()
+    embed_duration_ms: Optional[float]
+
+    def __init__(self) -> None:
+        # Por instancia: cada petición tiene sus propios resultados
+        self.series = None
+        self.session_state = None
+        self.search_results = []
+        self.embed_duration_ms = None
+
+    @property
+    def answer_prompt_template(self) -> str:
+        return load_prompt("answer.txt")
+
+    @abstractmethod
+    def prepare_context_steps(self) -> AsyncGenerator[ThoughtStep, None]:
+            """
+            Ejecuta la recuperación emitiendo un ThoughtStep por fase apenas termina.
+            Debe dejar las filas recuperadas en self.search_results (o la serie en self.series).
+            """
+
+    async def prepare_context(self) -> tuple[list, list[ThoughtStep]]:
+            thoughts = [thought async for thought in self.prepare_context_steps()]
+            return self.search_results, thoughts
+
+    async def plan_search(self) -> tuple[str, Optional[list[dict]]]:
+            """Devuelve la consulta de búsqueda y los filtros. Sin reescritura: la pregunta tal cual, sin filtros."""
+            return self.chat_params.original_user_query, None
+
+    async def retrieve(
+        self, search_query: str, filters: Optional[list[dict]] = None, query_vector: Optional[list[float]] = None
+    ) -> None:
+            """
+            Recupera la serie temporal (modo "timeseries") o las filas para la consulta.
+            Si se pasa query_vector (p. ej. calculado en lote) no se vuelve a llamar a la API de embeddings.
+            """
+            if self.chat_params.retrieval_mode == RetrievalMode.TIMESERIES:
+                self.series = await self.searcher.fetch_series(filters, max_points=self.chat_params.series_points)
+                return
+            # Se recuperan más filas que `top` para el resumen numérico; solo `top` van como ejemplos al LLM
+            top = max(self.chat_params.top, self.chat_params.summary_row_limit)
+            if query_vector is None:
+                self.search_results = await self.searcher.search_and_embed(
+                    search_query,
+                    top=top,
+                    enable_vector_search=self.chat_params.enable_vector_search,
+                    enable_text_search=self.chat_params.enable_text_search,
+                    filters=filters,
+                )
+                self.embed_duration_ms = self.searcher.embed_duration_ms
+            else:
+                self.search_results = await self.searcher.search(
+                    search_query if self.chat_params.enable_text_search else None,
+                    query_vector if self.chat_params.enable_vector_search else [],
+                    top,
+                    filters,
+                )
+
+    def plan_steps(self, search_query: str, filters: Optional[list[dict]], started_at: float) -> list[ThoughtStep]:
+            # Pasos que describen lo decidido por plan_search() (sin reescritura no hay nada que mostrar)
+            return []
 
-class RAGChatBase:
-    prompts_dir = Path(__file__).parent.resolve() / "prompts"
-    answer_prompt_template: str = open(prompts_dir / "answer.txt").read()
+    def retrieval_steps(self, started_at: float) -> list[ThoughtStep]:
+            # Pasos que describen lo recuperado por retrieve()
+            if self.series is not None:
+                return [
+                    ThoughtStep(
+                        title="Time series",
+                        description=self.series.model_dump(mode="json"),
+                        props=self.phase_props(started_at),
+                    )
+                ]
+            props = self.phase_props(started_at)
+            if self.embed_duration_ms is not None:
+                props["embed_ms"] = self.embed_duration_ms
+            return [
+                ThoughtStep(
+                    title="Search results",
+                    description=list(self.get_data_points(self.search_results).values()),
+                    props=props,
+                ),
+                ThoughtStep(
+                    title="Numeric summary",
+                    description=summarize_fueling_rows(self.search_results).model_dump(mode="json"),
+                ),
+            ]
+
+    @staticmethod
+    def phase_props(started_at: float) -> dict[str, Any]:
+            # Duración de la fase, para medir la latencia de cada etapa desde el cliente
+            return {"duration_ms": round((time.perf_counter() - started_at) * 1000, 1)}
+
+    def get_data_points(self, items: list) -> dict[str, dict]:
+            # Solo los `top` ejemplos enviados al LLM, en su versión pública
+            web_friendly_items = [
+                AbastecimentoPublic.model_validate(item, from_attributes=True) for item in items[: self.chat_params.top]
+            ]
+            return {f"{item.placa}-{item.data}": item.model_dump() for item in web_friendly_items}
 
     def get_chat_params(self, messages: list[Message], overrides: ChatRequestOverrides) -> ChatParams:
             """
@@ -32,10 +156,36 @@ class RAGChatBase:
                 enable_vector_search=overrides.retrieval_mode in ("vectors", "hybrid"),
             )    
     
-    def prepare_rag_request(self, query: str, results: list[AbastecimentoPublic]) -> str:
+    async def compact_history(self) -> None:
+            """
+            Reemplaza past_messages por un historial acotado (últimos turnos + resumen incremental),
+            para que el tamaño del prompt no crezca con cada turno.
+            """
+            history_manager = ChatHistoryManager(
+                openai_chat_client=self.openai_chat_client,
+                chat_model=self.chat_model,
+                chat_deployment=self.chat_deployment,
+                max_turns=self.chat_params.history_max_turns,
+                summarize_every=self.chat_params.history_summarize_every,
+                max_tokens=self.chat_params.history_max_tokens,
+            )
+            self.chat_params.past_messages, self.session_state = await history_manager.compact(
+                self.chat_params.past_messages, self.session_state
+            )
+
+    def prepare_rag_request(
+        self,
+        query: str,
+        results: list[AbastecimentoPublic],
+        exemplar_count: int = 3,
+        series: Optional[DownsampledSeries] = None,
+    ) -> str:
+            # El resumen numérico se calcula sobre todas las filas, pero solo se envían unas pocas como ejemplo.
+            # En modo "timeseries" el resumen es la serie reducida, de tamaño fijo sin importar el rango de fechas
+            summary = series.to_prompt() if series is not None else summarize_fueling_rows(results).to_prompt()
             sources = ""
             # La numeración de los documentos ahora empieza en 1 para que coincida con las citas
-            for i, result in enumerate(results, 1):
+            for i, result in enumerate(results[:exemplar_count], 1):
                 sources += (
                     f"[doc{i}]\n"
                     f"Placa: {result.placa}\n"
@@ -43,5 +193,82 @@ class RAGChatBase:
                     f"Costo Combustible: {result.custo_combustivel}\n"
                     f"Eficiencia: {result.km_diesel}\n\n"
                 )
-            # Usamos el nuevo prompt que incluye los placeholders {sources} y {query}
-            return self.answer_prompt_template.format(sources=sources, query=query)
\ No newline at end of file
+            # Usamos el nuevo prompt que incluye los placeholders {summary}, {sources} y {query}
+            return self.answer_prompt_template.format(summary=summary, sources=sources, query=query)
+
+    async def stream_response(self) -> AsyncGenerator[RetrievalResponseDelta, None]:
+            """
+            Todo el pipeline dentro del stream: emite un evento de progreso por cada fase de la recuperación
+            (reescritura, filtros, búsqueda con data_points) y luego los deltas de la respuesta.
+            """
+            thoughts: list[ThoughtStep] = []
+            async for thought in self.prepare_context_steps():
+                thoughts.append(thought)
+                yield RetrievalResponseDelta(
+                    delta=Message(content="", role=AIChatRoles.ASSISTANT),
+                    context=RAGContext(data_points=self.get_data_points(self.search_results), thoughts=list(thoughts)),
+                )
+            # Se cierra explícitamente para que el stream de OpenAI se corte en cuanto el cliente se va
+            answer = self.answer_stream(self.search_results, thoughts)
+            try:
+                async for delta in answer:
+                    yield delta
+            finally:
+                with anyio.CancelScope(shield=True):
+                    await answer.aclose()
+
+    def answer_messages(self, items: list) -> list[dict[str, str]]:
+            # Prepara los mensajes para la API de OpenAI: historial acotado + prompt con resumen y ejemplos
+            rag_prompt = self.prepare_rag_request(
+                self.chat_params.original_user_query, items, self.chat_params.top, self.series
+            )
+            return self.chat_params.past_messages + [{"role": "user", "content": rag_prompt}]
+
+    async def answer(self, items: list, earlier_thoughts: list[ThoughtStep]) -> RetrievalResponse:
+            response = await self.openai_chat_client.chat.completions.create(
+                model=self.chat_deployment or self.chat_model,
+                messages=self.answer_messages(items),
+                temperature=self.chat_params.temperature,
+                max_tokens=self.chat_params.response_token_limit,
+                seed=self.chat_params.seed,
+            )
+
+            return RetrievalResponse(
+                message=Message(content=response.choices[0].message.content or "", role=AIChatRoles.ASSISTANT),
+                context=RAGContext(data_points=self.get_data_points(items), thoughts=earlier_thoughts),
+                session_state=self.session_state,
+            )
+
+    async def answer_stream(self, items: list, earlier_thoughts: list[ThoughtStep]):
+            messages_for_llm = self.answer_messages(items)
+            # El prompt lleva filas de la flota: solo a nivel debug
+            logger.debug("Answering with %d results, prompt:\n%s", len(items), messages_for_llm[-1]["content"])
+
+            yield RetrievalResponseDelta(
+                delta=Message(content="", role=AIChatRoles.ASSISTANT),
+                context=RAGContext(data_points=self.get_data_points(items), thoughts=earlier_thoughts),
+                session_state=self.session_state,
+            )
+
+            # CORRECCIÓN: Se reemplaza la lógica del 'Runner' por una llamada directa a la API
+            response_stream = await self.openai_chat_client.chat.completions.create(
+                model=self.chat_deployment or self.chat_model,
+                messages=messages_for_llm,
+                temperature=self.chat_params.temperature,
+                max_tokens=self.chat_params.response_token_limit,
+                seed=self.chat_params.seed,
+                stream=True
+            )
+
+            # Procesa la respuesta en "pedacitos" y la envía al frontend
+            try:
+                async for chunk in response_stream:
+                    if not chunk.choices:
+                        continue
+                    content_delta = chunk.choices[0].delta.content
+                    if content_delta:
+                        yield RetrievalResponseDelta(delta=Message(content=content_delta, role=AIChatRoles.ASSISTANT))
+            finally:
+                # Cerrar la respuesta HTTP corta la generación en OpenAI y deja de consumir tokens
+                with anyio.CancelScope(shield=True):
+                    await response_stream.close()
@@ -1,9 +1,11 @@
-from typing import List, Optional, Union
+import time
+from collections.abc import AsyncGenerator
+from typing import Any, List, Optional, Union
 
 from openai import AsyncAzureOpenAI, AsyncOpenAI
 
 # CAMBIO: Se usan los modelos correctos
-from fastapi_app.api_models import ChatRequestOverrides, Message, AbastecimentoPublic, RetrievalResponse, RAGContext, AIChatRoles, ThoughtStep
+from fastapi_app.api_models import ChatRequestOverrides, Message, ThoughtStep
 from fastapi_app.postgres_searcher import PostgresSearcher
 from fastapi_app.rag_base import RAGChatBase
 
@@ -14,49 +16,31 @@ class SimpleRAGChat(RAGChatBase):
         *,
         messages: List[Message],
         overrides: ChatRequestOverrides,
-        searcher: PostgresSearcher,
+        searcher: Optional[PostgresSearcher],
         openai_chat_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
         chat_model: str,
         chat_deployment: Optional[str] = None,
+        session_state: Optional[Any] = None,
     ):
+        super().__init__()
         self.messages = messages
         self.overrides = overrides
         self.searcher = searcher
         self.openai_chat_client = openai_chat_client
         self.chat_model = chat_model
         self.chat_deployment = chat_deployment
+        self.session_state = session_state
         self.chat_params = self.get_chat_params(messages, overrides)
 
-    async def prepare_context(self) -> tuple[list[AbastecimentoPublic], list[ThoughtStep]]:
-        query = self.messages[-1].content
+    async def plan_search(self) -> tuple[str, Optional[list[dict]]]:
+        # Sin reescritura, pero el historial que acompaña a la respuesta se acota igual que en el flujo avanzado
+        await self.compact_history()
+        return await super().plan_search()
 
-        results = await self.searcher.search_and_embed(
-            query,
-            top=self.chat_params.top,
-            enable_vector_search=self.chat_params.enable_vector_search,
-            enable_text_search=self.chat_params.enable_text_search,
-        )
-
-        thoughts = [ThoughtStep(title="Search results", description=[item.model_dump() for item in results])]
-        return results, thoughts
-    
-    async def answer(self, items: list[AbastecimentoPublic], earlier_thoughts: list[ThoughtStep]) -> RetrievalResponse:
-        rag_prompt = self.prepare_rag_request(self.chat_params.original_user_query, items)
-        
-        response = await self.openai_chat_client.chat.completions.create(
-            model=self.chat_deployment or self.chat_model,
-            messages=[{"role": "user", "content": rag_prompt}],
-            temperature=self.chat_params.temperature,
-            max_tokens=self.chat_params.response_token_limit,
-            seed=self.chat_params.seed,
-        )
-        
-        response_content = response.choices[0].message.content or ""
-        
-        return RetrievalResponse(
-            message=Message(content=response_content, role=AIChatRoles.ASSISTANT),
-            context=RAGContext(
-                data_points={f"{item.placa}-{item.data}": item.model_dump() for item in items},
-                thoughts=earlier_thoughts,
-            ),
-        )
\ No newline at end of file
+    async def prepare_context_steps(self) -> AsyncGenerator[ThoughtStep, None]:
+        started_at = time.perf_counter()
+        # Sin reescritura no hay filtros: en modo "timeseries" la serie cubre toda la flota
+        search_query, filters = await self.plan_search()
+        await self.retrieve(search_query, filters)
+        for step in self.retrieval_steps(started_at):
+            yield step
@@ -1,21 +1,27 @@
 import json
 import logging
 from collections.abc import AsyncGenerator
-from typing import Union, List
+from typing import Callable, List, Optional, Union
 
+import anyio
 import fastapi
 from openai import APIError
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Importaciones adaptadas
 from fastapi_app.api_models import (
+    ChatBatchRequest,
     ChatRequest,
     ChatResponse,
     AbastecimentoPublic,
     ErrorResponse,
     RetrievalResponseDelta, # <-- Añadido para el stream
 )
-from fastapi_app.dependencies import ChatClient, CommonDeps, DBSession, EmbeddingsClient
+from fastapi_app.chat_batch import ChatBatchRunner
+from fastapi_app.dependencies import ChatClient, CommonDeps, DBReadSession, DBReadSessionMaker, EmbeddingsClient
+from fastapi_app.metrics import chat_stream_cancellations
 from fastapi_app.postgres_searcher import PostgresSearcher
 from fastapi_app.query_rewriter import rewrite_query
 from fastapi_app.rag_advanced import AdvancedRAGChat
@@ -25,22 +31,47 @@ router = fastapi.APIRouter()
 logger = logging.getLogger("ragapp")
 ERROR_FILTER = {"error": "Your message contains content that was flagged by the content filter."}
 
-async def format_as_ndjson(r: AsyncGenerator[RetrievalResponseDelta, None]) -> AsyncGenerator[str, None]:
+async def format_as_ndjson(
+    r: AsyncGenerator[BaseModel, None], request: Optional[fastapi.Request] = None
+) -> AsyncGenerator[str, None]:
     """
     Función de ayuda para formatear la respuesta de streaming.
+    Si se pasa la request, deja de consumir el generador en cuanto el cliente se desconecta.
     """
     try:
         async for event in r:
+            if request is not None and await request.is_disconnected():
+                logger.info("Client disconnected, cancelling the response stream")
+                chat_stream_cancellations.add(1, {"reason": "disconnect"})
+                return
             yield event.model_dump_json() + "\n"
+    except anyio.get_cancelled_exc_class():
+        # Starlette cancela la respuesta cuando recibe http.disconnect en medio de una espera
+        logger.info("Response stream cancelled")
+        chat_stream_cancellations.add(1, {"reason": "cancelled"})
+        raise
     except Exception as error:
-        # ... (manejo de errores)
+        logger.exception("Exception while generating response stream: %s", error)
         yield json.dumps({"error": str(error)}, ensure_ascii=False) + "\n"
+    finally:
+        # Cierra el pipeline (stream de OpenAI y sesión de base de datos) aunque la tarea esté cancelada
+        with anyio.CancelScope(shield=True):
+            await r.aclose()
+
+
+@router.get("/ready")
+async def ready_handler(request: fastapi.Request):
+    """
+    Readiness probe: 503 mientras corre el warm-up de arranque, luego 200 con la duración de cada paso.
+    """
+    status = request.state.warmup.status
+    return JSONResponse(status.model_dump(), status_code=200 if status.ready else 503)
 
 
 @router.post("/chat")
 async def chat_handler(
     context: CommonDeps,
-    database_session: DBSession,
+    database_session: DBReadSession,
     openai_chat: ChatClient,
     openai_embed: EmbeddingsClient,
     chat_request: ChatRequest,
@@ -64,6 +95,7 @@ async def chat_handler(
             embed_model=context.openai_embed_model,
             embed_dimensions=context.openai_embed_dimensions,
             embedding_column="embedding_main",
+            embed_hedger=openai_embed.hedger,
         )
         
         results = await searcher.search_and_embed(
@@ -87,55 +119,105 @@ async def chat_handler(
         return ErrorResponse(error=str(e))
 
 
+async def stream_pipeline(
+    sessionmaker: Callable[[], AsyncSession],
+    build_flow: Callable[[AsyncSession], Union[SimpleRAGChat, AdvancedRAGChat]],
+) -> AsyncGenerator[RetrievalResponseDelta, None]:
+    """
+    Todo el pipeline de /chat/stream (reescritura, embedding, búsqueda y respuesta) como eventos del stream.
+    La sesión se abre dentro del generador: vive exactamente lo que dura el stream.
+    Si el cliente se desconecta, la cancelación interrumpe la consulta asyncpg en curso
+    (asyncpg envía el cancel al servidor) y la sesión se cierra enseguida, liberando la conexión.
+    """
+    database_session = sessionmaker()
+    try:
+        events = build_flow(database_session).stream_response()
+        try:
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+    finally:
+        with anyio.CancelScope(shield=True):
+            await database_session.close()
+
+
 @router.post("/chat/stream")
 async def chat_stream_handler(
+    request: fastapi.Request,
     context: CommonDeps,
-    database_session: DBSession,
+    sessionmaker: DBReadSessionMaker,
     openai_chat: ChatClient,
     openai_embed: EmbeddingsClient,
     chat_request: ChatRequest,
 ):
     """
     Maneja las peticiones de chat que esperan una respuesta en tiempo real (streaming).
+    Todo el pipeline (reescritura, embedding, búsqueda y respuesta) corre dentro del stream,
+    así el cliente recibe eventos de progreso desde el primer momento.
     """
-    searcher = PostgresSearcher(
-        db_session=database_session,
-        openai_embed_client=openai_embed.client,
-        embed_deployment=context.openai_embed_deployment,
-        embed_model=context.openai_embed_model,
-        embed_dimensions=context.openai_embed_dimensions,
-        embedding_column="embedding_main",
-    )
-    
-    # El repositorio original usa las clases RAG para el streaming. Las reutilizamos.
-    rag_flow: Union[SimpleRAGChat, AdvancedRAGChat]
-    if chat_request.context.overrides.use_advanced_flow:
-        rag_flow = AdvancedRAGChat(
-            messages=chat_request.messages,
-            overrides=chat_request.context.overrides,
-            searcher=searcher,
-            openai_chat_client=openai_chat.client,
-            chat_model=context.openai_chat_model,
-            chat_deployment=context.openai_chat_deployment,
+
+    def build_flow(database_session: AsyncSession) -> Union[SimpleRAGChat, AdvancedRAGChat]:
+        searcher = PostgresSearcher(
+            db_session=database_session,
+            openai_embed_client=openai_embed.client,
+            embed_deployment=context.openai_embed_deployment,
+            embed_model=context.openai_embed_model,
+            embed_dimensions=context.openai_embed_dimensions,
+            embedding_column="embedding_main",
+            embed_hedger=openai_embed.hedger,
         )
-    else:
-        rag_flow = SimpleRAGChat(
+
+        # El repositorio original usa las clases RAG para el streaming. Las reutilizamos.
+        if chat_request.context.overrides.use_advanced_flow:
+            return AdvancedRAGChat(
+                messages=chat_request.messages,
+                overrides=chat_request.context.overrides,
+                searcher=searcher,
+                openai_chat_client=openai_chat.client,
+                chat_model=context.openai_chat_model,
+                chat_deployment=context.openai_chat_deployment,
+                session_state=chat_request.sessionState,
+                chat_hedger=openai_chat.hedger,
+            )
+        return SimpleRAGChat(
             messages=chat_request.messages,
             overrides=chat_request.context.overrides,
             searcher=searcher,
             openai_chat_client=openai_chat.client,
             chat_model=context.openai_chat_model,
             chat_deployment=context.openai_chat_deployment,
+            session_state=chat_request.sessionState,
         )
 
-    try:
-        # La lógica de streaming del repositorio original
-        items, thoughts = await rag_flow.prepare_context()
-        result = rag_flow.answer_stream(items, thoughts)
-        return StreamingResponse(content=format_as_ndjson(result), media_type="application/x-ndjson")
-    except Exception as e:
-        # ... (manejo de errores para el stream)
-        return StreamingResponse(
-            content=json.dumps({"error": str(e)}, ensure_ascii=False) + "\n",
-            media_type="application/x-ndjson",
-        )
\ No newline at end of file
+    # Los errores de cualquier fase se envían como una línea {"error": ...} dentro del stream
+    return StreamingResponse(
+        content=format_as_ndjson(stream_pipeline(sessionmaker, build_flow), request), media_type="application/x-ndjson"
+    )
+
+
+@router.post("/chat/batch")
+async def chat_batch_handler(
+    request: fastapi.Request,
+    context: CommonDeps,
+    sessionmaker: DBReadSessionMaker,
+    openai_chat: ChatClient,
+    openai_embed: EmbeddingsClient,
+    batch_request: ChatBatchRequest,
+):
+    """
+    Responde muchas preguntas en una sola petición (p. ej. para los informes nocturnos).
+    Cada línea del NDJSON es un {"index", "response", "error"}, en orden de finalización.
+    """
+    runner = ChatBatchRunner(
+        requests=batch_request.requests,
+        sessionmaker=sessionmaker,
+        openai_chat_client=openai_chat.client,
+        chat_model=context.openai_chat_model,
+        chat_deployment=context.openai_chat_deployment,
+        openai_embed_client=openai_embed.client,
+        embed_model=context.openai_embed_model,
+        embed_deployment=context.openai_embed_deployment,
+        embed_dimensions=context.openai_embed_dimensions,
+    )
+    return StreamingResponse(content=format_as_ndjson(runner.run(), request), media_type="application/x-ndjson")
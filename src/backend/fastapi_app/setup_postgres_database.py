@@ -4,9 +4,12 @@ import logging
 
 from dotenv import load_dotenv
 from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 
+from fastapi_app.embedding_worker import trigger_ddl
+from fastapi_app.manage_indexes import IndexBuildSettings, build_missing_indexes
 from fastapi_app.postgres_engine import create_postgres_engine_from_args, create_postgres_engine_from_env
-from fastapi_app.postgres_models import Base
+from fastapi_app.postgres_models import Abastecimento, Base, Veiculo
 
 logger = logging.getLogger("ragapp")
 
@@ -15,11 +18,33 @@ async def create_db_schema(engine):
     async with engine.begin() as conn:
         logger.info("Enabling the pgvector extension for Postgres...")
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        # pg_prewarm es opcional (el warm-up de la app lo usa para cargar los índices HNSW en memoria)
+        try:
+            async with conn.begin_nested():
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_prewarm"))
+        except DBAPIError as error:
+            logger.warning("Could not enable the pg_prewarm extension: %s", error.orig)
         logger.info("Creating database tables and indexes...")
         await conn.run_sync(Base.metadata.create_all)
+        # create_all no agrega columnas nuevas a tablas existentes
+        logger.info("Adding embedding bookkeeping columns to existing tables...")
+        for table in Base.metadata.sorted_tables:
+            for column in table.columns:
+                if column.name.endswith(("_text_hash", "_model", "_dirty_at", "_claimed_until", "_attempts")):
+                    column_type = column.type.compile(dialect=conn.dialect)
+                    await conn.execute(
+                        text(f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column_type}")
+                    )
+        logger.info("Installing the triggers that queue rows for the embedding worker...")
+        for statement in trigger_ddl([Veiculo.__table__, Abastecimento.__table__]):
+            await conn.execute(text(statement))
 
     await conn.close()
 
+    # Fuera de la transacción: los índices vectoriales se construyen con CONCURRENTLY (ver manage_indexes)
+    logger.info("Building missing vector indexes...")
+    await build_missing_indexes(engine, IndexBuildSettings())
+
 
 async def main():
     parser = argparse.ArgumentParser(description="Create database schema")
@@ -1,68 +1,243 @@
+"""
+Carga de datos semilla, por streaming e idempotente.
+
+Cada tabla se guarda en `seed_data/<tabla>.jsonl` (una fila JSON por línea, sin vectores) y cada columna de
+embeddings en un archivo `.npy` al lado, `seed_data/<tabla>.<columna>.npy`, con una fila por línea del JSONL
+(float32 o float16; una fila NaN es un vector NULL). Los `.npy` se abren con memmap y el JSONL se lee por
+trozos, así la memoria no depende del tamaño de la semilla. Cada trozo se copia con COPY a una tabla temporal
+y se inserta con ON CONFLICT DO NOTHING: volver a sembrar no duplica ni pisa filas.
+
+    python src/backend/fastapi_app/setup_postgres_seeddata.py
+    python src/backend/fastapi_app/setup_postgres_seeddata.py --export --dtype float16
+"""
+
 import argparse
 import asyncio
 import json
 import logging
-import os
+from collections.abc import Iterator
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable
 
 import numpy as np
-import sqlalchemy.exc
 from dotenv import load_dotenv
-from sqlalchemy import select, text
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Table, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 from fastapi_app.postgres_engine import (
     create_postgres_engine_from_args,
     create_postgres_engine_from_env,
 )
-from fastapi_app.postgres_models import Item
+from fastapi_app.postgres_models import Abastecimento, Veiculo
 
 logger = logging.getLogger("ragapp")
 
+SEED_DIR = Path(__file__).parent / "seed_data"
+SEED_TABLES: list[Table] = [Veiculo.__table__, Abastecimento.__table__]
+# Filas por trozo leído del JSONL y copiado con COPY
+CHUNK_SIZE = 5000
+VECTOR_DTYPES = ("float32", "float16")
+# Estado de la cola del worker de embeddings: no se exporta ni se siembra
+QUEUE_COLUMNS = ("embedding_dirty_at", "embedding_claimed_until", "embedding_attempts")
+
+
+def seed_columns(table: Table) -> tuple[list[Column], list[Column]]:
+    """Columnas que van al JSONL y columnas de embeddings que van a los `.npy`."""
+    row_columns = [
+        column for column in table.columns if not isinstance(column.type, Vector) and column.name not in QUEUE_COLUMNS
+    ]
+    vector_columns = [column for column in table.columns if isinstance(column.type, Vector)]
+    return row_columns, vector_columns
+
+
+def rows_path(directory: Path, table: Table) -> Path:
+    return directory / f"{table.name}.jsonl"
+
+
+def vectors_path(directory: Path, table: Table, column: Column) -> Path:
+    return directory / f"{table.name}.{column.name}.npy"
+
+
+def encode_value(value: Any) -> Any:
+    # Fechas y NUMERIC como texto, para que el JSON conserve el valor exacto
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def value_converter(column: Column) -> Callable[[Any], Any]:
+    python_type = column.type.python_type
+    if python_type is date:
+        return lambda value: None if value is None else date.fromisoformat(value)
+    return lambda value: None if value is None else python_type(value)
+
+
+def read_seed_chunks(
+    directory: Path, table: Table, chunk_size: int = CHUNK_SIZE
+) -> Iterator[tuple[list[str], list[tuple]]]:
+    """Lee la semilla de una tabla por trozos: (nombres de columnas, filas listas para COPY)."""
+    row_columns, vector_columns = seed_columns(table)
+    converters = [(column.name, value_converter(column)) for column in row_columns]
+    vectors: dict[str, np.ndarray] = {}
+    for column in vector_columns:
+        path = vectors_path(directory, table, column)
+        if not path.exists():
+            continue
+        # memmap: solo se leen del disco las filas de cada trozo
+        array = np.load(path, mmap_mode="r")
+        if array.ndim != 2 or array.shape[1] != column.type.dim:
+            raise ValueError(f"{path.name} has shape {array.shape}, expected (rows, {column.type.dim})")
+        vectors[column.name] = array
+    names = [name for name, _ in converters] + list(vectors)
+    start = 0
+    with open(rows_path(directory, table), encoding="utf-8") as f:
+        while lines := list(islice(f, chunk_size)):
+            records = [json.loads(line) for line in lines]
+            columns = [[convert(record.get(name)) for record in records] for name, convert in converters]
+            for name, array in vectors.items():
+                chunk = np.asarray(array[start : start + len(records)], dtype=np.float32)
+                if len(chunk) != len(records):
+                    raise ValueError(f"{table.name}.{name}.npy has fewer rows than {table.name}.jsonl")
+                missing = np.isnan(chunk[:, 0])
+                columns.append([None if is_missing else vector for vector, is_missing in zip(chunk, missing)])
+            start += len(records)
+            yield names, list(zip(*columns))
+    for name, array in vectors.items():
+        if len(array) != start:
+            raise ValueError(f"{table.name}.{name}.npy has {len(array)} rows but {table.name}.jsonl has {start}")
 
-async def seed_data(engine):
-    # Check if Item table exists
+
+class SeedFileWriter:
+    """Escribe la semilla de una tabla: el JSONL fila a fila y cada `.npy` ya dimensionado con open_memmap."""
+
+    def __init__(self, directory: Path, table: Table, row_count: int, dtype: str = "float16"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype}, use one of {VECTOR_DTYPES}")
+        directory.mkdir(parents=True, exist_ok=True)
+        self.row_columns, self.vector_columns = seed_columns(table)
+        self.rows_file = open(rows_path(directory, table), "w", encoding="utf-8")
+        self.vectors = [
+            np.lib.format.open_memmap(
+                vectors_path(directory, table, column), mode="w+", dtype=dtype, shape=(row_count, column.type.dim)
+            )
+            for column in self.vector_columns
+        ]
+        self.position = 0
+
+    def write(self, rows: list[tuple]) -> None:
+        """Filas con los valores de row_columns seguidos de los de vector_columns."""
+        names = [column.name for column in self.row_columns]
+        for row in rows:
+            values = row[: len(names)]
+            self.rows_file.write(json.dumps(dict(zip(names, map(encode_value, values))), ensure_ascii=False) + "\n")
+            for array, vector in zip(self.vectors, row[len(names) :]):
+                array[self.position] = np.nan if vector is None else vector
+            self.position += 1
+
+    def close(self) -> None:
+        self.rows_file.close()
+        for array in self.vectors:
+            array.flush()
+
+
+async def seed_table(engine: AsyncEngine, directory: Path, table: Table, chunk_size: int = CHUNK_SIZE) -> int:
+    """Siembra una tabla en una sola transacción y devuelve las filas nuevas."""
+    staging = f"{table.name}_seed"
+    inserted = 0
     async with engine.begin() as conn:
-        table_name = Item.__tablename__
-        result = await conn.execute(
-            text(
-                f"SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_schema = 'public' AND table_name = '{table_name}')"  # noqa
+        driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+        created = False
+        for names, rows in read_seed_chunks(directory, table, chunk_size):
+            column_list = ", ".join(names)
+            if not created:
+                await conn.execute(
+                    text(
+                        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                        f"SELECT {column_list} FROM {table.name} WITH NO DATA"
+                    )
+                )
+                created = True
+            await driver_connection.copy_records_to_table(staging, records=rows, columns=names)
+            # Sin objetivo de conflicto: cualquier fila que ya exista (por clave primaria) se deja como está
+            result = await conn.execute(
+                text(
+                    f"INSERT INTO {table.name} ({column_list}) "
+                    f"SELECT {column_list} FROM {staging} ON CONFLICT DO NOTHING"
+                )
             )
-        )
-        if not result.scalar():
-            logger.error(f" {table_name} table does not exist. Please run the database setup script first.")
-            return
-
-    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
-        # Insert the objects from the JSON file into the database
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        with open(os.path.join(current_dir, "seed_data.json")) as f:
-            seed_data_objects = json.load(f)
-            for seed_data_object in seed_data_objects:
-                db_item = await session.execute(select(Item).filter(Item.id == seed_data_object["id"]))
-                if db_item.scalars().first():
-                    continue
-                attrs = {key: value for key, value in seed_data_object.items()}
-                attrs["embedding_3l"] = np.array(seed_data_object["embedding_3l"])
-                attrs["embedding_nomic"] = np.array(seed_data_object["embedding_nomic"])
-                column_names = ", ".join(attrs.keys())
-                values = ", ".join([f":{key}" for key in attrs.keys()])
-                await session.execute(text(f"INSERT INTO {table_name} ({column_names}) VALUES ({values})"), attrs)
-            try:
-                await session.commit()
-            except sqlalchemy.exc.IntegrityError:
-                pass
-
-    logger.info(f"{table_name} table seeded successfully.")
+            inserted += result.rowcount
+            await conn.execute(text(f"TRUNCATE {staging}"))
+        if created:
+            await conn.execute(text(f"ANALYZE {table.name}"))
+    return inserted
+
+
+async def seed_data(engine: AsyncEngine, directory: Path = SEED_DIR, chunk_size: int = CHUNK_SIZE) -> None:
+    # Check if the tables exist
+    async with engine.connect() as conn:
+        for table in SEED_TABLES:
+            result = await conn.execute(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM information_schema.tables "
+                    "WHERE table_schema = 'public' AND table_name = :table_name)"
+                ),
+                {"table_name": table.name},
+            )
+            if not result.scalar():
+                logger.error(f" {table.name} table does not exist. Please run the database setup script first.")
+                return
+
+    for table in SEED_TABLES:
+        if not rows_path(directory, table).exists():
+            logger.info("No seed data for %s in %s, skipping.", table.name, directory)
+            continue
+        inserted = await seed_table(engine, directory, table, chunk_size)
+        logger.info(f"{table.name} table seeded successfully ({inserted} new rows).")
+
+
+async def export_seed_data(
+    engine: AsyncEngine, directory: Path = SEED_DIR, dtype: str = "float16", chunk_size: int = CHUNK_SIZE
+) -> None:
+    """Vuelca las tablas de la base al formato de semilla (JSONL + `.npy`)."""
+    for table in SEED_TABLES:
+        row_columns, vector_columns = seed_columns(table)
+        async with engine.connect() as conn:
+            # Misma instantánea para el conteo (que dimensiona los .npy) y para las filas
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+            async with conn.begin():
+                row_count = (await conn.execute(select(func.count()).select_from(table))).scalar_one()
+                writer = SeedFileWriter(directory, table, row_count, dtype)
+                try:
+                    result = await conn.stream(
+                        select(*row_columns, *vector_columns)
+                        .order_by(*table.primary_key.columns)
+                        .execution_options(yield_per=chunk_size)
+                    )
+                    async for rows in result.partitions(chunk_size):
+                        writer.write(rows)
+                finally:
+                    writer.close()
+        logger.info("Exported %d rows of %s to %s", row_count, table.name, directory)
 
 
 async def main():
-    parser = argparse.ArgumentParser(description="Create database schema")
+    parser = argparse.ArgumentParser(description="Seed the database (or export it as seed data)")
     parser.add_argument("--host", type=str, help="Postgres host")
     parser.add_argument("--username", type=str, help="Postgres username")
     parser.add_argument("--password", type=str, help="Postgres password")
     parser.add_argument("--database", type=str, help="Postgres database")
     parser.add_argument("--sslmode", type=str, help="Postgres sslmode")
     parser.add_argument("--tenant-id", type=str, help="Azure tenant ID", default=None)
+    parser.add_argument("--directory", type=Path, default=SEED_DIR, help="Seed data directory")
+    parser.add_argument("--export", action="store_true", help="Write the database tables as seed data")
+    parser.add_argument("--dtype", choices=VECTOR_DTYPES, default="float16", help="Embedding dtype when exporting")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per COPY")
 
     # if no args are specified, use environment variables
     args = parser.parse_args()
@@ -71,7 +246,10 @@ async def main():
     else:
         engine = await create_postgres_engine_from_args(args)
 
-    await seed_data(engine)
+    if args.export:
+        await export_seed_data(engine, args.directory, args.dtype, args.chunk_size)
+    else:
+        await seed_data(engine, args.directory, args.chunk_size)
 
     await engine.dispose()
 
@@ -0,0 +1,71 @@
+from datetime import date
+from typing import Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+
+class SeriesPoint(BaseModel):
+    fecha: date
+    registros: int
+    diesel: Optional[float] = None
+    km_percorrido: Optional[float] = None
+    custo_combustivel: Optional[float] = None
+    km_diesel: Optional[float] = None
+
+
+class DownsampledSeries(BaseModel):
+    bucket: str
+    source_points: int
+    points: list[SeriesPoint]
+
+    def to_prompt(self) -> str:
+        """Fixed-size text block with the series, one line per point."""
+        if not self.points:
+            return "Sin registros para la serie temporal."
+        lines = [
+            f"Serie temporal por {self.bucket} ({len(self.points)} de {self.source_points} puntos, "
+            f"de {self.points[0].fecha} a {self.points[-1].fecha}):",
+            "fecha | registros | diesel | km_percorrido | custo_combustivel | km_diesel",
+        ]
+        for point in self.points:
+            lines.append(
+                f"{point.fecha} | {point.registros} | {_fmt(point.diesel)} | {_fmt(point.km_percorrido)} | "
+                f"{_fmt(point.custo_combustivel)} | {_fmt(point.km_diesel)}"
+            )
+        return "\n".join(lines)
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling: returns the indices of the `n_out` points
+    that best preserve the visual shape of the series. First and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:n_out]
+
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    x = np.asarray(x, dtype=np.float64)
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # Twice the area of the triangle (previous selected point, candidate, next bucket average)
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected[i + 1] = previous
+    return selected
@@ -1,79 +1,380 @@
+"""
+Backfill de embeddings por lotes, concurrente, reanudable e incremental.
+
+Las filas se leen con un cursor del lado del servidor en orden de clave primaria. Solo se envían a la API
+las filas cuyo texto (hash de to_str_for_embedding) o modelo/dimensiones cambiaron desde el último embedding,
+o que todavía no tienen vector (--all las re-embebe todas). Los textos repetidos se embeben una sola vez
+(y se reutilizan de la tabla embedding_cache entre ejecuciones); los textos nuevos se agrupan en lotes
+de hasta EMBEDDING_BATCH_SIZE por petición y se mantienen varias peticiones en vuelo (el cliente
+usa el presupuesto "background_embed" del control de admisión). Cada lote se escribe con COPY a una
+tabla temporal y un único UPDATE ... FROM. La última clave escrita sin huecos se guarda en un archivo
+de checkpoint, así una ejecución interrumpida continúa donde quedó.
+
+    python src/backend/fastapi_app/update_embeddings.py --table abastecimento --column embedding_main
+"""
+
 import argparse
 import asyncio
 import json
 import logging
-import os
+import time
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Optional, Union
 
 from dotenv import load_dotenv
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from pgvector.sqlalchemy import Vector
+from pydantic import BaseModel
+from sqlalchemy import Column, Table, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import load_only
 
-from fastapi_app.dependencies import common_parameters, get_azure_credential
-from fastapi_app.embeddings import compute_text_embedding
+from fastapi_app.dependencies import FastAPIAppContext, common_parameters, get_azure_credential
+from fastapi_app.embeddings import EMBEDDING_BATCH_SIZE, compute_text_embeddings, embedding_model_tag, text_hash
 from fastapi_app.openai_clients import create_openai_embed_client
 from fastapi_app.postgres_engine import create_postgres_engine_from_env
-from fastapi_app.postgres_models import Item
+from fastapi_app.postgres_models import Abastecimento, Base, EmbeddingCache, Veiculo
 
 logger = logging.getLogger("ragapp")
 
+EMBEDDING_MODELS: dict[str, type[Base]] = {model.__tablename__: model for model in (Abastecimento, Veiculo)}
+# Filas traídas del cursor por viaje al servidor
+READ_BATCH_SIZE = 4096
+# Peticiones de embeddings en vuelo a la vez (el control de admisión puede dejar pasar menos)
+MAX_IN_FLIGHT = 4
+DEFAULT_CHECKPOINT = Path(".embedding_backfill.json")
+
+
+def encode_key(key: tuple) -> list[Any]:
+    # Fechas y NUMERIC como texto, para que el JSON conserve el valor exacto
+    return [
+        value.isoformat() if isinstance(value, date) else str(value) if isinstance(value, Decimal) else value
+        for value in key
+    ]
+
+
+def decode_key(columns: list[Column], values: list[Any]) -> tuple:
+    decoded = []
+    for column, value in zip(columns, values):
+        python_type = column.type.python_type
+        decoded.append(date.fromisoformat(value) if python_type is date else python_type(value))
+    return tuple(decoded)
+
+
+def check_embedding_column(table: Table, column: str, configured_dimensions: Optional[int]) -> int:
+    """Dimensiones de la columna de embeddings, si coinciden con las del modelo configurado."""
+    if column not in table.c or not isinstance(table.c[column].type, Vector):
+        raise ValueError(f"{column} is not an embedding column of {table.name}")
+    dimensions = table.c[column].type.dim
+    if configured_dimensions is not None and configured_dimensions != dimensions:
+        raise ValueError(
+            f"{table.name}.{column} stores {dimensions} dimensions but the embedding model is configured "
+            f"for {configured_dimensions}"
+        )
+    return dimensions
+
+
+async def fetch_cached_vectors(engine: AsyncEngine, model_tag: str, hashes: list[str]) -> dict[str, Any]:
+    """Vectores de embedding_cache para los hashes dados que ya se calcularon con ese modelo."""
+    if not hashes:
+        return {}
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            select(EmbeddingCache.text_hash, EmbeddingCache.embedding).where(
+                EmbeddingCache.model_tag == model_tag, EmbeddingCache.text_hash.in_(hashes)
+            )
+        )
+        return {row_hash: vector for row_hash, vector in result.all()}
+
+
+class BackfillCheckpoint:
+    """Última clave primaria escrita sin huecos, por tabla y columna, en un archivo JSON."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.keys: dict[str, list[Any]] = json.loads(path.read_text()) if path.exists() else {}
+
+    def get(self, name: str) -> Optional[list[Any]]:
+        return self.keys.get(name)
+
+    def save(self, name: str, key: Optional[list[Any]]) -> None:
+        if key is None:
+            self.keys.pop(name, None)
+        else:
+            self.keys[name] = key
+        # Escritura atómica: un corte a mitad de escritura no deja un checkpoint corrupto
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.keys))
+        temporary.replace(self.path)
 
-async def update_embeddings(in_seed_data=False):
-    azure_credential = await get_azure_credential()
-    engine = await create_postgres_engine_from_env(azure_credential)
-    openai_embed_client = await create_openai_embed_client(azure_credential)
-    common_params = await common_parameters()
 
-    embedding_column = ""
-    OPENAI_EMBED_HOST = os.getenv("OPENAI_EMBED_HOST")
-    if OPENAI_EMBED_HOST == "azure":
-        embedding_column = os.getenv("AZURE_OPENAI_EMBEDDING_COLUMN", "embedding_3l")
-    elif OPENAI_EMBED_HOST == "ollama":
-        embedding_column = os.getenv("OLLAMA_EMBEDDING_COLUMN", "embedding_nomic")
-    elif OPENAI_EMBED_HOST == "github":
-        embedding_column = os.getenv("GITHUB_EMBEDDING_COLUMN", "embedding_3l")
-    else:
-        embedding_column = os.getenv("OPENAICOM_EMBEDDING_COLUMN", "embedding_3l")
-    logger.info(f"Updating embeddings in column: {embedding_column}")
-    if in_seed_data:
-        current_dir = os.path.dirname(os.path.realpath(__file__))
-        rows = []
-        with open(os.path.join(current_dir, "seed_data.json")) as f:
-            seed_data_objects = json.load(f)
-            for seed_data_object in seed_data_objects:
-                # for each column in the JSON, store it in the same named attribute in the object
-                attrs = {key: value for key, value in seed_data_object.items()}
-                row = Item(**attrs)
-                embedding = await compute_text_embedding(
-                    row.to_str_for_embedding(),
-                    openai_client=openai_embed_client,
-                    embed_model=common_params.openai_embed_model,
-                    embed_deployment=common_params.openai_embed_deployment,
-                    embedding_dimensions=common_params.openai_embed_dimensions,
+class BackfillReport(BaseModel):
+    table: str
+    column: str
+    rows_scanned: int = 0
+    # Filas con el mismo texto y modelo que su embedding actual
+    rows_skipped: int = 0
+    rows_embedded: int = 0
+    # Textos enviados a la API y textos resueltos desde embedding_cache
+    texts_embedded: int = 0
+    cache_hits: int = 0
+    requests: int = 0
+    duration_seconds: float = 0.0
+
+
+class EmbeddingBackfill:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        openai_embed_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+        context: FastAPIAppContext,
+        model: type[Base],
+        column: str,
+        checkpoint: BackfillCheckpoint,
+        force: bool = False,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_in_flight: int = MAX_IN_FLIGHT,
+    ):
+        table = model.__table__
+        dimensions = check_embedding_column(table, column, context.openai_embed_dimensions)
+        self.engine = engine
+        self.openai_embed_client = openai_embed_client
+        self.context = context
+        self.model = model
+        self.table = table
+        self.column = column
+        self.key_columns: list[Column] = list(table.primary_key.columns)
+        self.checkpoint = checkpoint
+        self.checkpoint_name = f"{table.name}.{column}"
+        self.force = force
+        # Columnas con el hash del texto embebido y el modelo:dimensiones usado (ver postgres_models)
+        self.hash_column = f"{column}_text_hash"
+        self.model_column = f"{column}_model"
+        self.model_tag = embedding_model_tag(context.openai_embed_model, dimensions)
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.report = BackfillReport(table=table.name, column=column)
+        # Lotes terminados que todavía no se pueden marcar en el checkpoint porque falta uno anterior
+        self.completed: dict[int, tuple] = {}
+        self.next_to_checkpoint = 0
+        # Textos que otro lote en curso está embebiendo: los lotes siguientes esperan ese resultado
+        self.vector_futures: dict[str, asyncio.Future] = {}
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Fracción de filas escritas que no necesitaron su propia llamada a la API."""
+        if not self.report.rows_embedded:
+            return 0.0
+        return 1 - self.report.texts_embedded / self.report.rows_embedded
+
+    def query(self):
+        text_columns = [column for column in self.table.columns if not isinstance(column.type, Vector)]
+        query = (
+            # Solo se sabe si el vector es NULL, sin traerlo
+            select(self.model, self.table.c[self.column].is_(None).label("missing"))
+            .options(load_only(*(getattr(self.model, column.key) for column in text_columns)))
+            .order_by(*self.key_columns)
+        )
+        if (saved_key := self.checkpoint.get(self.checkpoint_name)) is not None:
+            query = query.where(tuple_(*self.key_columns) > tuple_(*decode_key(self.key_columns, saved_key)))
+        return query.execution_options(yield_per=READ_BATCH_SIZE)
+
+    def needs_embedding(self, row: Any, missing: bool, row_hash: str) -> bool:
+        return (
+            self.force
+            or missing
+            or getattr(row, self.hash_column) != row_hash
+            or getattr(row, self.model_column) != self.model_tag
+        )
+
+    async def cached_vectors(self, hashes: list[str]) -> dict[str, Any]:
+        return await fetch_cached_vectors(self.engine, self.model_tag, hashes)
+
+    async def write(self, rows: list[tuple[tuple, str, str]], vectors: dict[str, Any], new_hashes: list[str]) -> None:
+        staging = f"{self.table.name}_embedding_updates"
+        key_names = [column.name for column in self.key_columns]
+        join = " AND ".join(f"t.{name} = u.{name}" for name in key_names)
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                    f"SELECT {', '.join(key_names)}, {self.column} AS embedding, {self.hash_column} AS text_hash, "
+                    f"{self.model_column} AS model_tag FROM {self.table.name} WITH NO DATA"
+                )
+            )
+            driver_connection: Any = (await conn.get_raw_connection()).driver_connection
+            await driver_connection.copy_records_to_table(
+                staging,
+                records=[(*key, vectors[row_hash], row_hash, self.model_tag) for key, _, row_hash in rows],
+                columns=[*key_names, "embedding", "text_hash", "model_tag"],
+            )
+            await conn.execute(
+                text(
+                    f"UPDATE {self.table.name} t SET {self.column} = u.embedding, {self.hash_column} = u.text_hash, "
+                    f"{self.model_column} = u.model_tag FROM {staging} u WHERE {join}"
                 )
-                setattr(row, embedding_column, embedding)
-                rows.append(row)
-            # Write updated seed data to the file
-            with open(os.path.join(current_dir, "seed_data.json"), "w") as f:
-                json.dump([row.to_dict(include_embedding=True) for row in rows], f, indent=4)
-        return
-
-    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
-        async with session.begin():
-            rows_to_update = (await session.scalars(select(Item))).all()
-
-            for row_model in rows_to_update:
-                setattr(
-                    row_model,
-                    embedding_column,
-                    await compute_text_embedding(
-                        row_model.to_str_for_embedding(),
-                        openai_client=openai_embed_client,
-                        embed_model=common_params.openai_embed_model,
-                        embed_deployment=common_params.openai_embed_deployment,
-                        embedding_dimensions=common_params.openai_embed_dimensions,
+            )
+            if new_hashes:
+                await conn.execute(
+                    text(
+                        f"INSERT INTO {EmbeddingCache.__tablename__} (text_hash, model_tag, embedding) "
+                        f"SELECT DISTINCT ON (text_hash) text_hash, model_tag, embedding FROM {staging} "
+                        "WHERE text_hash = ANY(:new_hashes) ON CONFLICT DO NOTHING"
                     ),
+                    {"new_hashes": new_hashes},
+                )
+
+    async def process_batch(self, number: int, rows: list[tuple[tuple, str, str]]) -> None:
+        """Embebe un lote de filas (clave, texto, hash): una sola vez por texto distinto."""
+        texts = {row_hash: row_text for _, row_text, row_hash in rows}
+        waiting = {row_hash: self.vector_futures[row_hash] for row_hash in texts if row_hash in self.vector_futures}
+        vectors = await self.cached_vectors([row_hash for row_hash in texts if row_hash not in waiting])
+        self.report.cache_hits += len(vectors)
+        misses = [row_hash for row_hash in texts if row_hash not in waiting and row_hash not in vectors]
+        futures = {row_hash: asyncio.get_running_loop().create_future() for row_hash in misses}
+        self.vector_futures.update(futures)
+        try:
+            if misses:
+                embedded = await compute_text_embeddings(
+                    [texts[row_hash] for row_hash in misses],
+                    self.openai_embed_client,
+                    self.context.openai_embed_model,
+                    self.context.openai_embed_deployment,
+                    self.context.openai_embed_dimensions,
+                    batch_size=self.batch_size,
                 )
-            await session.commit()
+                vectors.update(zip(misses, embedded))
+                self.report.texts_embedded += len(misses)
+                self.report.requests += 1
+            for row_hash, future in waiting.items():
+                vectors[row_hash] = await future
+            await self.write(rows, vectors, misses)
+        except BaseException as error:
+            for future in futures.values():
+                if isinstance(error, Exception):
+                    future.set_exception(error)
+                else:
+                    future.cancel()
+            raise
+        finally:
+            for row_hash in misses:
+                self.vector_futures.pop(row_hash, None)
+        for row_hash, future in futures.items():
+            future.set_result(vectors[row_hash])
+        self.report.rows_embedded += len(rows)
+        # El checkpoint solo avanza hasta el último lote escrito sin huecos antes que él
+        self.completed[number] = rows[-1][0]
+        while self.next_to_checkpoint in self.completed:
+            last_key = self.completed.pop(self.next_to_checkpoint)
+            self.next_to_checkpoint += 1
+            self.checkpoint.save(self.checkpoint_name, encode_key(last_key))
+
+    async def run(self) -> BackfillReport:
+        started_at = time.perf_counter()
+        in_flight: set[asyncio.Task] = set()
+        # Filas pendientes de embeber: (clave, texto, hash) y cuántos textos distintos suman
+        pending: list[tuple[tuple, str, str]] = []
+        pending_hashes: set[str] = set()
+        number = 0
+
+        async def dispatch(batch: list[tuple[tuple, str, str]]) -> None:
+            nonlocal in_flight, number
+            while len(in_flight) >= self.max_in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+                self.log_progress(started_at)
+            in_flight.add(asyncio.create_task(self.process_batch(number, batch)))
+            number += 1
+
+        try:
+            async with AsyncSession(self.engine) as session:
+                result = await session.stream(self.query())
+                async for rows in result.partitions(READ_BATCH_SIZE):
+                    for row, missing in rows:
+                        row_text = row.to_str_for_embedding()
+                        row_hash = text_hash(row_text)
+                        if not self.needs_embedding(row, missing, row_hash):
+                            self.report.rows_skipped += 1
+                            continue
+                        # Un lote se cierra al juntar batch_size textos distintos (o demasiadas filas repetidas)
+                        new_text = row_hash not in pending_hashes
+                        if (new_text and len(pending_hashes) >= self.batch_size) or len(pending) >= READ_BATCH_SIZE:
+                            await dispatch(pending)
+                            pending, pending_hashes = [], set()
+                        key = tuple(getattr(row, column.key) for column in self.key_columns)
+                        pending.append((key, row_text, row_hash))
+                        pending_hashes.add(row_hash)
+                    self.report.rows_scanned += len(rows)
+                    # Las filas ya no se necesitan: el identity map no crece con el tamaño de la tabla
+                    session.expunge_all()
+                if pending:
+                    await dispatch(pending)
+            if in_flight:
+                done, in_flight = await asyncio.wait(in_flight)
+                for task in done:
+                    task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+        # Terminado: la próxima ejecución empieza desde el principio de la tabla
+        self.checkpoint.save(self.checkpoint_name, None)
+        self.report.duration_seconds = round(time.perf_counter() - started_at, 2)
+        self.log_progress(started_at)
+        return self.report
+
+    def log_progress(self, started_at: float) -> None:
+        elapsed = time.perf_counter() - started_at
+        logger.info(
+            "%s: %d rows scanned, %d unchanged, %d embedded from %d new texts in %d requests "
+            "(%d cached, dedup ratio %.0f%%, %.0f rows/s)",
+            self.checkpoint_name,
+            self.report.rows_scanned,
+            self.report.rows_skipped,
+            self.report.rows_embedded,
+            self.report.texts_embedded,
+            self.report.requests,
+            self.report.cache_hits,
+            self.dedup_ratio * 100,
+            self.report.rows_embedded / elapsed if elapsed else 0,
+        )
+
+
+async def update_embeddings(
+    tables: Optional[list[str]] = None,
+    column: str = "embedding_main",
+    force: bool = False,
+    checkpoint_path: Path = DEFAULT_CHECKPOINT,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_in_flight: int = MAX_IN_FLIGHT,
+) -> list[BackfillReport]:
+    azure_credential = await get_azure_credential()
+    engine = await create_postgres_engine_from_env(azure_credential)
+    openai_embed_client = await create_openai_embed_client(azure_credential, background=True)
+    common_params = await common_parameters()
+    checkpoint = BackfillCheckpoint(checkpoint_path)
+    reports = []
+    try:
+        for table_name in tables or list(EMBEDDING_MODELS):
+            logger.info("Updating embeddings in %s.%s", table_name, column)
+            backfill = EmbeddingBackfill(
+                engine,
+                openai_embed_client,
+                common_params,
+                EMBEDDING_MODELS[table_name],
+                column,
+                checkpoint,
+                force=force,
+                batch_size=batch_size,
+                max_in_flight=max_in_flight,
+            )
+            reports.append(await backfill.run())
+    finally:
+        await openai_embed_client.close()
+        await engine.dispose()
+    return reports
 
 
 if __name__ == "__main__":
@@ -81,7 +382,23 @@ if __name__ == "__main__":
     logger.setLevel(logging.INFO)
     load_dotenv(override=True)
 
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--in_seed_data", action="store_true")
+    parser = argparse.ArgumentParser(description="Backfill embeddings in batches, resuming from the last checkpoint")
+    parser.add_argument("--table", action="append", choices=list(EMBEDDING_MODELS), help="Table(s), default all")
+    parser.add_argument("--column", default="embedding_main", help="Embedding column to fill")
+    parser.add_argument(
+        "--all", action="store_true", help="Re-embed every row, even if its text and model did not change"
+    )
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT, help="Checkpoint file")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Inputs per request")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="Concurrent requests")
     args = parser.parse_args()
-    asyncio.run(update_embeddings(args.in_seed_data))
+    asyncio.run(
+        update_embeddings(
+            args.table,
+            args.column,
+            force=args.all,
+            checkpoint_path=args.checkpoint,
+            batch_size=args.batch_size,
+            max_in_flight=args.max_in_flight,
+        )
+    )
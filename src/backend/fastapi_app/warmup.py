@@ -0,0 +1,176 @@
+"""
+Warm-up al arrancar: abre conexiones del pool, hace una llamada de embeddings (TLS a OpenAI),
+una búsqueda híbrida por columna de embeddings, pg_prewarm de los índices HNSW y carga el tokenizer y los prompts.
+Mientras corre, /ready responde 503 para que el orquestador no envíe tráfico a la réplica fría.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Union
+
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from fastapi_app.dependencies import FastAPIAppContext
+from fastapi_app.embeddings import compute_text_embedding
+from fastapi_app.metrics import warmup_duration
+from fastapi_app.postgres_models import Abastecimento, Base
+from fastapi_app.postgres_searcher import PostgresSearcher
+from fastapi_app.prompt_loader import preload_prompts
+
+logger = logging.getLogger("ragapp")
+
+# Consulta representativa para la búsqueda híbrida de calentamiento
+WARMUP_QUERY = "consumo de diesel por placa"
+EMBEDDING_COLUMNS = ("embedding_main", "embedding_alt")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return default if not value else value.lower() in ("1", "true", "yes", "on")
+
+
+class WarmupSettings(BaseModel):
+    enabled: bool = True
+    connections: int = 4
+    embeddings: bool = True
+    queries: bool = True
+    prewarm_indexes: bool = True
+    tokenizer: bool = True
+
+    @classmethod
+    def from_env(cls) -> "WarmupSettings":
+        defaults = cls()
+        return cls(
+            enabled=_env_bool("WARMUP_ENABLED", defaults.enabled),
+            connections=int(os.getenv("WARMUP_CONNECTIONS") or defaults.connections),
+            embeddings=_env_bool("WARMUP_EMBEDDINGS", defaults.embeddings),
+            queries=_env_bool("WARMUP_QUERIES", defaults.queries),
+            prewarm_indexes=_env_bool("WARMUP_PREWARM_INDEXES", defaults.prewarm_indexes),
+            tokenizer=_env_bool("WARMUP_TOKENIZER", defaults.tokenizer),
+        )
+
+
+class WarmupStatus(BaseModel):
+    ready: bool = False
+    duration_ms: Optional[float] = None
+    steps: dict[str, float] = {}
+    errors: dict[str, str] = {}
+
+
+class Warmup:
+    def __init__(
+        self,
+        settings: WarmupSettings,
+        engine: AsyncEngine,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        embed_client: Union[AsyncOpenAI, AsyncAzureOpenAI],
+        context: FastAPIAppContext,
+    ):
+        self.settings = settings
+        self.engine = engine
+        self.sessionmaker = sessionmaker
+        self.embed_client = embed_client
+        self.context = context
+        self.status = WarmupStatus()
+        self.task: Optional[asyncio.Task] = None
+        self.query_vector: Optional[list[float]] = None
+
+    async def step(self, name: str, coroutine) -> None:
+        # Cada paso es opcional: si falla se registra y el warm-up sigue con el siguiente
+        started_at = time.perf_counter()
+        try:
+            await coroutine
+        except Exception as error:
+            logger.warning("Warm-up step %s failed: %s", name, error)
+            self.status.errors[name] = str(error)
+        duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        self.status.steps[name] = duration_ms
+        warmup_duration.record(duration_ms, {"step": name})
+
+    async def open_connections(self) -> None:
+        # Se abren todas a la vez para que el pool conserve N conexiones (con pgvector ya registrado)
+        connections = await asyncio.gather(*(self.engine.connect() for _ in range(self.settings.connections)))
+        try:
+            await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in connections))
+        finally:
+            await asyncio.gather(*(connection.close() for connection in connections))
+
+    async def embed_query(self) -> None:
+        self.query_vector = await compute_text_embedding(
+            WARMUP_QUERY,
+            self.embed_client,
+            self.context.openai_embed_model,
+            self.context.openai_embed_deployment,
+            self.context.openai_embed_dimensions,
+        )
+
+    async def run_queries(self) -> None:
+        async with self.sessionmaker() as session:
+            for column_name in EMBEDDING_COLUMNS:
+                dimensions = Abastecimento.__table__.c[column_name].type.dim
+                vector = self.query_vector if self.query_vector and len(self.query_vector) == dimensions else None
+                searcher = PostgresSearcher(
+                    db_session=session,
+                    openai_embed_client=self.embed_client,
+                    embed_deployment=self.context.openai_embed_deployment,
+                    embed_model=self.context.openai_embed_model,
+                    embed_dimensions=self.context.openai_embed_dimensions,
+                    embedding_column=column_name,
+                )
+                # Sin un embedding real de esa dimensión, un vector constante recorre igual el índice
+                await searcher.search(WARMUP_QUERY, vector or [1.0] * dimensions, top=5)
+
+    async def prewarm_indexes(self) -> None:
+        index_names = [index.name for table in Base.metadata.sorted_tables for index in table.indexes]
+        async with self.engine.connect() as connection:
+            for index_name in index_names:
+                await connection.execute(text("SELECT pg_prewarm(:index_name)"), {"index_name": index_name})
+
+    async def load_tokenizer(self) -> None:
+        import tiktoken
+
+        def load() -> None:
+            preload_prompts()
+            try:
+                tiktoken.encoding_for_model(self.context.openai_chat_model)
+            except KeyError:
+                tiktoken.get_encoding("o200k_base")
+
+        await asyncio.to_thread(load)
+
+    async def run(self) -> WarmupStatus:
+        started_at = time.perf_counter()
+        if self.settings.connections > 0:
+            await self.step("connections", self.open_connections())
+        if self.settings.embeddings:
+            await self.step("embeddings", self.embed_query())
+        if self.settings.queries:
+            await self.step("queries", self.run_queries())
+        if self.settings.prewarm_indexes:
+            await self.step("prewarm", self.prewarm_indexes())
+        if self.settings.tokenizer:
+            await self.step("tokenizer", self.load_tokenizer())
+        self.status.duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        self.status.ready = True
+        warmup_duration.record(self.status.duration_ms, {"step": "total"})
+        logger.info("Warm-up finished in %.0f ms: %s", self.status.duration_ms, self.status.steps)
+        return self.status
+
+    def start(self) -> None:
+        if not self.settings.enabled:
+            self.status.ready = True
+            return
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
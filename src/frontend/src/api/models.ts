@@ -3,7 +3,8 @@ import { AIChatCompletion, AIChatCompletionDelta, AIChatCompletionOperationOptio
 export const enum RetrievalMode {
     Hybrid = "hybrid",
     Vectors = "vectors",
-    Text = "text"
+    Text = "text",
+    TimeSeries = "timeseries"
 }
 
 export type ChatAppRequestOverrides = {
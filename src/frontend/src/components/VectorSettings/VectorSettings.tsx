@@ -24,7 +24,8 @@ export const VectorSettings = ({ updateRetrievalMode }: Props) => {
                 options={[
                     { key: "hybrid", text: "Vectors + Text (Hybrid)", selected: retrievalMode == RetrievalMode.Hybrid, data: RetrievalMode.Hybrid },
                     { key: "vectors", text: "Vectors", selected: retrievalMode == RetrievalMode.Vectors, data: RetrievalMode.Vectors },
-                    { key: "text", text: "Text", selected: retrievalMode == RetrievalMode.Text, data: RetrievalMode.Text }
+                    { key: "text", text: "Text", selected: retrievalMode == RetrievalMode.Text, data: RetrievalMode.Text },
+                    { key: "timeseries", text: "Time series (trends)", selected: retrievalMode == RetrievalMode.TimeSeries, data: RetrievalMode.TimeSeries }
                 ]}
                 required
                 onChange={onRetrievalModeChange}
@@ -148,8 +148,8 @@ async def app(mock_session_env):
     return app
 
 
-@pytest.fixture(scope="session")
-def mock_openai_embedding(monkeypatch_session):
+@pytest.fixture(scope="function")
+def mock_openai_embedding(monkeypatch):
     async def mock_acreate(*args, **kwargs):
         return CreateEmbeddingResponse(
             object="list",
@@ -164,13 +164,13 @@ def mock_openai_embedding(monkeypatch_session):
             usage=Usage(prompt_tokens=8, total_tokens=8),
         )
 
-    monkeypatch_session.setattr(openai.resources.AsyncEmbeddings, "create", mock_acreate)
+    monkeypatch.setattr(openai.resources.AsyncEmbeddings, "create", mock_acreate)
 
     yield
 
 
-@pytest.fixture(scope="session")
-def mock_openai_chatcompletion(monkeypatch_session):
+@pytest.fixture(scope="function")
+def mock_openai_chatcompletion(monkeypatch):
     class AsyncChatCompletionIterator:
         def __init__(self, answer: str):
             chunk_id = "test-id"
@@ -330,7 +330,7 @@ def mock_openai_chatcompletion(monkeypatch_session):
                 model="test-model",
             )
 
-    monkeypatch_session.setattr(openai.resources.chat.completions.AsyncCompletions, "create", mock_acreate)
+    monkeypatch.setattr(openai.resources.chat.completions.AsyncCompletions, "create", mock_acreate)
 
     yield
 
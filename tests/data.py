@@ -1,7 +1,13 @@
-from fastapi_app.api_models import ItemPublic
+from pydantic import BaseModel
 
 
-class TestData(ItemPublic):
+class TestData(BaseModel):
+    id: int
+    type: str
+    brand: str
+    name: str
+    description: str
+    price: float
     embeddings: list[float]
 
 
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from benchmarks.metrics import latency_summary, ndcg_at_k, recall_at_k, reciprocal_rank
+from benchmarks.vector_index_sweep import int_list, perturbed_queries, synthetic_vectors
+
+
+def test_recall_at_k():
+    assert recall_at_k([1, 2, 3], [3, 4, 1], 3) == pytest.approx(2 / 3)
+    # Solo cuentan los k primeros de cada lado
+    assert recall_at_k([9, 1, 2], [1, 2, 3], 1) == 0.0
+    assert recall_at_k([], [], 10) == 0.0
+
+
+def test_latency_summary():
+    summary = latency_summary([float(value) for value in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50"] == 50.5
+    assert summary["p99"] == pytest.approx(99.01)
+    assert summary["max"] == 100.0
+    assert latency_summary([]) == {"count": 0}
+
+
+def test_synthetic_vectors_and_queries_are_normalized_and_reproducible():
+    vectors = synthetic_vectors(500, 32, clusters=5, seed=7)
+    queries = perturbed_queries(vectors, 20, seed=7)
+    assert vectors.shape == (500, 32) and queries.shape == (20, 32)
+    assert queries.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(queries, axis=1), 1.0, rtol=1e-5)
+    np.testing.assert_array_equal(vectors, synthetic_vectors(500, 32, clusters=5, seed=7))
+    assert int_list("8,16,") == [8, 16]
+
+
+def test_recall_caps_the_denominator_at_k():
+    relevant = list(range(20))
+    assert recall_at_k([0, 1, 2, 3, 4], relevant, 5) == 1.0
+    assert recall_at_k([0, 99, 2, 98, 4], relevant, 5) == pytest.approx(3 / 5)
+    assert recall_at_k([7], [7, 8], 5) == 0.5
+
+
+def test_reciprocal_rank_and_ndcg():
+    assert reciprocal_rank([5, 6, 1], [1, 2], 3) == pytest.approx(1 / 3)
+    assert reciprocal_rank([5, 6, 1], [1, 2], 2) == 0.0
+    assert ndcg_at_k([1, 2, 5], [1, 2], 3) == pytest.approx(1.0)
+    # Los mismos aciertos más abajo valen menos
+    assert ndcg_at_k([5, 1, 2], [1, 2], 3) < ndcg_at_k([1, 5, 2], [1, 2], 3) < 1.0
+    assert ndcg_at_k([5, 6], [], 2) == 0.0
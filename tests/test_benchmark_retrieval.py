@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.local_embeddings import LocalEmbeddingClient, local_embedding
+from benchmarks.retrieval_bench import FIXTURE_DIR, compare_reports, embed_fixture, load_queries
+from fastapi_app.postgres_models import Abastecimento
+from fastapi_app.setup_postgres_seeddata import read_seed_chunks
+
+
+def cosine(a, b):
+    return float(np.dot(a, b))
+
+
+def test_local_embeddings_are_deterministic_and_lexical():
+    vector = local_embedding("Refueling record for vehicle plate EHP6V58", 256)
+    assert vector == local_embedding("Refueling record for vehicle plate EHP6V58", 256)
+    assert np.linalg.norm(vector) == pytest.approx(1.0, rel=1e-5)
+    same_plate = local_embedding("fueling records for plate EHP6V58", 256)
+    other_plate = local_embedding("fueling records for plate KLX8C98", 256)
+    assert cosine(vector, same_plate) > cosine(vector, other_plate)
+    # Sin palabras no hay rasgos, pero el vector sigue siendo válido para el coseno
+    assert np.linalg.norm(local_embedding("¿?", 8)) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_local_client_answers_like_openai():
+    response = await LocalEmbeddingClient(64).embeddings.create(model="local-hashing", input=["a b", "c"])
+    assert [item.index for item in response.data] == [0, 1]
+    assert len(response.data[1].embedding) == 64
+    single = await LocalEmbeddingClient(64).embeddings.create(model="local-hashing", input="c", dimensions=32)
+    assert len(single.data[0].embedding) == 32
+
+
+def test_labeled_queries_point_at_fixture_rows():
+    with open(FIXTURE_DIR / "abastecimento.jsonl") as f:
+        keys = [f"{row['placa']}@{row['data']}" for row in map(json.loads, f)]
+    assert len(keys) == len(set(keys))
+    queries = load_queries(FIXTURE_DIR / "queries.jsonl")
+    assert len({query.id for query in queries}) == len(queries)
+    assert all(query.relevant and set(query.relevant) <= set(keys) for query in queries)
+
+
+def test_embed_fixture_writes_seed_with_local_vectors(tmp_path):
+    embed_fixture(FIXTURE_DIR, tmp_path)
+    names, rows = next(read_seed_chunks(tmp_path, Abastecimento.__table__, chunk_size=3))
+    first = dict(zip(names, rows[0]))
+    embedding_text = Abastecimento(**{name: first[name] for name in names[:8]}).to_str_for_embedding()
+    np.testing.assert_allclose(first["embedding_main"], local_embedding(embedding_text, 1024), atol=1e-6)
+    assert first["embedding_alt"].shape == (768,)
+    assert first["embedding_main_model"] == "local-hashing:1024"
+
+
+def test_compare_reports_flags_quality_drops():
+    def report(recall, p50):
+        latency = {"p50": p50, "p95": p50 * 2}
+        mode = {"recall": recall, "mrr": 0.5, "ndcg": 0.6, "latency_ms": latency}
+        return {"metadata": {"fixture": "abc", "k": 5, "embedding_column": "embedding_main"}, "modes": {"hybrid": mode}}
+
+    assert compare_reports(report(0.80, 2.0), report(0.795, 9.0), tolerance=0.01) == []
+    assert compare_reports(report(0.80, 2.0), report(0.70, 2.0), tolerance=0.01) == [
+        "hybrid recall dropped from 0.8000 to 0.7000"
+    ]
@@ -0,0 +1,86 @@
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.api_models import AbastecimentoPublic, ChatRequest
+from fastapi_app.chat_batch import ChatBatchRunner
+
+
+class FakeSession:
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeSearcher:
+    def __init__(self):
+        self.calls = []
+
+    async def search(self, query_text, query_vector, top, filters):
+        if query_text == "boom":
+            raise RuntimeError("search failed")
+        self.calls.append((query_text, query_vector))
+        return [AbastecimentoPublic(id_veiculo="1", placa="ABC1234", data=date(2025, 5, 1), custo_combustivel=10.0)]
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.inputs = []
+
+    async def create(self, model, input, **kwargs):
+        self.inputs.append(input)
+        data = [SimpleNamespace(index=i, embedding=[float(i)]) for i in range(len(input))]
+        return SimpleNamespace(data=data)
+
+
+class FakeCompletions:
+    async def create(self, messages, **kwargs):
+        message = SimpleNamespace(content=f"answer to {len(messages)} messages")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_request(question):
+    return ChatRequest.model_validate(
+        {
+            "messages": [{"role": "user", "content": question}],
+            "context": {"overrides": {"use_advanced_flow": False, "retrieval_mode": "hybrid"}},
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_chat_batch_shares_embedding_call_and_sessions():
+    embeddings = FakeEmbeddings()
+    searcher = FakeSearcher()
+    sessions = []
+
+    def sessionmaker():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    runner = ChatBatchRunner(
+        requests=[make_request("diesel placa ABC1234"), make_request("boom"), make_request("costo mayo")],
+        sessionmaker=sessionmaker,
+        openai_chat_client=SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions())),
+        chat_model="gpt-4o-mini",
+        chat_deployment=None,
+        openai_embed_client=SimpleNamespace(embeddings=embeddings),
+        embed_model="nomic-embed-text",
+        embed_deployment=None,
+        embed_dimensions=None,
+        db_sessions=2,
+    )
+    runner.build_searcher = lambda session: searcher
+
+    results = {result.index: result async for result in runner.run()}
+
+    assert embeddings.inputs == [["diesel placa ABC1234", "boom", "costo mayo"]]
+    assert sorted(searcher.calls) == [("costo mayo", [2.0]), ("diesel placa ABC1234", [0.0])]
+    assert len(sessions) == 2
+    assert all(session.closed for session in sessions)
+    assert sorted(results) == [0, 1, 2]
+    assert results[1].error == "search failed"
+    assert results[0].response.message.content == "answer to 1 messages"
+    assert "ABC1234-2025-05-01" in results[2].response.context.data_points
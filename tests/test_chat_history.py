@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.api_models import ChatRequestOverrides, Message
+from fastapi_app.chat_history import ChatHistoryManager
+from fastapi_app.rag_simple import SimpleRAGChat
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        message = SimpleNamespace(content=f"summary #{len(self.calls)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_manager(completions, **kwargs):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return ChatHistoryManager(openai_chat_client=client, chat_model="gpt-4o-mini", **kwargs)
+
+
+def make_messages(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i}"})
+        messages.append({"role": "assistant", "content": f"answer {i}"})
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_compact_short_history_is_verbatim():
+    completions = FakeCompletions()
+    manager = make_manager(completions, max_turns=2, summarize_every=2)
+    messages = make_messages(2)
+    history, session_state = await manager.compact(messages, None)
+    assert history == messages
+    assert session_state == {"history": {"summary": "", "summarized_messages": 0}}
+    assert completions.calls == []
+
+
+@pytest.mark.asyncio
+async def test_compact_summarizes_every_k_turns():
+    completions = FakeCompletions()
+    manager = make_manager(completions, max_turns=2, summarize_every=2)
+
+    # 3 turns: 1 pending turn outside the window is kept verbatim until K turns accumulate
+    history, session_state = await manager.compact(make_messages(3), None)
+    assert len(history) == 6
+    assert completions.calls == []
+
+    # 4 turns: the 2 oldest turns are folded into the summary
+    history, session_state = await manager.compact(make_messages(4), session_state)
+    assert len(completions.calls) == 1
+    assert session_state["history"] == {"summary": "summary #1", "summarized_messages": 4}
+    assert history[0] == {"role": "system", "content": "Summary of the earlier conversation: summary #1"}
+    assert history[1:] == make_messages(4)[4:]
+
+    # 5 turns: summary reused without calling the model
+    history, session_state = await manager.compact(make_messages(5), session_state)
+    assert len(completions.calls) == 1
+    assert len(history) == 1 + 6
+
+
+@pytest.mark.asyncio
+async def test_compact_enforces_token_cap():
+    completions = FakeCompletions()
+    manager = make_manager(completions, max_turns=10, summarize_every=10, max_tokens=20)
+    messages = [{"role": "user", "content": "x" * 40}] * 6
+    history, _ = await manager.compact(messages, {"other": "value"})
+    assert len(history) == 1
+
+
+@pytest.mark.asyncio
+async def test_compact_resets_state_for_new_conversation():
+    completions = FakeCompletions()
+    manager = make_manager(completions)
+    session_state = {"history": {"summary": "old", "summarized_messages": 8}}
+    history, session_state = await manager.compact(make_messages(1), session_state)
+    assert history == make_messages(1)
+    assert session_state["history"]["summary"] == ""
+
+
+@pytest.mark.asyncio
+async def test_simple_flow_bounds_the_history_sent_with_the_answer():
+    completions = FakeCompletions()
+    messages = [Message(**message) for message in make_messages(10)]
+    rag_flow = SimpleRAGChat(
+        messages=[*messages, Message(role="user", content="¿Y en febrero?")],
+        overrides=ChatRequestOverrides(),
+        searcher=None,
+        openai_chat_client=SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+        chat_model="gpt-4o-mini",
+    )
+    assert await rag_flow.plan_search() == ("¿Y en febrero?", None)
+    answer_messages = rag_flow.answer_messages([])
+    # Resumen + los últimos 4 turnos + el prompt con la pregunta
+    assert len(answer_messages) == 1 + 8 + 1
+    assert answer_messages[0]["content"] == "Summary of the earlier conversation: summary #1"
+    assert rag_flow.session_state["history"]["summarized_messages"] == 12
@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from fastapi_app.dependencies import FastAPIAppContext
+from fastapi_app.embedding_worker import EmbeddingWorker, EmbeddingWorkerSettings, text_columns, trigger_ddl
+from fastapi_app.embeddings import text_hash
+from fastapi_app.postgres_models import Abastecimento, Veiculo
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.inputs: list[list[str]] = []
+
+    async def create(self, model, input, **kwargs):
+        self.inputs.append(input)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=index, embedding=[float(index)] * 1024) for index in range(len(input))]
+        )
+
+
+def make_worker(**settings):
+    context = FastAPIAppContext(
+        openai_chat_model="gpt-4o-mini",
+        openai_embed_model="text-embedding-3-large",
+        openai_embed_dimensions=1024,
+        openai_chat_deployment=None,
+        openai_embed_deployment=None,
+        embedding_column="embedding_main",
+    )
+    client = SimpleNamespace(embeddings=FakeEmbeddings())
+    return EmbeddingWorker(None, client, context, EmbeddingWorkerSettings(enabled=True, **settings), models=[Veiculo])
+
+
+def make_vehicle(id_veiculo, modelo_chassi="B270F"):
+    return Veiculo(
+        id_veiculo=id_veiculo, tipo_onibus="URBANO", fabricante="Volvo", modelo_chassi=modelo_chassi, ano=2020
+    )
+
+
+def test_triggers_watch_only_text_columns():
+    assert [column.name for column in text_columns(Veiculo.__table__)] == [
+        "id_veiculo",
+        "garagem",
+        "placa",
+        "ano",
+        "tipo_onibus",
+        "fabricante",
+        "modelo_chassi",
+    ]
+    statements = trigger_ddl([Veiculo.__table__, Abastecimento.__table__])
+    update_trigger = next(
+        statement for statement in statements if statement.startswith("CREATE TRIGGER veiculos_embedding_dirty_update")
+    )
+    assert "embedding_main" not in update_trigger
+    assert "IS DISTINCT FROM" in update_trigger
+    assert any("FOR EACH STATEMENT EXECUTE FUNCTION notify_embedding_dirty()" in statement for statement in statements)
+    # prepare_db.sql instala lo mismo que setup_postgres_database
+    prepare_db = (Path(__file__).parents[1] / "scripts" / "prepare_db.sql").read_text()
+    assert all(f"{statement};" in prepare_db for statement in statements)
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_WORKER_ENABLED", "true")
+    monkeypatch.setenv("EMBEDDING_WORKER_BATCH_SIZE", "64")
+    monkeypatch.setenv("POSTGRES_PGBOUNCER", "true")
+    settings = EmbeddingWorkerSettings.from_env()
+    assert settings.enabled is True
+    assert settings.batch_size == 64
+    # Sin conexión de sesión no hay LISTEN: el worker solo sondea
+    assert settings.listen is False
+
+
+@pytest.mark.asyncio
+async def test_process_embeds_distinct_stale_texts_and_clears_the_rest(monkeypatch):
+    worker = make_worker()
+    dirty_at = datetime(2025, 5, 1, tzinfo=timezone.utc)
+    current = make_vehicle("v3")
+    current.embedding_main_text_hash = text_hash(current.to_str_for_embedding())
+    current.embedding_main_model = "text-embedding-3-large:1024"
+    rows = [
+        (make_vehicle("v1"), dirty_at, 2.0, True),
+        (make_vehicle("v2"), dirty_at, 1.5, True),
+        (current, dirty_at, 1.0, False),
+        (make_vehicle("v4", "B340M"), dirty_at, 0.5, True),
+    ]
+    written = []
+
+    async def claim(model):
+        return rows
+
+    async def write(model, records, new_hashes):
+        written.append((records, new_hashes))
+        return len(records)
+
+    async def no_cache(engine, model_tag, hashes):
+        return {}
+
+    monkeypatch.setattr("fastapi_app.embedding_worker.fetch_cached_vectors", no_cache)
+    worker.claim = claim
+    worker.write = write
+    assert await worker.process(Veiculo) == 4
+    # v1 y v2 comparten texto; v3 ya tenía el embedding de su texto actual
+    assert worker.openai_embed_client.embeddings.inputs == [
+        [rows[0][0].to_str_for_embedding(), rows[3][0].to_str_for_embedding()]
+    ]
+    records, new_hashes = written[0]
+    assert [record[0] for record in records] == ["v1", "v2", "v3", "v4"]
+    assert records[2][1] is None
+    assert len(records[0][1]) == 1024
+    assert all(record[-1] == dirty_at for record in records)
+    assert len(new_hashes) == 2
+
+
+def test_claim_skips_locked_claimed_and_set_aside_rows():
+    worker = make_worker(max_attempts=3)
+    sql = str(worker.claim_query(Abastecimento).compile(dialect=postgresql.dialect()))
+    assert sql.endswith("FOR UPDATE OF abastecimento SKIP LOCKED")
+    assert "embedding_claimed_until IS NULL OR abastecimento.embedding_claimed_until < clock_timestamp()" in sql
+    assert "coalesce(abastecimento.embedding_attempts, %(coalesce_1)s) < %(coalesce_2)s" in sql
+    # El estado de la cola no se carga en las filas ni dispara el trigger de texto
+    assert "embedding_attempts," not in sql.split("FROM")[0]
+    assert {"embedding_claimed_until", "embedding_attempts"}.isdisjoint(
+        column.name for column in text_columns(Abastecimento.__table__)
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_releases_its_rows_and_reraises(monkeypatch):
+    worker = make_worker()
+    dirty_at = datetime(2025, 5, 1, tzinfo=timezone.utc)
+    rows = [(make_vehicle("v1"), dirty_at, 1.0, True), (make_vehicle("v2", "B340M"), dirty_at, 1.0, True)]
+    released = []
+
+    async def claim(model):
+        return rows
+
+    async def release(model, keys):
+        released.append((model, keys))
+
+    async def rejected(model, input, **kwargs):
+        raise RuntimeError("400 invalid input")
+
+    async def no_cache(engine, model_tag, hashes):
+        return {}
+
+    monkeypatch.setattr("fastapi_app.embedding_worker.fetch_cached_vectors", no_cache)
+    worker.claim = claim
+    worker.release = release
+    worker.openai_embed_client.embeddings.create = rejected
+    with pytest.raises(RuntimeError, match="400 invalid input"):
+        await worker.process(Veiculo)
+    assert released == [(Veiculo, [("v1",), ("v2",)])]
+
+
+@pytest.mark.asyncio
+async def test_run_retries_with_backoff_and_wakes_on_notify():
+    worker = make_worker(retry_initial=0.01, retry_max=0.02, poll_interval=60, listen=False)
+    outcomes = [RuntimeError("429 Too Many Requests"), RuntimeError("429 Too Many Requests"), 3, 0]
+    calls = asyncio.Queue()
+
+    async def drain():
+        outcome = outcomes.pop(0)
+        await calls.put(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    worker.drain = drain
+    worker.start()
+    try:
+        for _ in range(3):
+            await asyncio.wait_for(calls.get(), 1)
+        # Tras drenar espera un aviso (no el poll de 60 s)
+        await asyncio.sleep(0.05)
+        assert calls.empty()
+        worker.notified(None, 0, "embedding_dirty", "veiculos")
+        assert await asyncio.wait_for(calls.get(), 1) == 0
+    finally:
+        await worker.stop()
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+from fastapi_app.api_models import AbastecimentoPublic
+from fastapi_app.fueling_stats import summarize_fueling_rows
+
+
+def make_rows():
+    costs = [100.0, 110.0, 120.0, 130.0, 140.0, 150.0, 5000.0]
+    return [
+        AbastecimentoPublic(
+            id_veiculo="103010",
+            placa="LUI9D53",
+            data=date(2025, 5, day),
+            custo_combustivel=cost,
+            km_diesel=2.0 if day != 3 else None,
+        )
+        for day, cost in zip(range(1, 8), costs)
+    ]
+
+
+def test_summarize_fueling_rows_empty():
+    summary = summarize_fueling_rows([])
+    assert summary.row_count == 0
+    assert summary.columns == []
+    assert summary.to_prompt() == "Sin registros."
+
+
+def test_summarize_fueling_rows_aggregates():
+    summary = summarize_fueling_rows(make_rows())
+    assert summary.row_count == 7
+    assert summary.start_date == date(2025, 5, 1)
+    assert summary.end_date == date(2025, 5, 7)
+    # Columns missing from AbastecimentoPublic are left out
+    assert [col.column for col in summary.columns] == ["km_diesel", "custo_combustivel"]
+
+    km_diesel, cost = summary.columns
+    assert km_diesel.count == 6
+    assert km_diesel.mean == pytest.approx(2.0)
+    assert km_diesel.slope_per_day == pytest.approx(0.0)
+    assert cost.count == 7
+    assert cost.total == pytest.approx(5750.0)
+    assert cost.min == 100.0
+    assert cost.min_date == date(2025, 5, 1)
+    assert cost.max == 5000.0
+    assert cost.max_date == date(2025, 5, 7)
+    assert cost.slope_per_day > 0
+
+
+def test_summarize_fueling_rows_outliers():
+    summary = summarize_fueling_rows(make_rows())
+    assert len(summary.outliers) == 1
+    outlier = summary.outliers[0]
+    assert outlier.column == "custo_combustivel"
+    assert outlier.value == 5000.0
+    assert outlier.data == date(2025, 5, 7)
+    assert "Valores atípicos" in summary.to_prompt()
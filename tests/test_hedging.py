@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from fastapi_app.hedging import RequestHedger
+
+
+def make_call(delays, calls):
+    async def call(model):
+        calls.append(model)
+        try:
+            await asyncio.sleep(delays[model])
+        except asyncio.CancelledError:
+            calls.append(f"{model} cancelled")
+            raise
+        return model
+
+    return call
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    hedger = RequestHedger("test", max_hedge_ratio=1.0, initial_delay=0.05)
+    calls = []
+    result = await hedger.run(make_call({"primary": 0}, calls), "primary")
+    assert result == "primary"
+    assert calls == ["primary"]
+    assert len(hedger.latencies) == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    hedger = RequestHedger("test", max_hedge_ratio=1.0, initial_delay=0.01, hedge_deployment="backup")
+    calls = []
+    result = await hedger.run(make_call({"primary": 1, "backup": 0}, calls), "primary")
+    await asyncio.sleep(0)
+    assert result == "backup"
+    assert calls == ["primary", "backup", "primary cancelled"]
+
+
+@pytest.mark.asyncio
+async def test_hedges_are_capped_by_ratio():
+    hedger = RequestHedger("test", max_hedge_ratio=0.5, initial_delay=0.01, hedge_deployment="backup")
+    calls = []
+    results = [await hedger.run(make_call({"primary": 0.03, "backup": 0}, calls), "primary") for _ in range(4)]
+    # 0.5 of credit per call: only every second call may fire a hedge
+    assert results == ["primary", "backup", "primary", "backup"]
+
+
+def test_hedge_delay_uses_observed_percentile():
+    hedger = RequestHedger("test", percentile=0.9, min_samples=10)
+    assert hedger.hedge_delay() == hedger.initial_delay
+    hedger.latencies.extend(i / 100 for i in range(1, 101))
+    assert hedger.hedge_delay() == pytest.approx(0.901)
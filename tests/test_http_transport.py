@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fastapi_app.http_transport import ConnectionKeepalive, InstrumentedTransport
+
+
+async def start_server():
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        try:
+            while head := await reader.readuntil(b"\r\n\r\n"):
+                body = b"" if head.startswith(b"HEAD") else b"ok"
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n" + body)
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/", connections
+
+
+@pytest.mark.asyncio
+async def test_instrumented_transport_counts_connection_reuse():
+    server, url, connections = await start_server()
+    transport = InstrumentedTransport(httpx.AsyncHTTPTransport())
+    async with httpx.AsyncClient(transport=transport) as client:
+        for _ in range(3):
+            response = await client.get(url)
+            assert response.text == "ok"
+    server.close()
+    assert len(connections) == 1
+    assert transport.requests_sent == 3
+    assert transport.connections_reused == 2
+    assert transport.reuse_rate == pytest.approx(2 / 3)
+
+
+@pytest.mark.asyncio
+async def test_keepalive_pings_every_interval():
+    server, url, connections = await start_server()
+    transport = InstrumentedTransport(httpx.AsyncHTTPTransport())
+    keepalive = ConnectionKeepalive(transport, {url}, interval=0.01)
+    keepalive.start()
+    await asyncio.sleep(0.1)
+    await keepalive.stop()
+    await transport.aclose()
+    server.close()
+    assert transport.requests_sent >= 2
+    assert len(connections) == 1
@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from fastapi_app.prompt_loader import load_prompt
+
+BACKEND_DIR = Path(__file__).parent.parent / "src" / "backend"
+# Presupuesto de arranque en frío (import + create_app), configurable para máquinas lentas de CI
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS") or 3000)
+# Módulos que solo deben cargarse con APPLICATIONINSIGHTS_CONNECTION_STRING
+LAZY_MODULES = (
+    "azure.monitor.opentelemetry",
+    "opentelemetry.instrumentation.openai",
+    "opentelemetry.instrumentation.sqlalchemy",
+)
+
+COLD_START_SCRIPT = """
+import json, sys, time
+started_at = time.perf_counter()
+import fastapi_app
+if "--create-app" in sys.argv:
+    fastapi_app.create_app(testing=True)
+print(json.dumps({"total_ms": (time.perf_counter() - started_at) * 1000, "modules": sorted(sys.modules)}))
+"""
+
+
+def run_cold_start(*args: str) -> dict:
+    env = {key: value for key, value in os.environ.items() if key != "APPLICATIONINSIGHTS_CONNECTION_STRING"}
+    env["PYTHONPATH"] = str(BACKEND_DIR)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START_SCRIPT, *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["slowest"] = slowest_imports(completed.stderr)
+    return result
+
+
+def slowest_imports(importtime_output: str, count: int = 5) -> list[str]:
+    """Importaciones directas de los módulos importados por el script con mayor tiempo acumulado (`-X importtime`)."""
+    timings = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # La sangría es de 1 + 2 espacios por nivel: el nivel 1 muestra fastapi, openai, sqlalchemy, etc.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth == 1:
+            timings.append((int(cumulative), name.strip()))
+    return [f"{name} ({microseconds / 1000:.0f} ms)" for microseconds, name in sorted(timings, reverse=True)[:count]]
+
+
+def test_monitoring_imports_are_deferred():
+    result = run_cold_start()
+    assert [module for module in LAZY_MODULES if module in result["modules"]] == []
+
+
+def test_prompts_are_read_on_first_use():
+    load_prompt.cache_clear()
+    from fastapi_app.rag_base import RAGChatBase
+
+    class Flow(RAGChatBase):
+        async def prepare_context_steps(self):
+            yield
+
+    assert load_prompt.cache_info().currsize == 0
+    assert "{sources}" in Flow().answer_prompt_template
+    assert load_prompt.cache_info().currsize == 1
+
+
+@pytest.mark.skipif(
+    not (BACKEND_DIR / "static" / "assets").exists(), reason="create_app needs the frontend build in static/"
+)
+def test_create_app_within_budget():
+    # La primera ejecución genera los .pyc; la segunda mide el arranque de una réplica con la imagen ya construida
+    run_cold_start("--create-app")
+    result = run_cold_start("--create-app")
+    assert result["total_ms"] < IMPORT_TIME_BUDGET_MS, (
+        f"cold start took {result['total_ms']:.0f} ms, slowest imports: {', '.join(result['slowest'])}"
+    )
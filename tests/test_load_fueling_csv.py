@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+
+from fastapi_app.load_fueling_csv import parse_short_date, read_chunks, upsert_statement
+
+HEADER = (
+    "Numero Veiculo,Placa,Tipo de Veiculo,Data,Km Percorrido,Diesel,Km Diesel,Motor,Km Motor,Dies Mot,Custo Combustivel"
+)
+
+
+def write_csv(tmp_path, *lines):
+    path = tmp_path / "abastecimentos.csv"
+    path.write_text("\n".join([HEADER, *lines]) + "\n")
+    return path
+
+
+def test_parse_short_date():
+    assert parse_short_date("1-May-25") == date(2025, 5, 1)
+    assert parse_short_date("31-dec-2024") == date(2024, 12, 31)
+    assert parse_short_date("31-Feb-25") is None
+    assert parse_short_date("") is None
+
+
+def test_read_chunks_parses_records(tmp_path):
+    path = write_csv(
+        tmp_path,
+        "103010,LUI9D53,5 - URBANO COM AR,1-May-25,3451,1478,2.33,0,0,0,8779.32",
+        "103012,,5 - URBANO COM AR,2-May-25,3569,1473,,0,0,0,",
+    )
+    [chunk] = list(read_chunks(path))
+    assert chunk.errors == []
+    assert chunk.records == [
+        ("103010", "LUI9D53", date(2025, 5, 1), 3451, "1478", "2.33", "8779.32", "5.94"),
+        ("103012", None, date(2025, 5, 2), 3569, "1473", None, None, None),
+    ]
+
+
+def test_read_chunks_rejects_invalid_rows_with_line_numbers(tmp_path):
+    path = write_csv(
+        tmp_path,
+        "103010,LUI9D53,URBANO,1-May-25,3451,1478,2.33,0,0,0,8779.32",
+        "103011,LUI9D54,URBANO,1-Mai-25,3451,1478,2.33,0,0,0,8779.32",
+        "",
+        "103012,LUI9D55,URBANO,1-May-25,3451.5,1478,2.33,0,0,0,8779.32",
+        "103013,LUI9D56,URBANO,1-May-25,3451,abc,2.33,0,0,0,8779.32",
+        ",LUI9D57,URBANO,1-May-25,3451,1478,2.33,0,0,0,8779.32",
+        "103014,LUI9D58,URBANO,2-May-25,100,10,2.33,0,0,0,59.5",
+    )
+    chunks = list(read_chunks(path, chunk_size=3))
+    assert [record[0] for chunk in chunks for record in chunk.records] == ["103010", "103014"]
+    assert [error for chunk in chunks for error in chunk.errors] == [
+        (3, "invalid Data"),
+        (5, "invalid Km Percorrido"),
+        (6, "invalid Diesel"),
+        (7, "missing Numero Veiculo"),
+    ]
+
+
+def test_read_chunks_requires_columns(tmp_path):
+    path = tmp_path / "other.csv"
+    path.write_text("Placa,Data\nLUI9D53,1-May-25\n")
+    with pytest.raises(ValueError, match="Numero Veiculo"):
+        list(read_chunks(path))
+
+
+def test_upsert_only_rewrites_changed_rows():
+    statement = upsert_statement()
+    assert "ON CONFLICT ON CONSTRAINT abastecimento_pk" in statement
+    assert "DISTINCT ON (id_veiculo, data, km_percorrido, diesel)" in statement
+    assert "IS DISTINCT FROM" in statement
@@ -0,0 +1,49 @@
+import json
+
+from loadtests.chat_stream import read_chat_stream
+
+
+def fake_clock(*times):
+    values = iter(times)
+    return lambda: next(values)
+
+
+def delta(content, session_state=None):
+    event = {"delta": {"role": "assistant", "content": content}, "context": None}
+    if session_state is not None:
+        event["session_state"] = session_state
+    return json.dumps(event)
+
+
+def test_read_chat_stream_times_first_token_and_end():
+    lines = [
+        json.dumps({"delta": {"role": "assistant"}, "context": {"thoughts": []}}).encode(),
+        b"",
+        delta("Hola ").encode(),
+        delta("flota", {"summary": "placa EKE6K50"}).encode(),
+    ]
+    result = read_chat_stream(lines, started_at=10.0, clock=fake_clock(10.25, 11.5))
+    assert result.ttft_ms == 250.0
+    assert result.duration_ms == 1500.0
+    assert result.answer == "Hola flota"
+    assert result.tokens == 2
+    assert result.error is None
+    assert result.session_state == {"summary": "placa EKE6K50"}
+
+
+def test_read_chat_stream_reports_error_lines():
+    lines = [delta("Hola"), json.dumps({"error": "boom"}), delta("nunca")]
+    result = read_chat_stream(lines, started_at=0.0, clock=fake_clock(0.1, 0.2))
+    assert result.error == "boom"
+    assert result.answer == "Hola"
+
+
+def test_read_chat_stream_without_tokens_is_an_error():
+    result = read_chat_stream([json.dumps({"delta": {"role": "assistant"}})], started_at=0.0, clock=fake_clock(0.3))
+    assert result.ttft_ms is None
+    assert result.error == "Stream ended without answer tokens"
+
+
+def test_read_chat_stream_rejects_invalid_lines():
+    result = read_chat_stream(["not json"], started_at=0.0, clock=fake_clock(0.1))
+    assert result.error.startswith("Invalid NDJSON line")
@@ -0,0 +1,55 @@
+import random
+
+from loadtests.scenarios import (
+    Fleet,
+    aggregate_conversation,
+    chat_request_body,
+    follow_up_conversation,
+    load_fleet,
+    lookup_conversation,
+    month_name,
+)
+
+
+def test_load_fleet_reads_benchmark_vehicles():
+    fleet = load_fleet()
+    assert "EKE6K50" in fleet.plates
+    assert "103001" in fleet.vehicle_ids
+    assert fleet.months == ["2025-01", "2025-02", "2025-03"]
+
+
+def test_month_name():
+    assert month_name("2025-02") == "febrero de 2025"
+
+
+def test_conversations_use_the_fleet():
+    fleet = Fleet(plates=["ABC1D23"], vehicle_ids=["900001"], months=["2025-01", "2025-02"])
+    rng = random.Random(7)
+    for _ in range(20):
+        lookup = lookup_conversation(rng, fleet)
+        assert lookup.name == "lookup"
+        assert len(lookup.turns) == 1
+        assert "ABC1D23" in lookup.turns[0] or "900001" in lookup.turns[0]
+
+        aggregate = aggregate_conversation(rng, fleet)
+        assert aggregate.name == "aggregate"
+        assert aggregate.retrieval_mode in ("hybrid", "timeseries")
+
+        follow_up = follow_up_conversation(rng, fleet)
+        assert follow_up.name == "follow_up"
+        assert 2 <= len(follow_up.turns) <= 4
+        assert "ABC1D23" in follow_up.turns[0]
+
+
+def test_conversations_are_reproducible_with_a_seed():
+    fleet = load_fleet()
+    first = [follow_up_conversation(random.Random(3), fleet) for _ in range(2)]
+    assert first[0] == first[1]
+
+
+def test_chat_request_body_sends_the_session_state():
+    messages = [{"role": "user", "content": "¿Y en febrero?"}]
+    body = chat_request_body(messages, "timeseries", {"summary": "..."})
+    assert body["messages"] == messages
+    assert body["context"]["overrides"]["retrieval_mode"] == "timeseries"
+    assert body["sessionState"] == {"summary": "..."}
@@ -0,0 +1,24 @@
+from loadtests.shapes import SpikeShapeSettings, StepShapeSettings, spike_stage, step_stage
+
+
+def test_step_stage_adds_users_until_max_and_holds():
+    settings = StepShapeSettings(step_users=10, step_seconds=60, max_users=25, spawn_rate=2, hold_seconds=30)
+    assert step_stage(0, settings) == (10, 2)
+    assert step_stage(59.9, settings) == (10, 2)
+    assert step_stage(60, settings) == (20, 2)
+    assert step_stage(120, settings) == (25, 2)
+    # El último escalón dura step_seconds más hold_seconds
+    assert step_stage(209, settings) == (25, 2)
+    assert step_stage(210, settings) is None
+
+
+def test_spike_stage_returns_to_base_load():
+    settings = SpikeShapeSettings(
+        base_users=5, spike_users=50, warmup_seconds=60, spike_seconds=30, recovery_seconds=90, spawn_rate=25
+    )
+    assert spike_stage(0, settings) == (5, 25)
+    assert spike_stage(60, settings) == (50, 25)
+    assert spike_stage(89, settings) == (50, 25)
+    assert spike_stage(90, settings) == (5, 25)
+    assert spike_stage(179, settings) == (5, 25)
+    assert spike_stage(180, settings) is None
@@ -0,0 +1,26 @@
+from loadtests.slo import SLOSettings, check_slos, merged_percentile
+
+
+def test_merged_percentile_combines_histograms():
+    assert merged_percentile([{100: 50}, {200: 45, 900: 5}], 0.95) == 200.0
+    assert merged_percentile([{100: 50}, {200: 40, 900: 10}], 0.95) == 900.0
+    assert merged_percentile([], 0.95) is None
+
+
+def test_check_slos_passes():
+    settings = SLOSettings(ttft_p95_ms=1000, stream_p95_ms=5000, error_rate=0.05)
+    assert check_slos(settings, [{400: 10}], [{3000: 10}], requests=10, failures=0) == []
+
+
+def test_check_slos_reports_every_violation():
+    settings = SLOSettings(ttft_p95_ms=1000, stream_p95_ms=5000, error_rate=0.05)
+    violations = check_slos(settings, [{1500: 10}], [], requests=10, failures=1)
+    assert violations == [
+        "Error rate 10.00% > 5.00%",
+        "TTFT p95 1500 ms > 1000 ms",
+        "Stream duration: no samples",
+    ]
+
+
+def test_check_slos_fails_without_requests():
+    assert check_slos(SLOSettings(), [], [], requests=0, failures=0) == ["No /chat/stream requests were made"]
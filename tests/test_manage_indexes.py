@@ -0,0 +1,69 @@
+import pytest
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Index, MetaData, Table, create_mock_engine
+
+from fastapi_app.manage_indexes import (
+    IndexBuildSettings,
+    apply_build_settings,
+    declared_indexes,
+    format_progress,
+    index_ddl,
+    rebuild_index,
+)
+from fastapi_app.postgres_models import Base
+
+
+def test_create_all_leaves_vector_indexes_to_the_manager():
+    statements = []
+    engine = create_mock_engine("postgresql+asyncpg://", lambda sql, *args, **kwargs: statements.append(str(sql)))
+    Base.metadata.create_all(engine, checkfirst=False)
+    assert any("CREATE TABLE abastecimento" in statement for statement in statements)
+    assert any("ix_abastecimento_embedding_dirty" in statement for statement in statements)
+    assert not any("hnsw" in statement for statement in statements)
+
+
+def test_index_ddl_builds_concurrently_with_declared_or_new_parameters():
+    index = declared_indexes()["hnsw_abastecimento_main"]
+    assert index_ddl(index) == (
+        "CREATE INDEX CONCURRENTLY hnsw_abastecimento_main ON abastecimento USING hnsw "
+        "(embedding_main vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    )
+    assert index_ddl(index, "hnsw_abastecimento_main_new", {"ef_construction": 128}).endswith(
+        "hnsw_abastecimento_main_new ON abastecimento USING hnsw "
+        "(embedding_main vector_cosine_ops) WITH (m = 16, ef_construction = 128)"
+    )
+
+
+def test_format_progress():
+    progress = {"phase": "building index: loading tuples", "tuples_done": 250, "tuples_total": 1000}
+    assert format_progress("hnsw_veiculos_main", progress) == (
+        "Building hnsw_veiculos_main: building index: loading tuples, 250/1000 tuples (25%)"
+    )
+    waiting = {"phase": "waiting for writers before build", "tuples_total": 0, "blocks_total": 0}
+    assert (
+        format_progress("hnsw_veiculos_main", waiting)
+        == "Building hnsw_veiculos_main: waiting for writers before build"
+    )
+
+
+@pytest.mark.asyncio
+async def test_rejects_bad_settings_and_unknown_indexes():
+    with pytest.raises(ValueError, match="maintenance_work_mem"):
+        await apply_build_settings(None, IndexBuildSettings(maintenance_work_mem="1GB'; DROP TABLE veiculos"))
+    with pytest.raises(ValueError, match="Unknown vector index"):
+        await rebuild_index(None, "hnsw_items", {"m": 24}, IndexBuildSettings())
+
+
+@pytest.mark.asyncio
+async def test_rejects_parameters_of_another_access_method_before_building():
+    index = declared_indexes()["hnsw_veiculos_main"]
+    with pytest.raises(ValueError, match="lists not valid for hnsw index hnsw_veiculos_main"):
+        index_ddl(index, parameters={"lists": 100})
+    # Sin motor: falla antes de tocar la base
+    with pytest.raises(ValueError, match="lists not valid for hnsw"):
+        await rebuild_index(None, "hnsw_veiculos_main", {"m": 24, "lists": 100}, IndexBuildSettings())
+    items = Table("items", MetaData(), Column("embedding", Vector(3)))
+    ivfflat = Index("ivfflat_items", items.c.embedding, postgresql_using="ivfflat")
+    with pytest.raises(ValueError, match="m, ef_construction not valid for ivfflat index"):
+        index_ddl(ivfflat, parameters={"m": 16, "ef_construction": 64})
+    assert index_ddl(ivfflat, parameters={"lists": 100}).endswith("USING ivfflat (embedding) WITH (lists = 100)")
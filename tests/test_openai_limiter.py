@@ -0,0 +1,181 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from fastapi_app.openai_limiter import (
+    AdaptiveConcurrencyLimit,
+    AdmissionControlTransport,
+    DeploymentLimiter,
+    DeploymentLimiters,
+    TokenBucket,
+    estimate_request_tokens,
+    request_deployment,
+)
+
+
+def make_client(transport):
+    return openai.AsyncOpenAI(
+        api_key="test", base_url="http://openai.test/v1", http_client=httpx.AsyncClient(transport=transport)
+    )
+
+
+def make_azure_client(transport, deployment):
+    return openai.AsyncAzureOpenAI(
+        api_key="test",
+        api_version="2024-10-21",
+        azure_endpoint="https://openai.test",
+        azure_deployment=deployment,
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+
+
+def embeddings_response(request):
+    return httpx.Response(
+        200,
+        json={
+            "object": "list",
+            "data": [{"object": "embedding", "index": 0, "embedding": [0.1, 0.2]}],
+            "model": "text-embedding-3-small",
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        },
+    )
+
+
+def test_token_bucket_reservations():
+    bucket = TokenBucket(per_minute=60, window_seconds=2)
+    assert bucket.capacity == 2
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(1, abs=0.05)
+    bucket.refund(1)
+    assert bucket.reserve(1) == pytest.approx(1, abs=0.05)
+
+
+def test_token_bucket_lower_priority_uses_only_its_share():
+    bucket = TokenBucket(per_minute=60, window_seconds=4)
+    assert bucket.wait_above(1, share=0.5) == 0
+    bucket.take(2)
+    # Quedan 2 de 4: la otra mitad está reservada a los presupuestos interactivos
+    assert bucket.wait_above(1, share=0.5) == pytest.approx(1, abs=0.05)
+    assert bucket.reserve(2) == 0
+
+
+def test_concurrency_limit_aimd():
+    limit = AdaptiveConcurrencyLimit(max_limit=8, cooldown=0)
+    limit.decrease()
+    assert limit.limit == 4
+    limit.on_success(0.1)
+    assert limit.limit == pytest.approx(4.25)
+    limit.latency_target = 0.05
+    limit.on_success(0.1)
+    assert limit.limit == pytest.approx(2.125)
+
+
+def test_estimate_request_tokens():
+    chat = httpx.Request("POST", "http://x", json={"messages": [{"content": "a" * 40}], "max_tokens": 100})
+    assert estimate_request_tokens(chat) == 111
+    embed = httpx.Request("POST", "http://x", json={"input": ["a" * 8, "b" * 8]})
+    assert estimate_request_tokens(embed) == 6
+
+
+def test_request_deployment():
+    azure = httpx.Request("POST", "https://x/openai/deployments/gpt-4o-hedge/chat/completions", json={"model": "a"})
+    assert request_deployment(azure) == "gpt-4o-hedge"
+    openai_com = httpx.Request("POST", "https://x/v1/embeddings", json={"model": "text-embedding-3-small"})
+    assert request_deployment(openai_com) == "text-embedding-3-small"
+    assert request_deployment(httpx.Request("GET", "https://x/v1/models")) == "default"
+
+
+@pytest.mark.asyncio
+async def test_admitted_request_reaches_upstream():
+    limiters = DeploymentLimiters()
+    transport = AdmissionControlTransport(httpx.MockTransport(embeddings_response), "embed", limiters)
+    client = make_client(transport)
+    response = await client.embeddings.create(model="text-embedding-3-small", input="hola")
+    assert response.data[0].embedding == [0.1, 0.2]
+    assert limiters.get("text-embedding-3-small").concurrency.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_request_over_quota_is_shed_without_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return embeddings_response(request)
+
+    limiters = DeploymentLimiters(
+        {"text-embedding-3-small": DeploymentLimiter(requests_bucket=TokenBucket(per_minute=6, window_seconds=10))}
+    )
+    transport = AdmissionControlTransport(httpx.MockTransport(handler), "embed", limiters, queue_timeout=1)
+    client = make_client(transport)
+    await client.embeddings.create(model="text-embedding-3-small", input="hola")
+    with pytest.raises(openai.RateLimitError, match="local admission control"):
+        await client.embeddings.create(model="text-embedding-3-small", input="hola")
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_429_halves_concurrency():
+    def handler(request):
+        return httpx.Response(429, headers={"x-should-retry": "false"}, json={"error": {"message": "slow down"}})
+
+    concurrency = AdaptiveConcurrencyLimit(max_limit=8)
+    limiters = DeploymentLimiters({"text-embedding-3-small": DeploymentLimiter(concurrency=concurrency)})
+    transport = AdmissionControlTransport(httpx.MockTransport(handler), "chat", limiters)
+    client = make_client(transport)
+    with pytest.raises(openai.RateLimitError):
+        await client.embeddings.create(model="text-embedding-3-small", input="hola")
+    await asyncio.sleep(0)
+    assert concurrency.limit == 4
+    assert concurrency.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_budgets_share_the_quota_of_each_deployment():
+    limiters = DeploymentLimiters(
+        {
+            "embed-main": DeploymentLimiter(requests_bucket=TokenBucket(per_minute=6, window_seconds=10)),
+            "embed-hedge": DeploymentLimiter(requests_bucket=TokenBucket(per_minute=6, window_seconds=10)),
+        }
+    )
+    upstream = httpx.MockTransport(embeddings_response)
+    interactive = AdmissionControlTransport(upstream, "embed", limiters, queue_timeout=1)
+    background = AdmissionControlTransport(upstream, "background_embed", limiters, share=1.0, queue_timeout=1)
+
+    await make_azure_client(interactive, "embed-main").embeddings.create(model="embed-main", input="hola")
+    # El cliente en segundo plano va al mismo deployment: la cuota ya está gastada
+    with pytest.raises(openai.RateLimitError, match="embed-main"):
+        await make_azure_client(background, "embed-main").embeddings.create(model="embed-main", input="hola")
+    # El hedge a otro deployment se descuenta de la cuota de ese deployment, no de la del principal
+    await make_azure_client(interactive, "embed-hedge").embeddings.create(model="embed-hedge", input="hola")
+
+
+@pytest.mark.asyncio
+async def test_background_budget_leaves_quota_for_interactive_calls():
+    limiters = DeploymentLimiters(
+        {"text-embedding-3-small": DeploymentLimiter(requests_bucket=TokenBucket(per_minute=60, window_seconds=4))}
+    )
+    upstream = httpx.MockTransport(embeddings_response)
+    background = make_client(
+        AdmissionControlTransport(upstream, "background_embed", limiters, share=0.5, queue_timeout=0.1)
+    )
+    interactive = make_client(AdmissionControlTransport(upstream, "embed", limiters, queue_timeout=0.1))
+
+    for _ in range(2):
+        await background.embeddings.create(model="text-embedding-3-small", input="hola")
+    with pytest.raises(openai.RateLimitError):
+        await background.embeddings.create(model="text-embedding-3-small", input="hola")
+    for _ in range(2):
+        await interactive.embeddings.create(model="text-embedding-3-small", input="hola")
+
+
+@pytest.mark.asyncio
+async def test_background_budget_uses_a_share_of_the_concurrency():
+    concurrency = AdaptiveConcurrencyLimit(max_limit=4)
+    assert await concurrency.acquire(0.1, share=0.5)
+    assert await concurrency.acquire(0.1, share=0.5)
+    assert not await concurrency.acquire(0.01, share=0.5)
+    assert await concurrency.acquire(0.1)
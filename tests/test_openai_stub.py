@@ -0,0 +1,57 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+from benchmarks.openai_stub import StubSettings, create_stub_app
+from fastapi_app.query_rewriter import build_search_function, extract_search_arguments
+
+
+def stub_client(settings: StubSettings, client_class=openai.AsyncOpenAI, **kwargs):
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(create_stub_app(settings)))
+    return client_class(api_key="stub", http_client=http_client, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_rewrite_gets_a_search_tool_call():
+    client = stub_client(StubSettings(chat_latency_ms=0), base_url="http://stub/v1")
+    completion = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": "¿Cuánto diesel cargó la placa EHP6V58 en marzo?"}],
+        tools=build_search_function(),
+        tool_choice="auto",
+    )
+    search_query, filters = extract_search_arguments("", completion)
+    assert search_query == "¿Cuánto diesel cargó la placa EHP6V58 en marzo?"
+    assert filters == [{"column": "placa", "operator": "=", "value": "EHP6V58"}]
+
+
+@pytest.mark.asyncio
+async def test_streams_tokens_at_the_configured_rate():
+    settings = StubSettings(chat_latency_ms=20, jitter=0, tokens_per_second=200, answer_tokens=10)
+    client = stub_client(settings, base_url="http://stub/v1")
+    started_at = time.perf_counter()
+    stream = await client.chat.completions.create(
+        model="gpt-4o-mini", messages=[{"role": "user", "content": "hola"}], stream=True
+    )
+    chunks = [chunk async for chunk in stream]
+    elapsed = time.perf_counter() - started_at
+    tokens = [chunk.choices[0].delta.content for chunk in chunks if chunk.choices[0].delta.content]
+    assert len(tokens) == 10
+    assert chunks[-1].choices[0].finish_reason == "stop"
+    # 20 ms hasta el primer token y 9 intervalos de 5 ms
+    assert elapsed >= 0.06
+
+
+@pytest.mark.asyncio
+async def test_embeddings_on_azure_routes_honor_dimensions():
+    client = stub_client(
+        StubSettings(embed_latency_ms=0),
+        openai.AsyncAzureOpenAI,
+        azure_endpoint="http://stub",
+        azure_deployment="text-embedding-3-large",
+        api_version="2024-10-21",
+    )
+    response = await client.embeddings.create(model="text-embedding-3-large", input=["a", "b"], dimensions=768)
+    assert [len(item.embedding) for item in response.data] == [768, 768]
@@ -6,6 +6,7 @@ from fastapi_app.postgres_engine import (
     create_postgres_engine,
     create_postgres_engine_from_args,
     create_postgres_engine_from_env,
+    uses_entra_auth,
 )
 from tests.conftest import POSTGRES_DATABASE, POSTGRES_HOST, POSTGRES_PASSWORD, POSTGRES_SSL, POSTGRES_USERNAME
 
@@ -61,3 +62,29 @@ async def test_create_postgres_engine_from_args(mock_azure_credential):
     assert engine.url.database == os.environ["POSTGRES_DATABASE"]
     assert engine.url.password == os.environ.get("POSTGRES_PASSWORD")
     assert engine.url.query["ssl"] == "prefer"
+
+
+def test_uses_entra_auth_only_without_password_or_when_requested(monkeypatch):
+    monkeypatch.delenv("POSTGRES_ENTRA_AUTH", raising=False)
+    assert uses_entra_auth("localhost", None) is False
+    assert uses_entra_auth("myserver.postgres.database.azure.com", None) is True
+    # Con contraseña se usa la contraseña, como en el despliegue con run_app_linux.py
+    assert uses_entra_auth("myserver.postgres.database.azure.com", "secret") is False
+    monkeypatch.setenv("POSTGRES_ENTRA_AUTH", "true")
+    assert uses_entra_auth("myserver.postgres.database.azure.com", "secret") is True
+    assert uses_entra_auth("localhost", "secret") is False
+
+
+@pytest.mark.asyncio
+async def test_azure_host_with_password_skips_the_token(monkeypatch):
+    monkeypatch.delenv("POSTGRES_ENTRA_AUTH", raising=False)
+    engine = await create_postgres_engine(
+        host="myserver.postgres.database.azure.com",
+        username="admin",
+        database="postgres",
+        password="secret",
+        sslmode="require",
+        azure_credential=None,
+    )
+    assert engine.url.password == "secret"
+    await engine.dispose()
@@ -0,0 +1,49 @@
+from unittest import mock
+
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.util import greenlet_spawn
+
+from fastapi_app.postgres_pool import InstrumentedAsyncPool, PoolSettings
+
+
+def test_pool_settings_from_env(monkeypatch):
+    monkeypatch.setenv("POSTGRES_POOL_SIZE", "4")
+    monkeypatch.setenv("POSTGRES_POOL_PRE_PING", "false")
+    monkeypatch.setenv("POSTGRES_JIT", "true")
+    settings = PoolSettings.from_env()
+    assert settings.pool_size == 4
+    assert settings.max_overflow == 10
+    assert settings.pool_pre_ping is False
+    server_settings = settings.connect_args()["server_settings"]
+    assert server_settings["jit"] == "on"
+    assert server_settings["tcp_keepalives_idle"] == "60"
+
+
+def test_pgbouncer_mode_disables_statement_caches():
+    connect_args = PoolSettings(pgbouncer=True).connect_args()
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["prepared_statement_cache_size"] == 0
+    assert connect_args["prepared_statement_name_func"]() != connect_args["prepared_statement_name_func"]()
+    assert connect_args["server_settings"] == {"application_name": "ragapp"}
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_counts_overflow_and_timeouts():
+    pool = InstrumentedAsyncPool(mock.MagicMock, pool_size=1, max_overflow=1, timeout=0.01, logging_name="replica-1")
+    assert pool.pool_name == "replica-1"
+    with (
+        mock.patch("fastapi_app.postgres_pool.db_pool_overflow") as overflow,
+        mock.patch("fastapi_app.postgres_pool.db_pool_timeouts") as timeouts,
+    ):
+        first = await greenlet_spawn(pool.connect)
+        overflow.add.assert_not_called()
+        second = await greenlet_spawn(pool.connect)
+        overflow.add.assert_called_once_with(1, {"pool": "replica-1"})
+        assert pool.checkedout() == 2
+        with pytest.raises(exc.TimeoutError):
+            await greenlet_spawn(pool.connect)
+        timeouts.add.assert_called_once()
+    await greenlet_spawn(first.close)
+    await greenlet_spawn(second.close)
+    assert pool.checkedout() == 0
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.postgres_replicas import Replica, ReplicaRouter
+
+
+class FakeConnection:
+    def __init__(self, lag):
+        self.lag = lag
+
+    async def __aenter__(self):
+        if isinstance(self.lag, Exception):
+            raise self.lag
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement):
+        return SimpleNamespace(scalar_one=lambda: self.lag)
+
+
+class FakeEngine:
+    def __init__(self, lag=0.0):
+        self.lag = lag
+        self.disposed = False
+
+    def connect(self):
+        return FakeConnection(self.lag)
+
+    async def dispose(self):
+        self.disposed = True
+
+
+def make_replica(name, lag=0.0, latency=None):
+    replica = Replica(name, FakeEngine(lag), sessionmaker=name)
+    replica.healthy = True
+    replica.lag = lag
+    replica.latency = latency
+    return replica
+
+
+def test_round_robin_alternates_between_replicas():
+    router = ReplicaRouter("primary", [make_replica("replica-a"), make_replica("replica-b")])
+    assert [router.read_sessionmaker() for _ in range(4)] == ["replica-a", "replica-b", "replica-a", "replica-b"]
+
+
+def test_least_latency_picks_fastest_replica():
+    replicas = [make_replica("replica-a", latency=0.02), make_replica("replica-b", latency=0.005)]
+    router = ReplicaRouter("primary", replicas, strategy="least_latency")
+    assert router.read_sessionmaker() == "replica-b"
+
+
+def test_stale_replicas_fall_back_to_primary():
+    router = ReplicaRouter("primary", [make_replica("replica-a", lag=30.0)], max_lag=10.0)
+    assert router.read_sessionmaker() == "primary"
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ReplicaRouter("primary", [], strategy="random")
+
+
+@pytest.mark.asyncio
+async def test_check_updates_lag_and_health():
+    replica = Replica("replica-a", FakeEngine(lag=2.5), sessionmaker="replica-a")
+    router = ReplicaRouter("primary", [replica])
+    assert router.read_sessionmaker() == "primary"
+
+    await router.check_all()
+    assert replica.healthy is True
+    assert replica.lag == 2.5
+    assert replica.latency is not None
+    assert router.read_sessionmaker() == "replica-a"
+
+    replica.engine.lag = ConnectionRefusedError("replica down")
+    await router.check_all()
+    assert replica.healthy is False
+    assert router.read_sessionmaker() == "primary"
+
+    await router.stop()
+    assert replica.engine.disposed is True
@@ -1,56 +1,210 @@
+from datetime import date
+from types import SimpleNamespace
+
 import pytest
 
-from fastapi_app.api_models import Filter, ItemPublic
+from fastapi_app.postgres_models import Abastecimento
+from fastapi_app.postgres_searcher import PostgresSearcher, series_bucket
 from tests.data import test_data
 
 
-def test_postgres_build_filter_clause_without_filters(postgres_searcher):
-    assert postgres_searcher.build_filter_clause(None) == ("", "")
-    assert postgres_searcher.build_filter_clause([]) == ("", "")
+class FakeEmbeddings:
+    def __init__(self):
+        self.inputs: list[str] = []
+
+    async def create(self, model, input, **kwargs):
+        self.inputs.append(input)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=test_data.embeddings)])
+
+
+class FakeSearchSession:
+    """Devuelve el ranking (ctid, score) y luego las filas, en otro orden que el ranking."""
+
+    def __init__(self, rows_by_ctid: dict[str, Abastecimento]):
+        self.rows_by_ctid = rows_by_ctid
+        self.calls: list[tuple[str, dict]] = []
+
+    async def execute(self, query, params=None):
+        self.calls.append((str(query), params or {}))
+        if len(self.calls) == 1:
+            ranking = [(ctid, 1.0 / (60 + rank)) for rank, ctid in enumerate(self.rows_by_ctid)]
+            return SimpleNamespace(fetchall=lambda: ranking)
+        return SimpleNamespace(all=lambda: [(row, ctid) for ctid, row in reversed(self.rows_by_ctid.items())])
+
+
+def make_searcher(session=None):
+    client = SimpleNamespace(embeddings=FakeEmbeddings())
+    return PostgresSearcher(session, client, None, "text-embedding-3-large", 1024, "embedding_main")
+
+
+def fueling(placa, day):
+    return Abastecimento(id_veiculo="103001", placa=placa, data=date(2025, 1, day), km_percorrido=100, diesel=50)
+
+
+@pytest.fixture
+def searcher():
+    # build_filter_clause no usa la sesión ni el cliente de embeddings
+    return make_searcher()
+
+
+def test_postgres_build_filter_clause_without_filters(searcher):
+    assert searcher.build_filter_clause(None) == ("", "", {})
+    assert searcher.build_filter_clause([]) == ("", "", {})
+
+
+def test_postgres_build_filter_clause_with_filters(searcher):
+    assert searcher.build_filter_clause([{"column": "placa", "operator": "=", "value": "EKE6K50"}]) == (
+        "WHERE placa = :filter_0",
+        "AND placa = :filter_0",
+        {"filter_0": "EKE6K50"},
+    )
+
+
+def test_postgres_build_filter_clause_with_filters_numeric(searcher):
+    assert searcher.build_filter_clause([{"column": "ano", "operator": "<", "value": 2018}]) == (
+        "WHERE id_veiculo IN (SELECT id_veiculo FROM veiculos WHERE ano < :filter_0)",
+        "AND id_veiculo IN (SELECT id_veiculo FROM veiculos WHERE ano < :filter_0)",
+        {"filter_0": 2018},
+    )
 
 
-def test_postgres_build_filter_clause_with_filters(postgres_searcher):
-    assert postgres_searcher.build_filter_clause(
+def test_build_filter_clause_moves_vehicle_columns_to_a_subquery(searcher):
+    where, and_clause, params = searcher.build_filter_clause(
         [
-            Filter(column="brand", comparison_operator="=", value="AirStrider"),
+            {"column": "placa", "operator": "=", "value": "EKE6K50"},
+            {"column": "garagem", "operator": "=", "value": "G1"},
+            {"column": "ano", "operator": ">=", "value": "2018"},
         ]
-    ) == (
-        "WHERE brand = 'AirStrider'",
-        "AND brand = 'AirStrider'",
     )
+    assert where == (
+        "WHERE placa = :filter_0 AND id_veiculo IN "
+        "(SELECT id_veiculo FROM veiculos WHERE garagem = :filter_1 AND ano >= :filter_2)"
+    )
+    assert and_clause == where.replace("WHERE", "AND", 1)
+    assert params == {"filter_0": "EKE6K50", "filter_1": "G1", "filter_2": 2018}
 
 
-def test_postgres_build_filter_clause_with_filters_numeric(postgres_searcher):
-    assert postgres_searcher.build_filter_clause(
+def test_build_filter_clause_binds_values_instead_of_interpolating(searcher):
+    where, _, params = searcher.build_filter_clause(
         [
-            Filter(column="price", comparison_operator="<", value=30),
+            {"column": "garagem", "operator": "=", "value": "Garagem d'Oeste"},
+            {"column": "data", "operator": "BETWEEN", "value": {"start_date": "2025-01-01", "end_date": "2025-01-31"}},
         ]
-    ) == (
-        "WHERE price < 30",
-        "AND price < 30",
     )
+    assert "Oeste" not in where
+    assert "data BETWEEN :filter_1 AND :filter_2" in where
+    assert params == {"filter_0": "Garagem d'Oeste", "filter_1": date(2025, 1, 1), "filter_2": date(2025, 1, 31)}
+
+
+def test_build_filter_clause_skips_incomplete_date_filters(searcher):
+    assert searcher.build_filter_clause(
+        [{"column": "data", "operator": "BETWEEN", "value": {"start_date": "2025-01-01", "end_date": None}}]
+    ) == ("", "", {})
+
+
+@pytest.mark.parametrize(
+    "bad_filter",
+    [
+        {"column": "placa; DROP TABLE veiculos", "operator": "=", "value": "x"},
+        {"column": "ano", "operator": "= 1 OR 1 =", "value": 1},
+        {"column": "placa", "operator": "==", "value": "EKE6K50"},
+        {"column": "ano", "operator": "=", "value": "dos mil"},
+        {"column": "data", "operator": "BETWEEN", "value": {"start_date": "2025-02", "end_date": "2025-03"}},
+    ],
+)
+def test_build_filter_clause_drops_invalid_filters_with_a_warning(searcher, bad_filter, caplog):
+    # Los filtros vienen de la reescritura del LLM: uno inválido no hace fallar la búsqueda
+    where, _, params = searcher.build_filter_clause([bad_filter, {"column": "placa", "operator": "=", "value": "X1"}])
+    assert where == "WHERE placa = :filter_0"
+    assert params == {"filter_0": "X1"}
+    assert "Ignoring" in caplog.text
+
+
+@pytest.mark.parametrize(
+    "span_days, bucket", [(0, "day"), (180, "day"), (181, "week"), (3 * 365, "week"), (3 * 365 + 1, "month")]
+)
+def test_series_bucket_grows_with_the_span(span_days, bucket):
+    assert series_bucket(span_days) == bucket
+
+
+class FakeStreamResult:
+    async def partitions(self, size):
+        return
+        yield
+
+
+class FakeSession:
+    def __init__(self, span=None):
+        self.span = span
+        self.queries = []
+
+    async def execute(self, query, params):
+        self.queries.append(str(query))
+        return SimpleNamespace(one=lambda: self.span)
+
+    async def stream(self, query, params):
+        self.queries.append(str(query))
+        return FakeStreamResult()
+
+
+@pytest.mark.asyncio
+async def test_fetch_series_picks_the_bucket_from_the_date_filter():
+    session = FakeSession()
+    searcher = make_searcher(session)
+    series = await searcher.fetch_series(
+        [{"column": "data", "operator": "BETWEEN", "value": {"start_date": "2024-01-01", "end_date": "2024-12-31"}}]
+    )
+    assert series.bucket == "week"
+    assert "date_trunc('week', data)" in session.queries[-1]
+    # El rango sale del filtro: no hace falta consultar MIN/MAX
+    assert len(session.queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_series_picks_the_bucket_from_the_filtered_rows():
+    session = FakeSession(span=(date(2020, 1, 1), date(2025, 1, 1)))
+    searcher = make_searcher(session)
+    series = await searcher.fetch_series([{"column": "placa", "operator": "=", "value": "EKE6K50"}])
+    assert series.bucket == "month"
+    assert session.queries[0].startswith("SELECT MIN(data), MAX(data) FROM abastecimento WHERE placa = :filter_0")
 
 
 @pytest.mark.asyncio
-async def test_postgres_searcher_search_empty_text_search(postgres_searcher):
-    assert await postgres_searcher.search("", [], 5, None) == []
+async def test_postgres_searcher_search_empty_text_search(searcher):
+    with pytest.raises(ValueError, match="Both query text and query vector are empty"):
+        await searcher.search("", [], 5, None)
 
 
 @pytest.mark.asyncio
-async def test_postgres_searcher_search(postgres_searcher):
-    assert (await postgres_searcher.search(test_data.name, test_data.embeddings, 5, None))[0].to_dict() == ItemPublic(
-        **test_data.model_dump()
-    ).model_dump()
+async def test_postgres_searcher_search():
+    rows = {"(0,1)": fueling("EKE6K50", 3), "(0,2)": fueling("EKE6K50", 9), "(0,3)": fueling("EKE6K50", 20)}
+    session = FakeSearchSession(rows)
+    filters = [{"column": "placa", "operator": "=", "value": "EKE6K50"}]
+    results = await make_searcher(session).search("EKE6K50", test_data.embeddings, 2, filters)
+    # Las filas vuelven en el orden del ranking, solo las `top` primeras
+    assert results == [rows["(0,1)"], rows["(0,2)"]]
+    hybrid_query, params = session.calls[0]
+    assert "FULL OUTER JOIN fulltext_search" in hybrid_query
+    assert "WHERE placa = :filter_0" in hybrid_query
+    assert params["filter_0"] == "EKE6K50"
+    assert params["candidate_limit"] == 20
 
 
 @pytest.mark.asyncio
-async def test_postgres_searcher_search_and_embed_empty_text_search(postgres_searcher):
-    assert await postgres_searcher.search_and_embed("", 5, False, True) == []
+async def test_postgres_searcher_search_and_embed_empty_text_search(searcher):
+    with pytest.raises(ValueError, match="Both query text and query vector are empty"):
+        await searcher.search_and_embed("", 5, False, True)
 
 
 @pytest.mark.asyncio
-async def test_postgres_searcher_search_and_embed(postgres_searcher):
-    assert await postgres_searcher.search_and_embed("", 5, False, True) == []
-    assert (await postgres_searcher.search_and_embed(test_data.name, 5, True))[0].to_dict() == ItemPublic(
-        **test_data.model_dump()
-    ).model_dump()
+async def test_postgres_searcher_search_and_embed():
+    rows = {"(0,1)": fueling("EKE6K50", 3)}
+    session = FakeSearchSession(rows)
+    searcher = make_searcher(session)
+    assert await searcher.search_and_embed("diesel EKE6K50", 5, True) == [rows["(0,1)"]]
+    assert searcher.openai_embed_client.embeddings.inputs == ["diesel EKE6K50"]
+    assert searcher.embed_duration_ms is not None
+    # Sin búsqueda de texto solo corre la consulta vectorial
+    vector_query, params = session.calls[0]
+    assert "plainto_tsquery" not in vector_query
+    assert list(params["embedding"]) == test_data.embeddings
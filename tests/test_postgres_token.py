@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from azure.core.credentials import AccessToken
+
+from fastapi_app.postgres_token import CachedTokenProvider
+
+
+class CountingCredential:
+    def __init__(self, lifetime: float = 3600):
+        self.lifetime = lifetime
+        self.calls = 0
+        self.threads: list[int] = []
+
+    def get_token(self, *scopes: str) -> AccessToken:
+        self.calls += 1
+        self.threads.append(threading.get_ident())
+        return AccessToken(f"token-{self.calls}", int(time.time() + self.lifetime))
+
+
+@pytest.mark.asyncio
+async def test_token_is_served_from_cache():
+    credential = CountingCredential()
+    provider = CachedTokenProvider(credential)
+    await provider.start()
+    try:
+        assert [provider.token for _ in range(100)] == ["token-1"] * 100
+        assert credential.calls == 1
+        # El token se pidió fuera del hilo del event loop
+        assert credential.threads == [credential.threads[0]]
+        assert credential.threads[0] != threading.get_ident()
+    finally:
+        provider.stop()
+
+
+@pytest.mark.asyncio
+async def test_token_is_refreshed_ahead_of_expiry():
+    # Con un margen mayor que la vida del token, cada renovación dispara la siguiente enseguida
+    credential = CountingCredential(lifetime=60)
+    provider = CachedTokenProvider(credential, refresh_margin=120)
+    await provider.start()
+    try:
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if credential.calls >= 3:
+                break
+    finally:
+        provider.stop()
+    assert credential.calls >= 3
+    # Una renovación cancelada a mitad de camino ya contó la llamada pero no guardó su token
+    assert provider.access_token.token in (f"token-{credential.calls - 1}", f"token-{credential.calls}")
+
+
+def test_expired_token_is_fetched_synchronously():
+    credential = CountingCredential(lifetime=-10)
+    provider = CachedTokenProvider(credential)
+    assert provider.token == "token-1"
+    assert provider.token == "token-2"
@@ -0,0 +1,75 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from fastapi_app.postgres_models import Abastecimento, Veiculo
+from fastapi_app.setup_postgres_seeddata import SeedFileWriter, read_seed_chunks, seed_columns
+
+
+def fueling_row(km_percorrido, embedding_main):
+    return (
+        "103010",
+        "ABC1234",
+        km_percorrido,
+        Decimal("120.5"),
+        Decimal("2.95"),
+        date(2025, 5, 1),
+        Decimal("723.30"),
+        Decimal("6.00"),
+        None,
+        None,
+        None,
+        None,
+        embedding_main,
+        None,
+    )
+
+
+def test_seed_columns_keep_vectors_out_of_jsonl():
+    row_columns, vector_columns = seed_columns(Abastecimento.__table__)
+    assert [column.name for column in vector_columns] == ["embedding_main", "embedding_alt"]
+    assert not {"embedding_dirty_at", "embedding_claimed_until", "embedding_attempts"} & {
+        column.name for column in row_columns
+    }
+    assert len(fueling_row(0, None)) == len(row_columns) + len(vector_columns)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+def test_seed_files_roundtrip_in_chunks(tmp_path, dtype):
+    table = Abastecimento.__table__
+    vector = np.linspace(-1, 1, 1024)
+    writer = SeedFileWriter(tmp_path, table, row_count=5, dtype=dtype)
+    writer.write([fueling_row(km, vector if km % 2 == 0 else None) for km in range(5)])
+    writer.close()
+
+    assert json.loads((tmp_path / "abastecimento.jsonl").read_text().splitlines()[0])["diesel"] == "120.5"
+    assert np.load(tmp_path / "abastecimento.embedding_main.npy", mmap_mode="r").dtype == np.dtype(dtype)
+
+    chunks = list(read_seed_chunks(tmp_path, table, chunk_size=2))
+    assert [len(rows) for _, rows in chunks] == [2, 2, 1]
+    names, rows = chunks[0]
+    assert names[-2:] == ["embedding_main", "embedding_alt"]
+    first = dict(zip(names, rows[0]))
+    assert first["data"] == date(2025, 5, 1)
+    assert first["custo_combustivel"] == Decimal("723.30")
+    assert first["embedding_main"].dtype == np.float32
+    np.testing.assert_allclose(first["embedding_main"], vector, atol=1e-3)
+    # Las filas NaN vuelven como NULL
+    assert dict(zip(names, rows[1]))["embedding_main"] is None
+    assert first["embedding_alt"] is None
+
+
+def test_rejects_vectors_that_do_not_match_the_rows(tmp_path):
+    table = Veiculo.__table__
+    writer = SeedFileWriter(tmp_path, table, row_count=1)
+    writer.write([("103010", "G1", "ABC1234", 2020, "URBANO", "Volvo", "B270F", None, None, None, None, None, None)])
+    writer.close()
+    np.save(tmp_path / "veiculos.embedding_alt.npy", np.zeros((2, 768), dtype=np.float16))
+    with pytest.raises(ValueError, match="has 2 rows but veiculos.jsonl has 1"):
+        list(read_seed_chunks(tmp_path, table))
+    np.save(tmp_path / "veiculos.embedding_alt.npy", np.zeros((1, 1024), dtype=np.float16))
+    with pytest.raises(ValueError, match="expected \\(rows, 768\\)"):
+        list(read_seed_chunks(tmp_path, table))
@@ -0,0 +1,51 @@
+import json
+
+import httpx
+import pytest
+
+from benchmarks.stage_latency import RequestTiming, record_event, run_level
+
+
+def stream_lines():
+    thoughts = [
+        {"title": "Search query generated", "description": "diesel", "props": {"duration_ms": 410.5}},
+        {"title": "Filters applied", "description": [], "props": {}},
+        {"title": "Search results", "description": [], "props": {"duration_ms": 95.0, "embed_ms": 61.5}},
+    ]
+    events = [
+        {"delta": {"content": "", "role": "assistant"}, "context": {"data_points": {}, "thoughts": thoughts[:2]}},
+        {"delta": {"content": "", "role": "assistant"}, "context": {"data_points": {}, "thoughts": thoughts}},
+        {"delta": {"content": "Según ", "role": "assistant"}, "context": None},
+        {"delta": {"content": "los registros", "role": "assistant"}, "context": None},
+    ]
+    return [json.dumps(event) for event in events]
+
+
+def test_record_event_splits_stages():
+    timing = RequestTiming()
+    for elapsed_ms, line in zip([400, 520, 900, 950], stream_lines()):
+        record_event(timing, json.loads(line), elapsed_ms)
+    assert (timing.rewrite, timing.embed, timing.search) == (410.5, 61.5, 33.5)
+    assert (timing.first_token, timing.last_token, timing.tokens) == (900, 950, 2)
+    record_event(timing, {"error": "Connection refused"}, 1000)
+    assert timing.error == "Connection refused"
+
+
+@pytest.mark.asyncio
+async def test_run_level_counts_errors_apart():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content)["messages"][0]["content"])
+        if len(calls) % 3 == 0:
+            return httpx.Response(503)
+        return httpx.Response(200, text="\n".join(stream_lines()) + "\n")
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        bodies = [{"messages": [{"content": f"q{index}", "role": "user"}]} for index in range(2)]
+        level = await run_level(client, "http://app", bodies, concurrency=3, requests=6)
+    assert sorted(calls) == ["q0", "q0", "q0", "q1", "q1", "q1"]
+    assert level["requests"] == 6
+    assert level["errors"] == {"HTTP 503": 2}
+    assert level["stages"]["rewrite"]["count"] == 4
+    assert level["stages"]["embed"]["p50"] == 61.5
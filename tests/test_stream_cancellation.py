@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.api_models import AIChatRoles, ChatRequestOverrides, Message, RetrievalResponseDelta
+from fastapi_app.rag_simple import SimpleRAGChat
+from fastapi_app.routes.api_routes import format_as_ndjson
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after):
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.checks > self.disconnect_after
+
+
+class FakeOpenAIStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.consumed = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed >= len(self.chunks):
+            raise StopAsyncIteration
+        self.consumed += 1
+        delta = SimpleNamespace(content=self.chunks[self.consumed - 1])
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_format_as_ndjson_stops_on_disconnect():
+    state = {"produced": 0, "closed": False}
+
+    async def events():
+        try:
+            for i in range(10):
+                state["produced"] += 1
+                yield RetrievalResponseDelta(delta=Message(content=str(i), role=AIChatRoles.ASSISTANT))
+        finally:
+            state["closed"] = True
+
+    lines = [line async for line in format_as_ndjson(events(), FakeRequest(disconnect_after=2))]
+    assert len(lines) == 2
+    assert state["produced"] == 3
+    assert state["closed"] is True
+
+
+@pytest.mark.asyncio
+async def test_answer_stream_closes_openai_stream_when_abandoned():
+    stream = FakeOpenAIStream(["Hola", " mundo", "!"])
+
+    async def create(**kwargs):
+        return stream
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    rag_flow = SimpleRAGChat(
+        messages=[Message(role=AIChatRoles.USER, content="¿Cuánto diesel?")],
+        overrides=ChatRequestOverrides(),
+        searcher=None,
+        openai_chat_client=client,
+        chat_model="gpt-4o-mini",
+        chat_deployment=None,
+    )
+
+    answer = rag_flow.answer_stream([], [])
+    await answer.__anext__()  # context event
+    first = await answer.__anext__()
+    assert first.delta.content == "Hola"
+    await answer.aclose()
+    assert stream.closed is True
+    assert stream.consumed == 1
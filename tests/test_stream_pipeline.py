@@ -0,0 +1,160 @@
+import asyncio
+import json
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from fastapi_app.api_models import AbastecimentoPublic, AIChatRoles, ChatRequestOverrides, Message
+from fastapi_app.rag_advanced import AdvancedRAGChat
+from fastapi_app.rag_base import RAGChatBase
+from fastapi_app.routes.api_routes import format_as_ndjson, stream_pipeline
+from tests.test_stream_cancellation import FakeOpenAIStream
+
+ROWS = [
+    AbastecimentoPublic(id_veiculo="103001", placa="EKE6K50", data=date(2025, 1, 3), custo_combustivel=812.5),
+    AbastecimentoPublic(id_veiculo="103001", placa="EKE6K50", data=date(2025, 1, 9), custo_combustivel=640.0),
+]
+
+
+def rewrite_completion():
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-rewrite",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls",
+                    "message": {
+                        "role": "assistant",
+                        "tool_calls": [
+                            {
+                                "id": "call_1",
+                                "type": "function",
+                                "function": {
+                                    "name": "search_database",
+                                    "arguments": json.dumps(
+                                        {"search_query": "diesel EKE6K50", "placa_filter": "EKE6K50"}
+                                    ),
+                                },
+                            }
+                        ],
+                    },
+                }
+            ],
+        }
+    )
+
+
+class FakeChatClient:
+    def __init__(self, answer_chunks):
+        self.answer_stream = FakeOpenAIStream(answer_chunks)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        if kwargs.get("stream"):
+            return self.answer_stream
+        return rewrite_completion()
+
+
+class FakeSearcher:
+    """Bloquea la búsqueda hasta `release`, para ver qué llega al cliente antes de que termine."""
+
+    def __init__(self, error=None):
+        self.release = asyncio.Event()
+        self.finished = False
+        self.error = error
+        self.embed_duration_ms = 12.5
+        self.filters = None
+
+    async def search_and_embed(self, query_text, top, enable_vector_search, enable_text_search, filters):
+        await self.release.wait()
+        self.filters = filters
+        if self.error is not None:
+            raise self.error
+        self.finished = True
+        return ROWS
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def build_flow(searcher, chat_client):
+    def build(session):
+        return AdvancedRAGChat(
+            messages=[Message(role=AIChatRoles.USER, content="¿Cuánto diesel cargó la placa EKE6K50 en enero?")],
+            overrides=ChatRequestOverrides(),
+            searcher=searcher,
+            openai_chat_client=chat_client,
+            chat_model="gpt-4o-mini",
+        )
+
+    return build
+
+
+@pytest.mark.asyncio
+async def test_stream_pipeline_emits_progress_before_retrieval_finishes():
+    searcher, session = FakeSearcher(), FakeSession()
+    chat_client = FakeChatClient(["Cargó ", "812,5 L."])
+    events = stream_pipeline(lambda: session, build_flow(searcher, chat_client))
+
+    # La reescritura llega mientras la búsqueda todavía está en curso
+    first = await events.__anext__()
+    assert [thought.title for thought in first.context.thoughts] == ["Search query generated"]
+    assert first.context.thoughts[0].props["duration_ms"] >= 0
+    assert searcher.finished is False
+
+    second = await events.__anext__()
+    assert second.context.thoughts[-1].description == [{"column": "placa", "operator": "=", "value": "EKE6K50"}]
+    assert searcher.finished is False
+
+    searcher.release.set()
+    rest = [event async for event in events]
+    thought_titles = [[thought.title for thought in event.context.thoughts] for event in rest if event.context]
+    assert thought_titles == [
+        ["Search query generated", "Filters applied", "Search results"],
+        ["Search query generated", "Filters applied", "Search results", "Numeric summary"],
+        # El evento de contexto de la respuesta repite todos los pasos
+        ["Search query generated", "Filters applied", "Search results", "Numeric summary"],
+    ]
+    assert rest[0].context.thoughts[-1].props["embed_ms"] == 12.5
+    assert list(rest[0].context.data_points) == ["EKE6K50-2025-01-03", "EKE6K50-2025-01-09"]
+    assert [event.delta.content for event in rest if event.delta.content] == ["Cargó ", "812,5 L."]
+    assert searcher.filters == [{"column": "placa", "operator": "=", "value": "EKE6K50"}]
+    assert session.closed is True
+
+
+@pytest.mark.asyncio
+async def test_stream_pipeline_error_becomes_ndjson_error_line():
+    searcher, session = FakeSearcher(error=RuntimeError("connection reset")), FakeSession()
+    chat_client = FakeChatClient(["nunca"])
+    searcher.release.set()
+
+    lines = [
+        json.loads(line)
+        async for line in format_as_ndjson(stream_pipeline(lambda: session, build_flow(searcher, chat_client)))
+    ]
+    assert [thought["title"] for thought in lines[0]["context"]["thoughts"]] == ["Search query generated"]
+    assert lines[-1] == {"error": "connection reset"}
+    assert all("error" not in line for line in lines[:-1])
+    # La respuesta nunca se pidió y la sesión se cerró igual
+    assert chat_client.answer_stream.consumed == 0
+    assert session.closed is True
+
+
+def test_flows_keep_their_own_results():
+    with pytest.raises(TypeError):
+        RAGChatBase()
+    first, second = build_flow(None, None)(None), build_flow(None, None)(None)
+    first.search_results.append(ROWS[0])
+    assert second.search_results == []
+    assert first.series is None and second.embed_duration_ms is None
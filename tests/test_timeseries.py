@@ -0,0 +1,41 @@
+from datetime import date
+
+import numpy as np
+
+from fastapi_app.timeseries import DownsampledSeries, SeriesPoint, lttb_indices
+
+
+def test_lttb_indices_keeps_short_series():
+    x = np.arange(10, dtype=float)
+    assert lttb_indices(x, x, 20).tolist() == list(range(10))
+
+
+def test_lttb_indices_fixed_size():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    indices = lttb_indices(x, y, 50)
+    assert len(indices) == 50
+    assert indices[0] == 0
+    assert indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_indices_preserves_spike():
+    x = np.arange(500, dtype=float)
+    y = np.zeros(500)
+    y[321] = 100.0
+    assert 321 in lttb_indices(x, y, 20)
+
+
+def test_downsampled_series_to_prompt():
+    series = DownsampledSeries(
+        bucket="day",
+        source_points=31,
+        points=[
+            SeriesPoint(fecha=date(2025, 5, 1), registros=2, diesel=2939.9, km_percorrido=7020, km_diesel=2.39),
+            SeriesPoint(fecha=date(2025, 5, 31), registros=1, diesel=1473, custo_combustivel=8749.62),
+        ],
+    )
+    prompt = series.to_prompt()
+    assert "2 de 31 puntos" in prompt
+    assert "2025-05-31 | 1 | 1473.00 | - | 8749.62 | -" in prompt
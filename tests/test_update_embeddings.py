@@ -0,0 +1,158 @@
+import asyncio
+import json
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.dependencies import FastAPIAppContext
+from fastapi_app.embeddings import text_hash
+from fastapi_app.postgres_models import Abastecimento, Veiculo
+from fastapi_app.update_embeddings import BackfillCheckpoint, EmbeddingBackfill, decode_key, encode_key
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.inputs: list[list[str]] = []
+
+    async def create(self, model, input, **kwargs):
+        self.inputs.append(input)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=index, embedding=[float(index)] * 1024) for index in range(len(input))]
+        )
+
+
+def make_context(dimensions=1024):
+    return FastAPIAppContext(
+        openai_chat_model="gpt-4o-mini",
+        openai_embed_model="text-embedding-3-large",
+        openai_embed_dimensions=dimensions,
+        openai_chat_deployment=None,
+        openai_embed_deployment=None,
+        embedding_column="embedding_main",
+    )
+
+
+def make_backfill(tmp_path, model=Abastecimento, column="embedding_main", dimensions=1024):
+    client = SimpleNamespace(embeddings=FakeEmbeddings())
+    checkpoint = BackfillCheckpoint(tmp_path / "checkpoint.json")
+    return EmbeddingBackfill(None, client, make_context(dimensions), model, column, checkpoint)
+
+
+def test_key_roundtrip():
+    key = ("103010", date(2025, 5, 1), 3451, Decimal("1478.50"))
+    encoded = encode_key(key)
+    assert json.loads(json.dumps(encoded)) == ["103010", "2025-05-01", 3451, "1478.50"]
+    assert decode_key(list(Abastecimento.__table__.primary_key.columns), encoded) == key
+
+
+def test_rejects_mismatched_columns(tmp_path):
+    with pytest.raises(ValueError, match="not an embedding column"):
+        make_backfill(tmp_path, column="placa")
+    with pytest.raises(ValueError, match="768 dimensions"):
+        make_backfill(tmp_path, model=Veiculo, column="embedding_alt")
+
+
+def fake_storage(backfill, cache=None):
+    """Reemplaza la caché y la escritura en Postgres por diccionarios en memoria."""
+    cache = {} if cache is None else cache
+    written = []
+
+    async def cached_vectors(hashes):
+        return {row_hash: cache[row_hash] for row_hash in hashes if row_hash in cache}
+
+    async def write(rows, vectors, new_hashes):
+        written.append([(key, len(vectors[row_hash])) for key, _, row_hash in rows])
+        cache.update((row_hash, vectors[row_hash]) for row_hash in new_hashes)
+
+    backfill.cached_vectors = cached_vectors
+    backfill.write = write
+    return written
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_advances_only_over_contiguous_batches(tmp_path):
+    backfill = make_backfill(tmp_path, model=Veiculo)
+    written = fake_storage(backfill)
+    # El lote 1 termina antes que el 0: el checkpoint no puede saltar por encima del 0
+    await backfill.process_batch(1, [(("b1",), "text b1", "h1"), (("b2",), "text b2", "h2")])
+    assert backfill.checkpoint.get("veiculos.embedding_main") is None
+    await backfill.process_batch(0, [(("a1",), "text a1", "h0")])
+    assert backfill.checkpoint.get("veiculos.embedding_main") == ["b2"]
+    assert backfill.report.rows_embedded == 3
+    assert backfill.report.requests == 2
+    assert written == [[(("b1",), 1024), (("b2",), 1024)], [(("a1",), 1024)]]
+
+    # Otra ejecución retoma desde el checkpoint guardado en disco
+    resumed = BackfillCheckpoint(tmp_path / "checkpoint.json")
+    assert resumed.get("veiculos.embedding_main") == ["b2"]
+    query = str(make_backfill(tmp_path, model=Veiculo).query())
+    assert "(veiculos.id_veiculo) > (:param_1)" in query
+    # Los vectores existentes no se leen
+    assert "veiculos.embedding_alt," not in query.split("FROM")[0]
+
+
+def test_only_changed_rows_need_embedding(tmp_path):
+    backfill = make_backfill(tmp_path, model=Veiculo)
+    row = Veiculo(id_veiculo="103010", tipo_onibus="URBANO", fabricante="Volvo", modelo_chassi="B270F", ano=2020)
+    row_hash = text_hash(row.to_str_for_embedding())
+    row.embedding_main_text_hash = row_hash
+    row.embedding_main_model = "text-embedding-3-large:1024"
+    assert backfill.needs_embedding(row, False, row_hash) is False
+    # Sin vector, con otro texto o con otro modelo
+    assert backfill.needs_embedding(row, True, row_hash) is True
+    row.ano = 2021
+    assert backfill.needs_embedding(row, False, text_hash(row.to_str_for_embedding())) is True
+    row.embedding_main_model = "text-embedding-3-small:1024"
+    assert backfill.needs_embedding(row, False, row_hash) is True
+
+
+@pytest.mark.asyncio
+async def test_identical_texts_are_embedded_once(tmp_path):
+    backfill = make_backfill(tmp_path, model=Veiculo)
+    written = fake_storage(backfill, cache={"cached": [9.0] * 1024})
+    inputs = backfill.openai_embed_client.embeddings.inputs
+    await backfill.process_batch(
+        0,
+        [
+            (("v1",), "urbano volvo", "h1"),
+            (("v2",), "urbano volvo", "h1"),
+            (("v3",), "articulado", "h2"),
+            (("v4",), "ya embebido", "cached"),
+        ],
+    )
+    assert inputs == [["urbano volvo", "articulado"]]
+    # Un lote posterior con los mismos textos sale entero de la caché
+    await backfill.process_batch(1, [(("v5",), "articulado", "h2"), (("v6",), "urbano volvo", "h1")])
+    assert len(inputs) == 1
+    assert [len(batch) for batch in written] == [4, 2]
+    assert backfill.report.texts_embedded == 2
+    assert backfill.report.cache_hits == 3
+    assert backfill.report.rows_embedded == 6
+    assert backfill.dedup_ratio == pytest.approx(1 - 2 / 6)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_batches_share_in_flight_texts(tmp_path):
+    backfill = make_backfill(tmp_path, model=Veiculo)
+    fake_storage(backfill)
+    embeddings = backfill.openai_embed_client.embeddings
+    release = asyncio.Event()
+    create = embeddings.create
+
+    async def slow_create(model, input, **kwargs):
+        await release.wait()
+        return await create(model, input, **kwargs)
+
+    embeddings.create = slow_create
+    first = asyncio.create_task(backfill.process_batch(0, [(("v1",), "urbano volvo", "h1")]))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(backfill.process_batch(1, [(("v2",), "urbano volvo", "h1")]))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, second)
+    # El segundo lote esperó el vector del primero en vez de pedirlo otra vez
+    assert embeddings.inputs == [["urbano volvo"]]
+    assert backfill.vector_futures == {}
+    assert backfill.checkpoint.get("veiculos.embedding_main") == ["v2"]
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi_app.dependencies import FastAPIAppContext
+from fastapi_app.warmup import Warmup, WarmupSettings
+
+
+class FakeEmbeddings:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def create(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("endpoint unreachable")
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.5] * 768)])
+
+
+def make_warmup(settings, embeddings):
+    context = FastAPIAppContext(
+        openai_chat_model="gpt-4o-mini",
+        openai_embed_model="nomic-embed-text",
+        openai_embed_dimensions=None,
+        openai_chat_deployment=None,
+        openai_embed_deployment=None,
+        embedding_column="embedding_main",
+    )
+    return Warmup(settings, None, None, SimpleNamespace(embeddings=embeddings), context)
+
+
+def only_embeddings():
+    return WarmupSettings(connections=0, queries=False, prewarm_indexes=False, tokenizer=False)
+
+
+def test_warmup_settings_from_env(monkeypatch):
+    monkeypatch.setenv("WARMUP_CONNECTIONS", "8")
+    monkeypatch.setenv("WARMUP_PREWARM_INDEXES", "false")
+    settings = WarmupSettings.from_env()
+    assert settings.connections == 8
+    assert settings.prewarm_indexes is False
+    assert settings.enabled is True
+
+
+@pytest.mark.asyncio
+async def test_warmup_reports_steps_and_becomes_ready():
+    warmup = make_warmup(only_embeddings(), FakeEmbeddings())
+    assert warmup.status.ready is False
+    status = await warmup.run()
+    assert status.ready is True
+    assert list(status.steps) == ["embeddings"]
+    assert status.errors == {}
+    assert len(warmup.query_vector) == 768
+
+
+@pytest.mark.asyncio
+async def test_failed_step_does_not_block_readiness():
+    warmup = make_warmup(only_embeddings(), FakeEmbeddings(fail=True))
+    status = await warmup.run()
+    assert status.ready is True
+    assert status.errors == {"embeddings": "endpoint unreachable"}
+
+
+@pytest.mark.asyncio
+async def test_disabled_warmup_is_ready_immediately():
+    warmup = make_warmup(WarmupSettings(enabled=False), FakeEmbeddings())
+    warmup.start()
+    assert warmup.task is None
+    assert warmup.status.ready is True